@@ -0,0 +1,62 @@
+"""
+Build time and size of the sparse co-listening matrix on synthetic histories with tens of
+thousands of artists, next to the dense matrix it avoids
+
+    python -m benchmarks.colisten --rows 1000000 10000000 --artists 50000
+"""
+
+import argparse
+import time
+
+import numpy as np
+from benchmarks.synthetic import SCHEMAS, synthetic_plays
+from spotify_core.colisten import CoListening, seed_artists
+
+
+def sessionized(plays, seed: int = 0):
+    """
+    Synthetic plays are spread evenly over the years, which at millions of rows is one endless
+    session. Re-time them back to back with a pause of up to a day before one play in ten
+    """
+    rng = np.random.default_rng(seed)
+    rows = len(plays)
+    pause = np.where(rng.random(rows) < 0.1, rng.integers(0, 86_400_000, rows), 0)
+    end_ms = np.cumsum(plays["msPlayed"].to_numpy(np.int64) + pause) + 1_420_070_400_000
+    return plays.assign(endTime=end_ms.astype("datetime64[ms]"))
+
+
+def timed(func, *args) -> tuple:
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--artists", type=int, default=50_000)
+    # endsong histories hold podcast episodes, plays without an artist
+    parser.add_argument("--schema", choices=list(SCHEMAS), default="endsong")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(
+        f"{'rows':>12} {'artists':>8} {'pairs':>11} {'build':>8} {'merge':>8} "
+        f"{'recommend':>10} {'csr MB':>8} {'dense MB':>9}"
+    )
+    for rows in args.rows:
+        plays = synthetic_plays(rows, args.schema, n_artists=args.artists, seed=args.seed)
+        plays = sessionized(plays, args.seed)
+        matrix, build = timed(CoListening.from_plays, plays)
+        _, merge = timed(CoListening.merge, [matrix, matrix])
+        _, recommend = timed(matrix.recommend, seed_artists(plays))
+        csr = sum(a.nbytes for a in (matrix.indptr, matrix.indices, matrix.counts))
+        dense = len(matrix.artists) ** 2 * 4
+        print(
+            f"{rows:>12,} {len(matrix.artists):>8,} {matrix.pairs:>11,} {build:>7.2f}s "
+            f"{merge:>7.2f}s {recommend:>9.3f}s {csr / 2**20:>8.1f} {dense / 2**20:>9,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Report bytes per row of the working frame before and after compaction
+
+    python -m benchmarks.compact_memory example_data_2/*.json
+"""
+
+import argparse
+import glob
+
+import pandas as pd
+
+from spotify_core.features import add_features
+from spotify_core.ingest import normalize_history, read_history
+from spotify_core.schema import compact_history, concat_history, memory_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("files", nargs="*")
+    args = parser.parse_args()
+    files = args.files or sorted(glob.glob("example_data_2/*.json"))
+
+    enriched = [add_features(normalize_history(read_history(f)), hour_offset=16) for f in files]
+    before = pd.concat(enriched).reset_index()
+    after = concat_history([compact_history(frame) for frame in enriched])
+    print(f"{len(after):,} plays from {len(files)} files")
+    print(memory_report(before, after))
+
+
+if __name__ == "__main__":
+    main()
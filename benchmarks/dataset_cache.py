@@ -0,0 +1,73 @@
+"""
+Load a synthetic export through the dataset cache with the hour offsets of both apps, checking
+every load against parsing the files from scratch, and time each way a load is served: parsing,
+the process's memory and, as a new server process would, the shared store
+
+    python -m benchmarks.dataset_cache --rows 1000000 --schema endsong
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import SCHEMAS, write_export
+from spotify_core.cache import (
+    DatasetCache,
+    HistoryCache,
+    SharedStore,
+    _digests,
+    load_histories,
+)
+from spotify_core.ingest import enrich_history, read_normalized
+
+# spotify_history.py shifts the timestamps by 16 hours, coachella_match.py keeps them
+HOUR_OFFSETS = [16, 0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--schema", choices=list(SCHEMAS), default="endsong")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_export(os.path.join(tmp, "export"), args.rows, args.schema, seed=args.seed)
+        expected = {
+            offset: [enrich_history(read_normalized(path), offset) for path in paths]
+            for offset in HOUR_OFFSETS
+        }
+
+        def cache():
+            # A new process has not hashed the files yet
+            _digests.clear()
+            return DatasetCache(
+                HistoryCache(os.path.join(tmp, "cache")),
+                shared=SharedStore(os.path.join(tmp, "shared")),
+            )
+
+        print(f"{args.rows:,} plays in {len(paths)} files")
+        print(f"{'offset':>7} {'parse':>8} {'memory':>8} {'shared':>8} {'resident':>9}")
+        # Both offsets in one process, then again in a fresh one, so a frame changed by the
+        # other offset's load would be served from memory, Parquet or the shared store
+        process = cache()
+        for offset in HOUR_OFFSETS:
+            elapsed = []
+            for datasets in [process, process, cache()]:
+                start = time.perf_counter()
+                frames = load_histories(paths, hour_offset=offset, workers=1, cache=datasets)
+                elapsed.append(time.perf_counter() - start)
+                for frame, want in zip(frames, expected[offset]):
+                    assert frame.equals(want), f"{offset}h"
+            # Only the compact frames stay in memory, the renamed ones are left on disk
+            stats = process.stats()
+            assert stats["entries"] == len(paths) * (HOUR_OFFSETS.index(offset) + 1), stats
+            print(
+                f"{offset:>6}h {elapsed[0]:>7.2f}s {elapsed[1]:>7.3f}s {elapsed[2]:>7.3f}s "
+                f"{stats['bytes_resident'] / 1e6:>6.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Time the vectorized feature block against the original per-row list comprehensions
+
+    python -m benchmarks.features --sizes 100000 1000000 10000000
+"""
+
+import argparse
+import calendar
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from spotify_core.features import add_features
+
+
+def legacy_features(all_data):
+    # The feature block as it was written in spotify_history.py
+    all_data["endTime"] = pd.Series([(i + timedelta(hours=16)) for i in all_data.endTime])
+    all_data["date"] = [i.date() for i in all_data["endTime"]]
+    all_data["dow"] = [i.weekday() for i in all_data["endTime"]]
+    all_data["day_of_week_str"] = all_data["dow"].apply(lambda x: calendar.day_name[x])
+    all_data["time"] = [i.hour for i in all_data["endTime"]]
+    all_data["week"] = all_data["endTime"].dt.isocalendar().week
+    all_data["year"] = all_data["endTime"].dt.isocalendar().year.astype(int)
+    all_data["minutesPlayed"] = all_data["msPlayed"] / 60000
+    return all_data
+
+
+def make_history(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2015-01-01").value // 10**9
+    end = pd.Timestamp("2023-12-31").value // 10**9
+    return pd.DataFrame(
+        {
+            "endTime": pd.to_datetime(np.sort(rng.integers(start, end, rows)), unit="s"),
+            "msPlayed": rng.integers(0, 300_000, rows),
+        }
+    )
+
+
+def timed(func, frame):
+    start = time.perf_counter()
+    func(frame)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>12} {'legacy':>10} {'vectorized':>11} {'speedup':>8}")
+    for rows in args.sizes:
+        frame = make_history(rows)
+        legacy = timed(legacy_features, frame.copy())
+        vectorized = timed(lambda f: add_features(f, hour_offset=16), frame.copy())
+        print(f"{rows:>12,} {legacy:>9.2f}s {vectorized:>10.3f}s {legacy / vectorized:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Compare peak memory and wall time of the reader against the legacy pd.read_json path, a streaming
+reader that keeps every field and the same projection read record by record, on StreamingHistory
+or the wider endsong layout
+
+    python -m benchmarks.ingest_memory --copies 10 --schema streaming endsong
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+
+from benchmarks.synthetic import generate_history, to_endsong
+from spotify_core.ingest import (
+    _open_binary,
+    _read_records,
+    iter_records,
+    read_history,
+    read_history_legacy,
+    sniff_schema,
+)
+from spotify_core.instrument import start_recording, stop_recording
+
+
+def build_file(path, copies, schema="streaming"):
+    # Replicate the bundled example history into one large file, or convert as many synthetic
+    # plays to the endsong layout
+    records = []
+    for f in sorted(glob.glob("example_data_2/StreamingHistory*.json")):
+        with open(f, encoding="utf-8") as fp:
+            records.extend(json.load(fp))
+    records = records * copies
+    if schema == "endsong":
+        # Written by pandas, which gives the podcast episodes' missing fields as null where
+        # json.dump would write NaN, which is not JSON
+        to_endsong(generate_history(len(records))).to_json(path, orient="records", indent=2)
+        return len(records)
+    with open(path, "w", encoding="utf-8") as fp:
+        json.dump(records, fp, indent=2)
+    return len(records)
+
+
+def read_all_fields(path, chunk_rows=20_000):
+    # The streaming reader before schema sniffing: every field of every record, dtypes inferred
+    fp, _ = _open_binary(path)
+    with fp:
+        chunks, rows = [], []
+        for record in iter_records(fp):
+            rows.append(record)
+            if len(rows) >= chunk_rows:
+                chunks.append(pd.DataFrame.from_records(rows))
+                rows = []
+        if rows:
+            chunks.append(pd.DataFrame.from_records(rows))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def read_records(path):
+    # The same projection read record by record with the json module, without the columnar parser
+    fp, _ = _open_binary(path)
+    with fp:
+        records = iter_records(fp)
+        first = next(records)
+        return _read_records(itertools.chain([first], records), sniff_schema(first))
+
+
+def read_columnar(path):
+    # read_history, refusing to time its record by record fallback in place of the parser
+    recorder = start_recording()
+    try:
+        frame = read_history(path)
+    finally:
+        stop_recording()
+    assert not any(s.name == "read_records_fallback" for s in recorder.spans), path
+    return frame
+
+
+def measure(reader, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    frame = reader(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # The columnar parser allocates from its own pool, outside what tracemalloc sees
+    peak += pa.default_memory_pool().max_memory()
+    return elapsed, peak, frame.memory_usage(deep=True).sum(), len(frame.columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--copies", type=int, default=10)
+    parser.add_argument(
+        "--schema", nargs="+", choices=["streaming", "endsong"], default=["streaming"]
+    )
+    args = parser.parse_args()
+
+    readers = [
+        ("legacy", read_history_legacy),
+        ("all", read_all_fields),
+        ("records", read_records),
+        ("stream", read_columnar),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        for schema in args.schema:
+            path = os.path.join(tmp, f"{schema}.json")
+            rows = build_file(path, args.copies, schema)
+            size = os.path.getsize(path)
+            print(f"{schema}: {rows:,} records, {size / 1e6:.1f} MB on disk")
+            for name, reader in readers:
+                # A fresh process per reader, so the parser pool's peak is the reader's own
+                with ProcessPoolExecutor(
+                    1, mp_context=multiprocessing.get_context("spawn")
+                ) as pool:
+                    elapsed, peak, result, columns = pool.submit(measure, reader, path).result()
+                print(
+                    f"{name:>7}: {elapsed:6.2f}s  peak {peak / 1e6:8.1f} MB  "
+                    f"result {result / 1e6:7.1f} MB  peak/result {peak / result:4.1f}x  "
+                    f"{columns:>2} columns"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Time the rolling leaderboards against a groupby and sort per window, on a synthetic history
+
+    python -m benchmarks.leaderboards --rows 1000000 10000000 --windows 1 12
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import SCHEMAS, synthetic_plays
+from spotify_core.aggregates import build_cube
+from spotify_core.leaderboards import LEADERBOARD_SIZE, artist_leaderboard, track_leaderboard
+from spotify_core.sessions import wall_clock
+
+
+def legacy_leaderboard(plays: pd.DataFrame, keys: list, window: int, k: int = LEADERBOARD_SIZE):
+    # One groupby and sort over the plays of every window, as the lifetime tables are built
+    month = wall_clock(plays["endTime"]).astype("datetime64[M]")
+    boards = []
+    for end in np.unique(month):
+        plays_in = plays[(month > end - window) & (month <= end)]
+        top = plays_in.groupby(keys, observed=True)["msPlayed"].sum().nlargest(k)
+        boards.append(top.reset_index().assign(month=end))
+    return pd.concat(boards, ignore_index=True)
+
+
+def timed(func, *args) -> tuple:
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--windows", type=int, nargs="+", default=[1, 12])
+    parser.add_argument("--seed", type=int, default=0)
+    # endsong histories hold podcast episodes, plays without an artist or track
+    parser.add_argument("--schema", choices=list(SCHEMAS), default="endsong")
+    args = parser.parse_args()
+
+    print(f"{'rows':>12} {'board':>7} {'window':>6} {'legacy':>9} {'rolling':>9} {'speedup':>8}")
+    for rows in args.rows:
+        plays = synthetic_plays(rows, args.schema, seed=args.seed)
+        cube = build_cube(plays)
+        for window in args.windows:
+            for board, func, keys in [
+                ("artists", artist_leaderboard, ["artistName"]),
+                ("tracks", track_leaderboard, ["artistName", "trackName"]),
+            ]:
+                result, rolling = timed(func, cube, LEADERBOARD_SIZE, window)
+                expected, legacy = timed(legacy_leaderboard, plays, keys, window)
+                assert np.allclose(result["minutes"], expected["msPlayed"] / 60000)
+                print(
+                    f"{rows:>12,} {board:>7} {window:>6} {legacy:>8.2f}s {rolling:>8.3f}s "
+                    f"{legacy / rolling:>7.0f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Match rate and latency of the lineup index against the original lowercase-and-merge join, on a
+synthetic history whose festival artists are spelled the ways exports and lineups disagree
+
+    python -m benchmarks.lineup_match --rows 1000000 5000000 --festival Coachella
+"""
+
+import argparse
+import json
+import sys
+import time
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_history
+from spotify_core.festival import FESTIVALS, LineupRegistry, lineup_index
+from spotify_core.schema import compact_history, map_categories
+from spotify_core.summary import artist_totals, filter_min_minutes
+
+
+def unaccented(name: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", name) if not unicodedata.combining(c))
+
+
+# How a lineup name can be spelled in a history
+VARIANTS = {
+    "same": lambda name: name,
+    "upper": str.upper,
+    "unaccented": unaccented,
+    "and": lambda name: name.replace("&", "and").replace("+", "and"),
+    "the": lambda name: name[4:] if name.lower().startswith("the ") else "The " + name,
+    "feat": lambda name: name + " feat. Guest Artist",
+    "spacing": lambda name: name.replace(" ", "") if " " in name else name.replace(".", " "),
+    "typo": lambda name: name[:4] + name[3] + name[4:] if len(name) >= 8 else name,
+}
+
+
+def legacy_match(all_data: pd.DataFrame, lineup: pd.DataFrame, min_minutes: float = 1):
+    """
+    The join as coachella_match.py first wrote it: every play lowercased and merged on the
+    lineup name, here given a lowercased lineup so case alone never misses
+    """
+    lineup = lineup.assign(Artist=lineup["Artist"].str.lower().str.strip())
+    all_data = all_data.copy()
+    all_data["artistName"] = map_categories(
+        all_data["artistName"], lambda names: names.str.lower().str.strip()
+    )
+    all_data = all_data.merge(lineup, left_on="artistName", right_on="Artist", how="inner")
+    all_data = filter_min_minutes(all_data, min_minutes)
+    artist_minutes = artist_totals(all_data).rename("Total Minutes").reset_index()
+    return all_data.merge(artist_minutes, on="artistName", how="left")
+
+
+def spelled_history(rows: int, lineup: pd.DataFrame, seed: int) -> tuple:
+    """
+    A compact synthetic history with each lineup artist renamed to a random variant. Returns
+    the history, the lineup row every variant name stands for and the variant it was given
+    """
+    rng = np.random.default_rng(seed)
+    history = generate_history(rows, seed=seed)
+    # The synthetic names mix in every bundled lineup, which share acts in different cases
+    rows_of = {name.casefold(): row for row, name in enumerate(lineup["Artist"])}
+    names = pd.Series(history["artistName"].unique())
+    on_lineup = names[names.str.casefold().isin(list(rows_of))]
+    kinds = rng.choice(list(VARIANTS), len(on_lineup))
+    renames = {name: VARIANTS[kind](name) for name, kind in zip(on_lineup, kinds)}
+    history["artistName"] = history["artistName"].replace(renames)
+    truth = {renames[name]: rows_of[name.casefold()] for name in on_lineup}
+    return compact_history(history), truth, dict(zip(on_lineup.map(renames), kinds))
+
+
+def timed(func, *args, repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run(rows: int, festival: str, seed: int = 0) -> dict:
+    index = lineup_index(FESTIVALS[festival])
+    registry = LineupRegistry.build({festival: index.lineup})
+    history, truth, kinds = spelled_history(rows, index.lineup, seed)
+    names = history["artistName"].cat.categories
+
+    matched = index.match(names)
+    found = matched[matched["row"] >= 0]
+    correct = found["row"].to_numpy() == found["name"].map(truth).to_numpy()
+    lowered = index.lineup["Artist"].str.lower().str.strip()
+    legacy = names.str.lower().str.strip().isin(lowered)
+
+    variants = pd.DataFrame({"kind": list(kinds.values()), "name": list(kinds)})
+    variants["found"] = variants["name"].isin(found["name"][correct])
+    variants["legacy"] = variants["name"].str.lower().str.strip().isin(lowered)
+    variants["names"] = 1
+    report = {
+        "rows": rows,
+        "festival": festival,
+        "artists": len(names),
+        "lineup_artists": len(truth),
+        "index": {
+            "seconds": round(timed(lambda h: registry.match(h).festival(festival), history), 4),
+            "matched": int(correct.sum()),
+            "wrong": int((~correct).sum()),
+            "by_how": found["how"].value_counts().to_dict(),
+        },
+        "legacy": {
+            "seconds": round(timed(legacy_match, history, index.lineup), 4),
+            "matched": int(legacy.sum()),
+            "wrong": 0,
+        },
+        "variants": variants.groupby("kind")[["names", "found", "legacy"]].sum().to_dict("index"),
+    }
+    for method in ("index", "legacy"):
+        stats = report[method]
+        print(
+            f"{festival:>14} {rows:>10,} {method:>7} {stats['seconds']:>8.3f}s "
+            f"{stats['matched']:>4}/{len(truth)} spellings matched {stats['wrong']:>3} wrong",
+            file=sys.stderr,
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--festival", nargs="+", choices=list(FESTIVALS), default=list(FESTIVALS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    report = [run(rows, festival, args.seed) for festival in args.festival for rows in args.rows]
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
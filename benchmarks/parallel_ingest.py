@@ -0,0 +1,56 @@
+"""
+Time serial against parallel parsing of a realistic extended-history export, built by
+replicating the bundled example_data_2 files into `--files` files of about `--mb` MB each
+
+    python -m benchmarks.parallel_ingest --files 20 --mb 12 --workers 1 2 4 8
+"""
+
+import argparse
+import glob
+import json
+import os
+import tempfile
+import time
+
+from spotify_core.ingest import parse_files
+
+
+def build_export(directory, files, megabytes):
+    records = []
+    for f in sorted(glob.glob("example_data_2/StreamingHistory*.json")):
+        with open(f, encoding="utf-8") as fp:
+            records.extend(json.load(fp))
+    record_bytes = len(json.dumps(records, indent=2)) / len(records)
+    copies = max(1, int(megabytes * 1e6 / record_bytes / len(records)))
+    paths = []
+    for i in range(files):
+        path = os.path.join(directory, f"StreamingHistory{i}.json")
+        with open(path, "w", encoding="utf-8") as fp:
+            json.dump(records * copies, fp, indent=2)
+        paths.append(path)
+    return paths, len(records) * copies * files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--mb", type=float, default=12)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--executor", choices=["process", "thread"], default="process")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths, rows = build_export(tmp, args.files, args.mb)
+        size = sum(os.path.getsize(p) for p in paths)
+        print(f"{len(paths)} files, {rows:,} records, {size / 1e6:.0f} MB, {os.cpu_count()} CPUs")
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            parse_files(paths, hour_offset=16, workers=workers, executor=args.executor)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{workers:>3} workers: {elapsed:6.2f}s  speedup {baseline / elapsed:4.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Time and memory-profile every stage of the app pipeline on a synthetic export and write the
+results as JSON so runs can be compared
+
+    python -m benchmarks.pipeline --rows 100000 1000000 --schema streaming endsong -o bench.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.synthetic import write_export
+from spotify_core.aggregates import build_cube
+from spotify_core.features import add_features
+from spotify_core.festival import festival_registry
+from spotify_core.heatmap import heatmap_grid
+from spotify_core.ingest import normalize_history, read_history
+from spotify_core.schema import compact_history, concat_history
+from spotify_core.sessions import Sessions
+from spotify_core.summary import summarize_history
+
+
+def build_heatmaps(cube):
+    # The heatmap of every year, for all artists and for the top artist, as the app draws them
+    return [
+        heatmap_grid(cube.artist_days(code, year), year)
+        for code in (None, 0)
+        for year in cube.years(code).index
+    ]
+
+
+def match_festivals(all_data, registry):
+    # Every lineup in one pass, then each festival's plays as the app slices them
+    matches = registry.match(all_data)
+    return [matches.ranking()] + [matches.festival(f).plays for f in registry.festivals]
+
+
+def stages(paths, registry):
+    """
+    The pipeline as (name, function) pairs. Each function reads the outputs of earlier stages
+    from `state` and returns its own, which is stored under its name
+    """
+    return [
+        ("parse", lambda state: [read_history(path) for path in paths]),
+        ("rename", lambda state: [normalize_history(frame) for frame in state["parse"]]),
+        (
+            "features",
+            lambda state: [add_features(frame, hour_offset=16) for frame in state["rename"]],
+        ),
+        (
+            "compact",
+            lambda state: concat_history([compact_history(frame) for frame in state["features"]]),
+        ),
+        ("artist_filter", lambda state: summarize_history(state["compact"])),
+        ("aggregates", lambda state: build_cube(state["artist_filter"].plays)),
+        ("build_heatmap", lambda state: build_heatmaps(state["aggregates"])),
+        ("sessions", lambda state: Sessions.from_plays(state["artist_filter"].plays)),
+        ("festival_match", lambda state: match_festivals(state["compact"], registry)),
+    ]
+
+
+def result_bytes(result) -> int:
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return int(result.memory_usage(deep=True).sum())
+    if isinstance(result, list):
+        return sum(result_bytes(item) for item in result)
+    if isinstance(result, Sessions):
+        return result_bytes(result.table) + result.ids.nbytes
+    return 0
+
+
+def profile(paths, registry, trace: bool) -> dict:
+    """
+    Run the whole pipeline once, recording each stage's wall time, or with `trace` the peak
+    memory it allocates on top of what earlier stages hold
+    """
+    state, stats = {}, {}
+    if trace:
+        tracemalloc.start()
+    try:
+        for name, func in stages(paths, registry):
+            gc.collect()
+            if trace:
+                tracemalloc.reset_peak()
+                held = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            state[name] = func(state)
+            elapsed = time.perf_counter() - start
+            if trace:
+                stats[name] = {
+                    "peak_mb": round((tracemalloc.get_traced_memory()[1] - held) / 1e6, 2)
+                }
+            else:
+                stats[name] = {
+                    "seconds": round(elapsed, 4),
+                    "result_mb": round(result_bytes(state[name]) / 1e6, 2),
+                }
+    finally:
+        if trace:
+            tracemalloc.stop()
+    return stats
+
+
+def run(rows: int, schema: str, trace: bool, seed: int = 0) -> dict:
+    """
+    Time the pipeline on a fresh synthetic export, then profile its memory in a second pass
+    since tracing slows the pure Python parts several times over
+    """
+    registry = festival_registry()
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_export(tmp, rows, schema, seed=seed)
+        size = sum(os.path.getsize(path) for path in paths)
+        stats = profile(paths, registry, trace=False)
+        if trace:
+            for name, memory in profile(paths, registry, trace=True).items():
+                stats[name].update(memory)
+
+    for name, stage in stats.items():
+        peak = f" {stage['peak_mb']:>9.1f} MB peak" if trace else ""
+        print(
+            f"{schema:>9} {rows:>10,} {name:>15} {stage['seconds']:>8.3f}s{peak}", file=sys.stderr
+        )
+    return {
+        "rows": rows,
+        "schema": schema,
+        "files": len(paths),
+        "mb": round(size / 1e6, 2),
+        "stages": [{"stage": name, **stage} for name, stage in stats.items()],
+    }
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "cpus": os.cpu_count(),
+        "machine": platform.machine(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument(
+        "--schema", nargs="+", choices=["streaming", "endsong"], default=["streaming"]
+    )
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        "environment": environment(),
+        "runs": [
+            run(rows, schema, not args.no_memory, args.seed)
+            for schema in args.schema
+            for rows in args.rows
+        ],
+    }
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
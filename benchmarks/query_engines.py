@@ -0,0 +1,95 @@
+"""
+Check that the query engines agree on the drill-down queries of the most listened artists, then
+time each query on both: the pandas engine reads the pre-aggregated cube, the DuckDB engine
+aggregates the plays in SQL
+
+    python -m benchmarks.query_engines --rows 1000000 10000000 --artists 20
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import SCHEMAS, synthetic_plays
+from spotify_core.aggregates import build_cube
+from spotify_core.leaderboards import artist_leaderboard, track_leaderboard
+from spotify_core.queries import DuckDBCube
+from spotify_core.summary import filter_plays
+
+QUERIES = {
+    "years": lambda engine, code, year: engine.years(code),
+    "monthly": lambda engine, code, year: engine.monthly(code),
+    "artist_songs": lambda engine, code, year: engine.artist_songs(code),
+    "artist_days": lambda engine, code, year: engine.artist_days(code, year),
+    "year_tracks": lambda engine, code, year: engine.year_tracks(code, year),
+    # Not asked for all artists, as in `year_view`
+    "yearly_rank": lambda engine, code, year: (
+        None if code is None else engine.yearly_rank(code, year)
+    ),
+}
+
+
+def assert_same(expected, result, name):
+    # Minutes are summed in a different order, and names come back with their own categories
+    if expected is None or isinstance(expected, float):
+        assert expected == result, name
+        return
+    if isinstance(expected, pd.Series):
+        expected, result = expected.reset_index(), result.reset_index()
+    assert len(expected) == len(result), name
+    for column in result.columns:
+        left, right = expected[column].to_numpy(), result[column].to_numpy()
+        if left.dtype.kind == "f":
+            assert np.allclose(left, right), f"{name}: {column}"
+        else:
+            assert (left.astype(str) == right.astype(str)).all(), f"{name}: {column}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--artists", type=int, default=20)
+    # endsong histories hold podcast episodes, plays without an artist or track
+    parser.add_argument("--schema", choices=list(SCHEMAS), default="endsong")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        plays = filter_plays(synthetic_plays(rows, args.schema, seed=args.seed))
+        start = time.perf_counter()
+        cube = build_cube(plays)
+        cube_build = time.perf_counter() - start
+        start = time.perf_counter()
+        duckdb = DuckDBCube(cube.fragments)
+        duckdb_build = time.perf_counter() - start
+        # Every artist in the same order, so both engines give each artist the same code
+        assert cube.artists.equals(duckdb.artists)
+
+        for window in [1, 12]:
+            for board in [artist_leaderboard, track_leaderboard]:
+                assert_same(
+                    board(cube, window=window), board(duckdb, window=window), board.__name__
+                )
+
+        # All artists and each artist with its most listened year, as the app opens them
+        codes = [None] + list(range(min(args.artists, len(cube.artists))))
+        selections = [(code, cube.years(code).idxmax()) for code in codes]
+        print(f"{len(plays):,} plays, {len(cube.artists):,} artists, {len(codes)} drill-downs")
+        print(f"{'query':>14} {'pandas':>10} {'duckdb':>10}")
+        print(f"{'build':>14} {cube_build:>9.2f}s {duckdb_build:>9.2f}s")
+        for name, query in QUERIES.items():
+            elapsed = []
+            for engine in [cube, duckdb]:
+                start = time.perf_counter()
+                for code, year in selections:
+                    query(engine, code, year)
+                elapsed.append((time.perf_counter() - start) / len(selections))
+            for code, year in selections:
+                assert_same(query(cube, code, year), query(duckdb, code, year), name)
+            print(f"{name:>14} {elapsed[0] * 1e3:>8.2f}ms {elapsed[1] * 1e3:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
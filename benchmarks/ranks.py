@@ -0,0 +1,67 @@
+"""
+Time the yearly rank of every artist in every year it was played, ranking the year's totals
+per lookup against the rank table built with the cube, on a synthetic history
+
+    python -m benchmarks.ranks --rows 1000000 10000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_history
+from spotify_core.aggregates import build_cube
+from spotify_core.features import add_features
+from spotify_core.ingest import normalize_history
+from spotify_core.ranks import RankTable
+from spotify_core.schema import compact_history
+
+
+def legacy_rank(artist_years, code, year) -> float:
+    # Rank every artist of the year to read one of them
+    year_totals = artist_years[artist_years["year"] == year]
+    ranks = year_totals["minutes"].rank(ascending=False)
+    return ranks[year_totals["artist"] == code].iloc[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'rows':>12} {'cells':>8} {'build':>8} {'legacy':>10} {'table':>10} {'speedup':>8}")
+    for rows in args.rows:
+        plays = compact_history(
+            add_features(normalize_history(generate_history(rows, seed=args.seed)))
+        )
+        cube = build_cube(plays)
+        artist_years = cube.artist_years.frame
+        pairs = artist_years[["artist", "year"]].to_numpy()
+        pairs = pairs[np.random.default_rng(args.seed).permutation(len(pairs))[: args.lookups]]
+
+        start = time.perf_counter()
+        table = RankTable.build(
+            artist_years["artist"].to_numpy(),
+            artist_years["year"].to_numpy(),
+            np.round(artist_years["minutes"].to_numpy() * 60000),
+            len(cube.artists),
+        )
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = [legacy_rank(artist_years, code, year) for code, year in pairs]
+        legacy = (time.perf_counter() - start) / len(pairs)
+        start = time.perf_counter()
+        result = [table.rank(code, year) for code, year in pairs]
+        lookup = (time.perf_counter() - start) / len(pairs)
+        assert expected == result
+        print(
+            f"{rows:>12,} {table.ms.size:>8,} {build:>7.3f}s {legacy * 1e6:>8.0f}us "
+            f"{lookup * 1e6:>8.2f}us {legacy / lookup:>7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
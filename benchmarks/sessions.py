@@ -0,0 +1,85 @@
+"""
+Time session detection against a per-play loop, on plays in time order, in a handful of
+time-ordered files as exports come, and shuffled
+
+    python -m benchmarks.sessions --sizes 100000 1000000 10000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from spotify_core.sessions import SESSION_GAP_MINUTES, Sessions
+
+ORDERS = ["sorted", "files", "shuffled"]
+
+
+def make_plays(rows: int, order: str, files: int = 8, seed: int = 0) -> tuple:
+    """
+    End times, milliseconds played and artist codes of `rows` plays, bunched into sessions
+    """
+    rng = np.random.default_rng(seed)
+    ms_played = rng.integers(10_000, 300_000, rows)
+    # Mostly back to back, with a pause of up to a day before one play in ten
+    pause = np.where(rng.random(rows) < 0.1, rng.integers(0, 86_400_000, rows), 0)
+    end_ms = np.cumsum(ms_played + pause) + 1_420_070_400_000
+    artists = rng.integers(0, 5000, rows)
+    if order == "files":
+        # Each file in time order, the files themselves in upload order
+        runs = np.array_split(np.arange(rows), files)
+        positions = np.concatenate([runs[i] for i in rng.permutation(files)])
+    elif order == "shuffled":
+        positions = rng.permutation(rows)
+    else:
+        positions = np.arange(rows)
+    return end_ms[positions].astype("datetime64[ms]"), ms_played[positions], artists[positions]
+
+
+def loop_sessions(end_time, ms_played, artists, gap_minutes: float = SESSION_GAP_MINUTES):
+    # Session of every play by walking the plays in time order, the straightforward way
+    end_ms = end_time.astype(np.int64).tolist()
+    ms_played, artists = ms_played.tolist(), artists.tolist()
+    ids, seen, last_end, session = [0] * len(end_ms), [], None, -1
+    for i in sorted(range(len(end_ms)), key=end_ms.__getitem__):
+        if last_end is None or end_ms[i] - ms_played[i] - last_end > gap_minutes * 60000:
+            session += 1
+            seen.append(set())
+        seen[session].add(artists[i])
+        ids[i] = session
+        last_end = end_ms[i]
+    return np.array(ids), np.array([len(names) for names in seen])
+
+
+def timed(func, *args) -> tuple:
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    parser.add_argument(
+        "--loop-max", type=int, default=1_000_000, help="largest size to run the loop on"
+    )
+    args = parser.parse_args()
+
+    print(f"{'rows':>12} {'order':>9} {'loop':>9} {'vectorized':>11} {'sessions':>10}")
+    for rows in args.sizes:
+        for order in ORDERS:
+            plays = make_plays(rows, order)
+            sessions, vectorized = timed(Sessions.build, *plays)
+            loop = "-"
+            if rows <= args.loop_max:
+                (ids, artists), seconds = timed(loop_sessions, *plays)
+                assert (ids == sessions.ids).all()
+                assert (artists == sessions.table["artists"].to_numpy()).all()
+                loop = f"{seconds:.2f}s"
+            print(
+                f"{rows:>12,} {order:>9} {loop:>9} {vectorized:>10.3f}s {len(sessions.table):>10,}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare the memory of several processes holding the same history, each reading its own copy from
+Parquet against all mapping one file of shared columns. Reports what opening the history added to
+each process: proportional set size, which splits shared pages between the processes mapping
+them, and private memory. Linux only, read from /proc/self/smaps_rollup
+
+    python -m benchmarks.shared_store --rows 2000000 --processes 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_history
+from spotify_core.columns import open_columns, write_columns
+from spotify_core.ingest import enrich_history, normalize_history
+
+
+def memory_kb() -> dict:
+    fields = {}
+    with open("/proc/self/smaps_rollup") as fp:
+        for line in fp:
+            name, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                fields[name] = int(value.split()[0])
+    return {"pss": fields["Pss"], "private": fields["Private_Clean"] + fields["Private_Dirty"]}
+
+
+def touch(frame: pd.DataFrame) -> int:
+    # Read every column so all of its pages are resident
+    total = 0
+    for name in frame.columns:
+        values = frame[name].array
+        values = values.codes if isinstance(values, pd.Categorical) else values.to_numpy()
+        total += int(np.asarray(values).view(np.uint8).sum())
+    return total
+
+
+def hold(reader, path, barrier, results):
+    before = memory_kb()
+    start = time.perf_counter()
+    frame = reader(path)
+    touch(frame)
+    elapsed = time.perf_counter() - start
+    # Measure once every process holds the history, so shared pages are split between them
+    barrier.wait()
+    after = memory_kb()
+    results.put((elapsed, {key: after[key] - before[key] for key in after}))
+    barrier.wait()
+
+
+def run(reader, path, processes):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(processes)
+    results = context.Queue()
+    workers = [
+        context.Process(target=hold, args=(reader, path, barrier, results))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    measured = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return measured
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    frame = enrich_history(normalize_history(generate_history(args.rows)))
+    print(f"{len(frame):,} plays, {frame.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory")
+    with tempfile.TemporaryDirectory() as tmp:
+        parquet = os.path.join(tmp, "history.parquet")
+        columns = os.path.join(tmp, "history.columns")
+        frame.to_parquet(parquet, index=False)
+        write_columns(columns, frame)
+        for name, reader, path in [
+            ("parquet", pd.read_parquet, parquet),
+            ("mapped", open_columns, columns),
+        ]:
+            measured = run(reader, path, args.processes)
+            pss = sum(memory["pss"] for _, memory in measured) / 1e3
+            private = sum(memory["private"] for _, memory in measured) / 1e3
+            elapsed = max(elapsed for elapsed, _ in measured)
+            print(
+                f"{name:>7}: {args.processes} processes  open {elapsed:5.2f}s  "
+                f"pss {pss:7.1f} MB  private {private:7.1f} MB  "
+                f"per process {pss / args.processes:6.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Generate a synthetic Spotify export with Zipf-distributed artists and tracks over several years,
+in either the StreamingHistory or the extended endsong schema
+
+    python -m benchmarks.synthetic out/ --rows 1000000 --schema endsong
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from spotify_core.festival import FESTIVALS, load_lineup
+
+SCHEMAS = {"streaming": "StreamingHistory{}.json", "endsong": "endsong_{}.json"}
+# Plays per file in real exports
+ROWS_PER_FILE = {"streaming": 10_000, "endsong": 16_000}
+
+
+def zipf_choice(rng, n: int, size: int, exponent: float) -> np.ndarray:
+    """
+    Draw `size` ranks in [0, n) with P(k) proportional to 1 / (k + 1) ** exponent
+    """
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return rng.choice(n, size=size, p=weights / weights.sum())
+
+
+def artist_names(rng, n_artists: int) -> np.ndarray:
+    """
+    Made-up artist names with the bundled lineups mixed in at random ranks, so festival
+    matching has something to find
+    """
+    lineup = pd.concat([load_lineup(path)["Artist"] for path in FESTIVALS.values()]).unique()
+    lineup = lineup[: n_artists // 2]
+    names = np.array(
+        [f"Artist {i:05d}" for i in range(n_artists - len(lineup))] + list(lineup), dtype=object
+    )
+    rng.shuffle(names)
+    return names
+
+
+def generate_history(
+    rows: int,
+    years: int = 5,
+    n_artists: int = 5000,
+    tracks_per_artist: int = 40,
+    exponent: float = 1.1,
+    end: str = "2023-12-31",
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    A StreamingHistory-shaped frame of `rows` plays sorted by `endTime`
+    """
+    rng = np.random.default_rng(seed)
+    names = artist_names(rng, n_artists)
+    artist = zipf_choice(rng, n_artists, rows, exponent)
+    track = zipf_choice(rng, tracks_per_artist, rows, exponent)
+
+    stop = pd.Timestamp(end).value // 10**9
+    start = stop - years * 365 * 24 * 3600
+    seconds = np.sort(rng.integers(start, stop, rows))
+
+    # About a fifth of plays are skips, the rest are roughly song length
+    skipped = rng.random(rows) < 0.2
+    ms_played = np.where(
+        skipped,
+        rng.integers(0, 30_000, rows),
+        np.clip(rng.normal(200_000, 50_000, rows), 30_000, 600_000).astype(np.int64),
+    )
+
+    # Every artist has its own catalogue, with popular tracks drawn more often
+    track_names = np.array(
+        [f"Track {i} of {a}" for a in range(n_artists) for i in range(tracks_per_artist)],
+        dtype=object,
+    )
+    return pd.DataFrame(
+        {
+            "endTime": pd.to_datetime(seconds, unit="s").strftime("%Y-%m-%d %H:%M"),
+            "artistName": names[artist],
+            "trackName": track_names[artist * tracks_per_artist + track],
+            "msPlayed": ms_played,
+        }
+    )
+
+
+def to_endsong(history: pd.DataFrame, seed: int = 0, podcasts: float = 0.02) -> pd.DataFrame:
+    """
+    Convert a StreamingHistory frame to the columns of the extended endsong export. A share of
+    `podcasts` plays become podcast episodes, which have no track or artist as in real exports
+    """
+    rng = np.random.default_rng(seed)
+    rows = len(history)
+    skipped = history["msPlayed"].to_numpy() < 30_000
+    episode = rng.random(rows) < podcasts
+    episodes = pd.Series(np.arange(rows) % 200, index=history.index).astype(str)
+    music = pd.Series(~episode, index=history.index)
+    endsong = pd.DataFrame(
+        {
+            "ts": pd.to_datetime(history["endTime"]).dt.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "username": "synthetic",
+            "platform": rng.choice(["Android OS", "iOS", "OS X", "web_player"], rows),
+            "ms_played": history["msPlayed"],
+            "conn_country": "US",
+            "ip_addr_decrypted": "127.0.0.1",
+            "user_agent_decrypted": "unknown",
+            "master_metadata_track_name": history["trackName"],
+            "master_metadata_album_artist_name": history["artistName"],
+            "master_metadata_album_album_name": "Album",
+            "spotify_track_uri": "spotify:track:" + history["trackName"].str.replace(" ", ""),
+            "episode_name": None,
+            "episode_show_name": None,
+            "spotify_episode_uri": None,
+            "reason_start": "trackdone",
+            "reason_end": np.where(skipped, "fwdbtn", "trackdone"),
+            "shuffle": rng.random(rows) < 0.5,
+            "skipped": skipped,
+            "offline": False,
+            "offline_timestamp": 0,
+            "incognito_mode": False,
+        }
+    )
+    # Episodes keep their play time, but every music field is null
+    for column in [
+        "master_metadata_track_name",
+        "master_metadata_album_artist_name",
+        "master_metadata_album_album_name",
+        "spotify_track_uri",
+    ]:
+        endsong[column] = endsong[column].where(music)
+    endsong["episode_name"] = ("Episode " + episodes).where(~music)
+    endsong["episode_show_name"] = ("Show " + (episodes.astype(int) % 7).astype(str)).where(~music)
+    endsong["spotify_episode_uri"] = ("spotify:episode:" + episodes).where(~music)
+    return endsong
+
+
+def synthetic_plays(rows: int, schema: str = "streaming", **kwargs) -> pd.DataFrame:
+    """
+    Compact plays of a synthetic history in either export layout, endsong ones with their
+    podcast episodes, which have no artist or track
+    """
+    # Imported here so writing an export does not need the feature code
+    from spotify_core.features import add_features
+    from spotify_core.ingest import normalize_history
+    from spotify_core.schema import compact_history
+
+    history = generate_history(rows, **kwargs)
+    if schema == "endsong":
+        history = to_endsong(history, kwargs.get("seed", 0))
+    return compact_history(add_features(normalize_history(history)))
+
+
+def write_export(
+    directory: str, rows: int, schema: str = "streaming", rows_per_file: int = None, **kwargs
+) -> list:
+    """
+    Write a synthetic export of `rows` plays into `directory`, split into files like a real
+    export. Returns the file paths
+    """
+    history = generate_history(rows, **kwargs)
+    if schema == "endsong":
+        history = to_endsong(history, kwargs.get("seed", 0))
+    rows_per_file = rows_per_file or ROWS_PER_FILE[schema]
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i, offset in enumerate(range(0, rows, rows_per_file)):
+        path = os.path.join(directory, SCHEMAS[schema].format(i))
+        history.iloc[offset : offset + rows_per_file].to_json(path, orient="records", indent=2)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("out")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--schema", choices=list(SCHEMAS), default="streaming")
+    parser.add_argument("--rows-per-file", type=int)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--artists", type=int, default=5000)
+    parser.add_argument("--tracks-per-artist", type=int, default=40)
+    parser.add_argument("--exponent", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = write_export(
+        args.out,
+        args.rows,
+        args.schema,
+        args.rows_per_file,
+        years=args.years,
+        n_artists=args.artists,
+        tracks_per_artist=args.tracks_per_artist,
+        exponent=args.exponent,
+        seed=args.seed,
+    )
+    size = sum(os.path.getsize(p) for p in paths)
+    print(f"{args.rows:,} plays in {len(paths)} files, {size / 1e6:.0f} MB in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,8 +10,20 @@ import calplot as cp
 import calendar
 from streamlit_extras.badges import badge
 
+from spotify_core.cache import load_histories
+from spotify_core.charts import chart_frame, chart_spec, present
+from spotify_core.colisten import COLISTEN_PATH, CoListening, seed_artists
+from spotify_core.festival import festival_registry
+from spotify_core.ingest import HistoryFileError, expand_uploads, is_history_file
+from spotify_core.instrument import DEBUG, span, start_recording
+from spotify_core.schema import concat_history
+
 
 st.set_page_config(layout="wide")
+# Stage timings for this run, shown at the bottom with SPOTIFY_DEBUG=1 or ?debug=1
+recorder = None
+if DEBUG or st.query_params.get("debug") == "1":
+    recorder = start_recording("coachella_match")
 corner_radius = 4
 
 days_of_week = [
@@ -55,7 +67,7 @@ col1.markdown(
     """
     ## How to use
     1. Download your Spotify listening history from [here](https://www.spotify.com/us/account/privacy/). Note that this takes about 5 days to process.
-    2. Unzip the file and attach all of the files like `StreamingHistory#.json` or `endsong_#.json` into the app
+    2. Attach the `my_spotify_data.zip` you get as it is, or unzip it and attach all of the files like `StreamingHistory#.json` or `endsong_#.json`
     3. View your matches!
     """
 )
@@ -68,89 +80,42 @@ with col4:
 
 
 # Extract the data from the csv as a list of items
-festival = st.radio("Select a festival", ["Coachella", "Outside Lands"])
-if festival == "Coachella":
-    coachella_lineup = pd.read_csv("./coachella2023.csv")
-else:
-    coachella_lineup = pd.read_csv("./outsidelands2023.csv").columns
-    coachella_lineup = pd.DataFrame(coachella_lineup)
-    coachella_lineup.columns = ["Artist"]
-    coachella_lineup["Day"] = "F"
-    coachella_lineup = coachella_lineup.drop_duplicates()
-
-    # Lowercase
-    coachella_lineup["Artist"] = coachella_lineup["Artist"].str.lower().str.strip()
-
-    # Conver to a dataframe
-    coachella_lineup
-st.write(coachella_lineup)
+# Every lineup is matched in one pass, the radio only picks which one is charted
+with span("lineup"):
+    registry = festival_registry()
+festival = st.radio("Select a festival", registry.festivals)
+coachella_lineup = registry.bookings[registry.bookings["Festival"] == festival]
+st.write(coachella_lineup[["Artist", "Day"]].reset_index(drop=True))
 
 
-# Change the column names to be more readable
-change_cols = {
-    "master_metadata_track_name": "trackName",
-    "master_metadata_album_artist_name": "artistName",
-    "ts": "endTime",
-    "ms_played": "msPlayed",
-}
-
 history = st.file_uploader(
-    "Upload your Spotify listening history", type="json", accept_multiple_files=True
+    "Upload your Spotify listening history", type=["json", "zip"], accept_multiple_files=True
 )
 
 
-def validate_upload_files(file: pd.DataFrame):
-    """
-    Validate the files uploaded to make sure they are the correct format
-    """
-
-    StreamingHistoryColumns = ["endTime", "artistName", "trackName", "msPlayed"]
-    endsongColumns = [
-        "ts",
-        "username",
-        "platform",
-        "ms_played",
-        "conn_country",
-        "ip_addr_decrypted",
-        "user_agent_decrypted",
-        "master_metadata_track_name",
-        "master_metadata_album_artist_name",
-        "master_metadata_album_album_name",
-        "spotify_track_uri",
-        "episode_name",
-        "episode_show_name",
-        "spotify_episode_uri",
-        "reason_start",
-        "reason_end",
-        "shuffle",
-        "skipped",
-        "offline",
-        "offline_timestamp",
-        "incognito_mode",
-    ]
-    check1 = all([i in file.columns for i in StreamingHistoryColumns])
-    check2 = all([i in file.columns for i in endsongColumns])
-    if check1 or check2:
-        return True
-    else:
-        return False
-
-
 def get_all_data():
     """
     Get all the data from the uploaded files
     """
     if history:
-        listening_history = []
         all_data = None
-        for i in history:
-            if "StreamingHistory" in i.name or "endsong_" in i.name:
-                read_file = pd.read_json(path_or_buf=i)
-                if validate_upload_files(read_file):
-                    listening_history.append(read_file)
+        try:
+            # Export zips are read member by member, straight out of the archive
+            history_files = [i for i in expand_uploads(history) if is_history_file(i.name)]
+        except HistoryFileError as e:
+            st.error(
+                f"There was an error reading the file {e.name}. Please remove it and try again."
+            )
+            st.stop()
+        # Compact feature-enriched frames are cached on disk by file content, invalid files are None
+        listening_history = [
+            read_file
+            for read_file in load_histories(history_files, validate=True)
+            if read_file is not None
+        ]
 
         if len(listening_history) > 0:
-            all_data = pd.concat(listening_history).reset_index()
+            all_data = concat_history(listening_history)
         return all_data
     else:
         st.info("Upload your Spotify listening history to see your matches")
@@ -158,7 +123,8 @@ def get_all_data():
 
 
 # Rename if the column name is in the dictionary
-all_data = get_all_data()
+with span("load"):
+    all_data = get_all_data()
 
 # Check if the data was uploaded correctly
 if all_data is None:
@@ -167,48 +133,40 @@ if all_data is None:
     )
     st.stop()
 
-all_data = all_data.rename(
-    columns={i: change_cols[i] for i in change_cols if i in all_data.columns}
-)
-
-# Add features
-all_data["endTime"] = pd.to_datetime(all_data["endTime"])
-all_data["date"] = [i.date() for i in all_data["endTime"]]
-all_data["minutesPlayed"] = all_data["msPlayed"] / 60000
-
 # Merge the Coachella lineup with the listening history
-all_data["artistName"] = all_data["artistName"].str.lower().str.strip()
-# Check if the artist is in the lineup
-all_data["inLineup"] = all_data["artistName"].isin(coachella_lineup["Artist"])
-all_data["artistName"][all_data["inLineup"]]
-all_data = all_data.merge(coachella_lineup, left_on="artistName", right_on="Artist", how="inner")
-
-# Filter for the minimum minutes played grouped by artist
-all_data = all_data.groupby("artistName").filter(lambda x: x["minutesPlayed"].sum() > 1)
-
-# Get the top artist
-grouped_artist_total = all_data.groupby(["artistName"])["minutesPlayed"].sum()
-top_artist = grouped_artist_total.sort_values(ascending=False).index[0]
-
-# Make a chart of the total minutes played by artist and put it in a streamlit column
-top_artists_total_minutes = (
-    all_data.groupby(["artistName"])["minutesPlayed"].sum().sort_values(ascending=False)
-)
-top_artists_total_minutes = top_artists_total_minutes.rename("Total Minutes").reset_index()
+with span("festival_match", rows=len(all_data)):
+    festival_matches = registry.match(all_data)
+    match = festival_matches.festival(festival)
+# Artists played near each other in a session, with counts from other listeners when given
+with span("colisten", rows=len(all_data)):
+    # Built once per upload, picking another festival only rescores it
+    upload = tuple(file.file_id for file in history)
+    if st.session_state.get("colisten", (None,))[0] != upload:
+        colisten = CoListening.from_plays(all_data)
+        if COLISTEN_PATH:
+            colisten = CoListening.merge([CoListening.load(COLISTEN_PATH), colisten])
+        st.session_state["colisten"] = (upload, colisten)
+    colisten = st.session_state["colisten"][1]
+    recommendations = festival_matches.recommendations(
+        festival, colisten, seed_artists(all_data)
+    )
+all_data = match.plays
+top_artist = match.top_artist
+top_artists_total_minutes = match.artist_minutes
 top_artists_order = top_artists_total_minutes["artistName"].to_list()
 
-all_data = all_data.merge(top_artists_total_minutes.reset_index(), on="artistName", how="left")
-all_data["rank"] = all_data["Total Minutes"].rank(ascending=False)
-
 # Artist top minutes chart
 col1, col2 = st.columns(2)
+top_artists_data = chart_frame(
+    top_artists_total_minutes.head(40), ["artistName", "Total Minutes"], "top_artists"
+)
 minutes_played_chart = (
-    alt.Chart(top_artists_total_minutes.reset_index().head(40))
+    alt.Chart(top_artists_data)
     .mark_bar(width=40, cornerRadius=corner_radius)
     .encode(
         y=alt.Y(
             "artistName",
-            sort=top_artists_order,
+            sort=present(top_artists_order, top_artists_data["artistName"]),
             title="Artist",
             axis=alt.Axis(
                 labels=False,
@@ -225,7 +183,7 @@ minutes_played_chart = (
         color=alt.Color(
             "artistName:N",
             title="Artist",
-            sort=top_artists_order,
+            sort=present(top_artists_order, top_artists_data["artistName"]),
             scale=alt.Scale(scheme="viridis"),
             legend=None,
         ),
@@ -241,21 +199,26 @@ limit_40 = "(Top 40)" if len(all_data["artistName"].unique()) > 40 else ""
 
 col1.markdown("---")
 col1.subheader(f"My Top {festival} Artists {limit_40}")
-col1.altair_chart(minutes_played_chart, use_container_width=True)
+with span("chart_top_artists"):
+    top_artists_spec = chart_spec("top_artists", minutes_played_chart)
+    col1.vega_lite_chart(spec=top_artists_spec, use_container_width=True)
 
 # Make a chart that shows the total artists by day where the artists are colors
 # and the days are the x-axis and the y is the total sum of the artists
+artist_days = chart_frame(
+    match.artist_days().head(40), ["artistName", "Day", "rank", "artists"], "artist_days"
+)
 day_chart = (
-    alt.Chart(all_data[["artistName", "Day", "rank"]].drop_duplicates().head(40))
+    alt.Chart(artist_days)
     .mark_bar(cornerRadius=corner_radius)
     .encode(
         x=alt.X("Day", title="Day", axis=alt.Axis(labelAngle=0)),
-        y=alt.Y("count(artistName):Q", title="Total Artists"),
+        y=alt.Y("artists:Q", title="Total Artists"),
         color=alt.Color(
             "artistName:N",
             title="Artist",
             scale=alt.Scale(scheme="viridis"),
-            sort=top_artists_order,
+            sort=present(top_artists_order, artist_days["artistName"]),
             legend=None,
         ),
         order=alt.Order("rank", sort="ascending"),
@@ -268,7 +231,7 @@ day_chart = (
 day_chart = day_chart + (
     day_chart.mark_text(color="black", fill="white", fontSize=12, dy=12).encode(
         x=alt.X("Day", title="Day"),
-        y=alt.Y("count(artistName):Q", title="Total Artists", stack="zero"),
+        y=alt.Y("artists:Q", title="Total Artists", stack="zero"),
         text=alt.Text("artistName", title="Artist"),
         order=alt.Order("rank", sort="ascending"),
     )
@@ -276,14 +239,50 @@ day_chart = day_chart + (
 
 col2.markdown("---")
 col2.subheader(f"Which day are they playing? {limit_40}")
-col2.altair_chart(day_chart, use_container_width=True)
+with span("chart_days"):
+    col2.vega_lite_chart(spec=chart_spec("artist_days", day_chart), use_container_width=True)
 
 
 # Make three streamlit columns with st.metric for each of the following
 col1, col2, col3, col4 = st.columns([4, 2, 3, 2])
 col2.metric("Total Artists", all_data["artistName"].nunique())
 col3.metric("Top Artist", top_artist)
-col4.metric("Total Coachella Hours", int(all_data["minutesPlayed"].sum() / 60))
+col4.metric("Total Coachella Hours", int(all_data["msPlayed"].sum() / 60000 / 60))
 col1.metric(
     "Date Range", f"{all_data['endTime'].min().date()} - {all_data['endTime'].max().date()}"
 )
+
+# Compare every festival on how much of the lineup is already in the listening history
+st.markdown("---")
+st.subheader("Which festival fits me best?")
+st.dataframe(
+    festival_matches.ranking()
+    .set_index("Rank")
+    .style.format({"Hours": "{:.1f}", "Lineup Share": "{:.0%}"}),
+    use_container_width=True,
+)
+
+# Lineup artists not in the matches yet, scored by how often they share a session with the
+# listener's top artists
+st.markdown("---")
+st.subheader(f"Who else should I see at {festival}?")
+if len(recommendations):
+    st.dataframe(
+        recommendations.head(20)
+        .rename(columns={"score": "Score", "because": "Because You Listen To"})
+        .style.format({"Score": "{:.3f}"}),
+        use_container_width=True,
+        hide_index=True,
+    )
+else:
+    st.info("No other lineup artists were played near your top artists")
+
+if recorder is not None:
+    with st.expander("Debug: stage timings"):
+        st.dataframe(pd.DataFrame(recorder.records()), use_container_width=True)
+        st.dataframe(pd.DataFrame(recorder.payloads), use_container_width=True)
+        st.dataframe(pd.DataFrame(recorder.counters).T, use_container_width=True)
+        st.download_button(
+            "Download timings as JSON", recorder.to_json(), "timings.json", "application/json"
+        )
+    recorder.log()
@@ -0,0 +1,3 @@
+"""
+Streamlit-free helpers shared by the Spotify history apps
+"""
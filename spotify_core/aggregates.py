@@ -0,0 +1,286 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from spotify_core.features import iso_to_date
+from spotify_core.index import ArtistIndex
+from spotify_core.ranks import RankTable
+from spotify_core.schema import concat_history
+
+DAY_KEYS = ["year", "week", "dow"]
+TRACK_KEYS = ["artistName", "year", "trackName"]
+
+
+def partial_aggregates(plays: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """
+    Milliseconds and play counts of compact plays grouped by `keys`. Sums of partials over
+    disjoint sets of plays add up to the partial of their union
+    """
+    return (
+        plays.groupby(keys, sort=False, observed=True)
+        .agg(ms=("msPlayed", "sum"), plays=("msPlayed", "size"))
+        .reset_index()
+    )
+
+
+def merge_partials(partials: list, keys: list) -> pd.DataFrame:
+    """
+    Sum partial aggregates over their keys, merging the string tables of their names
+    """
+    if len(partials) == 1:
+        return partials[0]
+    return (
+        concat_history(partials)
+        .groupby(keys, sort=False, observed=True)
+        .agg(ms=("ms", "sum"), plays=("plays", "sum"))
+        .reset_index()
+    )
+
+
+@dataclass
+class PlayFragment:
+    """
+    The plays of one file sorted by the file's own artist codes, with its partial aggregates
+    keyed by artist and track name. Fragments combine by summing their partials, so adding or
+    removing a file never touches the plays of the others
+    """
+
+    # Artist names of the fragment's codes
+    artists: pd.Index
+    # Compact plays sorted by fragment artist code then year
+    plays: ArtistIndex
+    # artistName, year, week, dow -> ms, plays
+    days: pd.DataFrame
+    # artistName, year, trackName -> ms, plays
+    tracks: pd.DataFrame
+
+    @classmethod
+    def build(cls, plays: pd.DataFrame) -> "PlayFragment":
+        artist_names = plays["artistName"].astype("category")
+        names = artist_names.cat.categories
+        columns = {
+            "artist": artist_names.cat.codes.to_numpy(),
+            "year": plays["year"].to_numpy(),
+            "week": plays["week"].to_numpy(),
+            "dow": plays["dow"].to_numpy(),
+            "endTime": plays["endTime"].to_numpy(),
+            "trackName": plays["trackName"].astype("category").to_numpy(),
+            "msPlayed": plays["msPlayed"].to_numpy(),
+        }
+        if "reason_start" in plays.columns:
+            columns["reason_start"] = plays["reason_start"].astype("category").array
+        index = ArtistIndex.build(pd.DataFrame(columns), len(names))
+        return cls(
+            artists=names,
+            plays=index,
+            days=partial_aggregates(plays, ["artistName"] + DAY_KEYS),
+            tracks=partial_aggregates(plays, TRACK_KEYS),
+        )
+
+    def select(self, mask: np.ndarray) -> "PlayFragment":
+        """
+        Fragment of the plays where `mask`, aligned with `plays.frame`, is set
+        """
+        frame = self.plays.frame[mask]
+        artist = pd.Categorical.from_codes(frame["artist"].to_numpy(), self.artists)
+        return PlayFragment.build(
+            frame.drop(columns="artist").assign(
+                artistName=artist, trackName=frame["trackName"].astype("category")
+            )
+        )
+
+    def artist_plays(self, artist=None, year=None) -> pd.DataFrame:
+        code = None
+        if artist is not None:
+            code = self.artists.get_indexer([artist])[0]
+            if code < 0:
+                return self.plays.frame.iloc[:0]
+        if year is None:
+            return self.plays.artist(code)
+        return self.plays.artist_year(code, year)
+
+
+def fragment_plays(fragments: list, artist=None, year=None) -> pd.DataFrame:
+    """
+    Raw plays of an artist name, optionally in one year, gathered from every fragment
+    """
+    parts = [fragment.artist_plays(artist, year) for fragment in fragments]
+    if len(parts) == 1:
+        return parts[0].drop(columns="artist")
+    plays = pd.concat(parts, ignore_index=True)
+    if year is None:
+        # Fragments are each in year order, a stable sort keeps file order within a year
+        plays = plays.sort_values("year", kind="stable", ignore_index=True)
+    return plays.drop(columns="artist")
+
+
+@dataclass
+class ArtistCube:
+    """
+    Minutes and play counts pre-aggregated once per load so drill-down views never touch raw plays.
+
+    Artist codes index `artists`, which is ordered by lifetime minutes so a code is also the
+    artist's lifetime rank - 1. A code of None selects all artists. Every per-artist table is an
+    `ArtistIndex`, so selecting an artist or an artist and year is a slice.
+    """
+
+    artists: pd.Index
+    # Plays of each loaded file, for the raw plays of an artist
+    fragments: list
+    # artist, year, week, dow -> minutes, plays
+    cube: ArtistIndex
+    # artist, year, trackName -> minutes, plays
+    tracks: ArtistIndex
+    # artist, year -> minutes, plays
+    artist_years: ArtistIndex
+    # artist, trackName -> lifetime minutes, plays
+    songs: ArtistIndex
+    # year, week, dow -> minutes, plays over all artists
+    days: pd.DataFrame
+    # artist x year minutes with lifetime and yearly ranks
+    ranks: RankTable
+
+    def code(self, artist: str):
+        return self.artists.get_loc(artist)
+
+    def artist_plays(self, code, year=None) -> pd.DataFrame:
+        """
+        Raw plays of an artist, optionally in one year, gathered from every fragment
+        """
+        return fragment_plays(self.fragments, None if code is None else self.artists[code], year)
+
+    def artist_days(self, code, year=None) -> pd.DataFrame:
+        if code is None:
+            if year is None:
+                return self.days
+            return self.days[self.days["year"] == year]
+        if year is None:
+            return self.cube.artist(code)
+        return self.cube.artist_year(code, year)
+
+    def artist_songs(self, code) -> pd.DataFrame:
+        """
+        Lifetime minutes and plays per (track, artist)
+        """
+        return self.songs.artist(code)
+
+    def year_tracks(self, code, year) -> pd.DataFrame:
+        """
+        Minutes and plays per track name for one artist in one year
+        """
+        return (
+            self.tracks.artist_year(code, year)
+            .groupby("trackName", as_index=False, observed=True)[["minutes", "plays"]]
+            .sum()
+        )
+
+    def years(self, code) -> pd.Series:
+        """
+        Minutes per year for an artist
+        """
+        if code is None:
+            return self.days.groupby("year")["minutes"].sum()
+        return self.artist_years.artist(code).set_index("year")["minutes"]
+
+    def monthly(self, code) -> pd.DataFrame:
+        days = self.artist_days(code)
+        dates = iso_to_date(days["year"], days["week"], days["dow"])
+        year_month = pd.Series(dates.astype("datetime64[M]").astype(str), index=days.index)
+        return (
+            days.groupby(year_month)["minutes"]
+            .sum()
+            .rename_axis("year_month")
+            .rename("minutesPlayed")
+            .reset_index()
+        )
+
+    def yearly_rank(self, code, year) -> float:
+        return self.ranks.rank(code, year)
+
+    def day_totals(self) -> pd.DataFrame:
+        """
+        Minutes and plays of every artist code on every day it was played
+        """
+        return self.cube.frame
+
+
+def cube_from_partials(
+    days: pd.DataFrame, tracks: pd.DataFrame, fragments: list, min_artist_ms: int = 0
+) -> ArtistCube:
+    """
+    Build the cube from summed partials, keeping artists with more than `min_artist_ms` of
+    listening. Cost scales with the size of the partials, not the number of plays
+    """
+    names = days["artistName"].cat.categories
+    name_codes = days["artistName"].cat.codes.to_numpy()
+
+    # Re-code artists by lifetime minutes so the code is also the rank
+    totals = np.bincount(name_codes, weights=days["ms"].to_numpy(), minlength=len(names))
+    observed = np.flatnonzero(np.bincount(name_codes, minlength=len(names)))
+    observed = observed[totals[observed] > min_artist_ms]
+    order = observed[np.argsort(-totals[observed], kind="stable")]
+    artists = pd.Index(names[order], name="artistName")
+    recode = np.full(len(names), -1, dtype=np.int32)
+    recode[order] = np.arange(len(order))
+
+    def recoded(partial):
+        # Partials may carry their own string table, look their names up in the days one
+        lookup = names.get_indexer(partial["artistName"].cat.categories)
+        lookup = np.where(lookup >= 0, recode[lookup], -1)
+        artist = lookup[partial["artistName"].cat.codes.to_numpy()]
+        keep = artist >= 0
+        return partial.drop(columns="artistName")[keep].assign(artist=artist[keep])
+
+    def aggregate(frame, keys):
+        agg = (
+            frame.groupby(keys, sort=True, observed=True)
+            .agg(ms=("ms", "sum"), plays=("plays", "sum"))
+            .reset_index()
+        )
+        agg.insert(len(keys), "minutes", agg.pop("ms") / 60000)
+        return agg
+
+    def index(frame, keys):
+        return ArtistIndex.build(aggregate(frame, keys), len(artists))
+
+    artist_days = recoded(days)
+    artist_tracks = recoded(tracks)
+    songs = index(artist_tracks, ["artist", "trackName"])
+    songs.frame = songs.frame[["trackName", "artist", "minutes", "plays"]]
+    return ArtistCube(
+        artists=artists,
+        fragments=fragments,
+        cube=index(artist_days, ["artist"] + DAY_KEYS),
+        tracks=index(artist_tracks, ["artist", "year", "trackName"]),
+        artist_years=index(artist_days, ["artist", "year"]),
+        songs=songs,
+        days=aggregate(artist_days, DAY_KEYS),
+        ranks=RankTable.build(
+            artist_days["artist"].to_numpy(),
+            artist_days["year"].to_numpy(),
+            artist_days["ms"].to_numpy(),
+            len(artists),
+        ),
+    )
+
+
+def cube_from_fragments(fragments: list, min_artist_ms: int = 0) -> ArtistCube:
+    """
+    Build the cube from the partials of each fragment
+    """
+    return cube_from_partials(
+        merge_partials([f.days for f in fragments], ["artistName"] + DAY_KEYS),
+        merge_partials([f.tracks for f in fragments], TRACK_KEYS),
+        fragments,
+        min_artist_ms,
+    )
+
+
+def build_cube(all_data: pd.DataFrame) -> ArtistCube:
+    """
+    Sort compact plays by artist once and aggregate them into the artist x year x week x weekday
+    cube and its track tables. Grouping runs on the artist and track dictionary codes
+    """
+    fragment = PlayFragment.build(all_data)
+    return cube_from_partials(fragment.days, fragment.tracks, [fragment])
@@ -0,0 +1,380 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from spotify_core.columns import mapped_bytes, open_columns, write_columns
+from spotify_core.ingest import (
+    INGEST_WORKERS,
+    HistoryFileError,
+    HistorySchemaError,
+    enrich_history,
+    file_name,
+    parse_files,
+    read_normalized,
+)
+from spotify_core.instrument import record_counters, span
+
+# Bump when the normalized layout or the feature block changes so stale entries are never read
+CACHE_VERSION = "6"
+CACHE_DIR = os.environ.get(
+    "SPOTIFY_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "spotify-history")
+)
+CACHE_MAX_BYTES = int(os.environ.get("SPOTIFY_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# Bytes of history frames held in memory for every session of the process, measured per frame
+MEMORY_BUDGET_BYTES = int(os.environ.get("SPOTIFY_MEMORY_BUDGET", 256 * 1024 * 1024))
+# Memory-mapped column files shared by every server process on the machine
+SHARED_DIR = os.environ.get("SPOTIFY_SHARED_DIR", os.path.join(CACHE_DIR, "shared"))
+
+_HASH_BLOCK = 1 << 20
+# Content hashes remembered per upload or path, so reruns do not read the files again
+DIGEST_ENTRIES = 4096
+_digests = OrderedDict()
+_digests_lock = threading.Lock()
+
+
+def content_hash(file) -> str:
+    """
+    Hash the bytes of an uploaded file or path so identical exports share a cache entry
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as fp:
+            for block in iter(lambda: fp.read(_HASH_BLOCK), b""):
+                digest.update(block)
+    else:
+        file.seek(0)
+        for block in iter(lambda: file.read(_HASH_BLOCK), b""):
+            digest.update(block)
+        file.seek(0)
+    return digest.hexdigest()
+
+
+def _digest_key(file):
+    # Uploads keep their file_id across reruns, a new upload gets a new one. Paths are keyed
+    # by size and modification time so an edited file is hashed again
+    if isinstance(file, (str, os.PathLike)):
+        stat = os.stat(file)
+        return os.fspath(file), stat.st_size, stat.st_mtime_ns
+    file_id = getattr(file, "file_id", None)
+    return None if file_id is None else (file_id, getattr(file, "size", None))
+
+
+def file_digest(file) -> str:
+    """
+    `content_hash` of a file, remembered per upload file_id and size or per path, size and
+    modification time. Files without either are hashed every time
+    """
+    key = _digest_key(file)
+    if key is None:
+        return content_hash(file)
+    with _digests_lock:
+        digest = _digests.get(key)
+        if digest is not None:
+            _digests.move_to_end(key)
+            return digest
+    digest = content_hash(file)
+    with _digests_lock:
+        _digests[key] = digest
+        while len(_digests) > DIGEST_ENTRIES:
+            _digests.popitem(last=False)
+    return digest
+
+
+class HistoryCache:
+    """
+    On-disk Parquet cache of history frames keyed by content hash, bounded by `max_bytes`
+    with least recently used entries evicted first
+    """
+
+    suffix = ".parquet"
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}-v{CACHE_VERSION}{self.suffix}")
+
+    def _read(self, path: str) -> pd.DataFrame:
+        return pd.read_parquet(path)
+
+    def _write(self, path: str, frame: pd.DataFrame):
+        frame.to_parquet(path, index=False)
+
+    def load(self, key: str):
+        path = self.path(key)
+        try:
+            frame = self._read(path)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        # Touch the entry so eviction sees it as recently used
+        os.utime(path)
+        return frame
+
+    def store(self, key: str, frame: pd.DataFrame):
+        # Write to a temporary file first so concurrent sessions never read a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            self._write(tmp_path, frame)
+            os.replace(tmp_path, self.path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+        return frame
+
+    def entries(self):
+        """
+        Return (mtime, size, path) for every entry, oldest first
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def get_or_build(self, key: str, build) -> pd.DataFrame:
+        frame = self.load(key)
+        if frame is None:
+            frame = self.store(key, build())
+        return frame
+
+
+class SharedStore(HistoryCache):
+    """
+    Cache of history frames as memory-mapped column files, see `write_columns`. Every process
+    that loads an entry maps the same pages, so any number of server processes hold about one
+    copy of the columns. Frames with a column of no fixed width are not stored
+    """
+
+    suffix = ".columns"
+
+    def __init__(self, directory: str = SHARED_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        super().__init__(directory, max_bytes)
+
+    def _read(self, path: str) -> pd.DataFrame:
+        return open_columns(path)
+
+    def _write(self, path: str, frame: pd.DataFrame):
+        write_columns(path, frame)
+
+    def store(self, key: str, frame: pd.DataFrame):
+        # Entries are replaced rather than rewritten, so frames mapped from an older file of
+        # the same key stay valid
+        try:
+            return super().store(key, frame)
+        except TypeError:
+            return frame
+
+
+class DatasetCache:
+    """
+    Process-wide LRU of history frames in front of a `HistoryCache`, bounded by `max_bytes` of
+    measured frame memory. Sessions that upload the same export share one frame. Frames are
+    written through to disk, and a frame evicted from memory is spilled there if the disk cache
+    has since dropped it, so a later lookup reloads it from Parquet instead of parsing again.
+
+    With a `SharedStore`, frames are also published there and the memory-mapped copy is the one
+    kept, so other server processes open it without parsing or reading Parquet and the mapped
+    columns are not counted against `max_bytes`. Frames handed out are shared and read-only
+    """
+
+    def __init__(
+        self,
+        disk: HistoryCache = None,
+        max_bytes: int = MEMORY_BUDGET_BYTES,
+        shared: SharedStore = None,
+    ):
+        self.disk = disk
+        self.max_bytes = max_bytes
+        self.shared = shared
+        # Key -> (frame, bytes), least recently used first
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.shared_hits = self.misses = self.reloads = 0
+        self.evictions = self.spills = 0
+        self.bytes_resident = 0
+
+    def _share(self, key: str, frame: pd.DataFrame) -> pd.DataFrame:
+        # Swap a private frame for its mapped copy so the private one can be freed
+        if self.shared is None:
+            return frame
+        self.shared.store(key, frame)
+        mapped = self.shared.load(key)
+        return frame if mapped is None else mapped
+
+    def _put(self, key: str, frame: pd.DataFrame):
+        size = int(frame.memory_usage(deep=True).sum()) - mapped_bytes(frame)
+        with self._lock:
+            if key in self._frames:
+                self.bytes_resident -= self._frames.pop(key)[1]
+            self._frames[key] = (frame, size)
+            self.bytes_resident += size
+            evicted = []
+            while self.bytes_resident > self.max_bytes and self._frames:
+                old_key, (old_frame, old_size) = self._frames.popitem(last=False)
+                self.bytes_resident -= old_size
+                self.evictions += 1
+                evicted.append((old_key, old_frame))
+        # Parquet writes happen outside the lock so other sessions are not held up
+        for old_key, old_frame in evicted:
+            if self.disk is not None and not os.path.exists(self.disk.path(old_key)):
+                self.disk.store(old_key, old_frame)
+                with self._lock:
+                    self.spills += 1
+
+    def load(self, key: str):
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is not None:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        frame = self.shared.load(key) if self.shared is not None else None
+        if frame is not None:
+            with self._lock:
+                self.shared_hits += 1
+            self._put(key, frame)
+            return frame
+        frame = self.disk.load(key) if self.disk is not None else None
+        with self._lock:
+            if frame is None:
+                self.misses += 1
+                return None
+            self.reloads += 1
+        frame = self._share(key, frame)
+        self._put(key, frame)
+        return frame
+
+    def store(self, key: str, frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Cache `frame` and return the copy held, memory-mapped when there is a SharedStore
+        """
+        if self.disk is not None:
+            self.disk.store(key, frame)
+        frame = self._share(key, frame)
+        self._put(key, frame)
+        return frame
+
+    def get_or_build(self, key: str, build) -> pd.DataFrame:
+        frame = self.load(key)
+        if frame is None:
+            frame = self.store(key, build())
+        return frame
+
+    def release(self, key: str):
+        """
+        Drop `key` from memory, leaving it on disk for the next load that needs it
+        """
+        with self._lock:
+            entry = self._frames.pop(key, None)
+            if entry is not None:
+                self.bytes_resident -= entry[1]
+        if entry is not None and self.disk is not None:
+            if not os.path.exists(self.disk.path(key)):
+                self.disk.store(key, entry[0])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+                "spills": self.spills,
+                "entries": len(self._frames),
+                "bytes_resident": self.bytes_resident,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_default_cache = None
+_cache_lock = threading.Lock()
+
+
+def default_cache() -> DatasetCache:
+    """
+    The process-wide frame cache over the on-disk cache in CACHE_DIR and the shared store
+    in SHARED_DIR
+    """
+    global _default_cache
+    with _cache_lock:
+        if _default_cache is None:
+            _default_cache = DatasetCache(HistoryCache(), shared=SharedStore())
+    return _default_cache
+
+
+def load_histories(
+    files: list,
+    hour_offset: int = 0,
+    validate: bool = False,
+    workers: int = INGEST_WORKERS,
+    cache=None,
+) -> list:
+    """
+    Read, rename, enrich and compact uploaded files through the cache, in upload order. The
+    cache is a HistoryCache or DatasetCache, by default the process-wide DatasetCache.
+
+    Compact frames are cached under each file's content hash plus the hour offset. On a miss
+    the renamed frame is cached under the hash alone so both apps share it, on disk but not
+    in memory; when several files miss and `workers` > 1 they are parsed in parallel instead.
+    Files that fail validation come back as None
+    """
+    cache = cache or default_cache()
+    with span("cache_lookup", rows=len(files)):
+        digests = [file_digest(file) for file in files]
+        frames = [cache.load(f"{digest}-compact-{hour_offset}h") for digest in digests]
+    misses = [i for i, frame in enumerate(frames) if frame is None]
+
+    if workers > 1 and len(misses) > 1:
+        parsed = parse_files([files[i] for i in misses], hour_offset, validate, workers)
+    else:
+        parsed = []
+        for i in misses:
+            key = f"{digests[i]}-normalized"
+            try:
+                normalized = cache.get_or_build(key, lambda: read_normalized(files[i]))
+                parsed.append(enrich_history(normalized, hour_offset, validate))
+            except HistorySchemaError as e:
+                if not validate:
+                    raise HistoryFileError(file_name(files[i])) from e
+                parsed.append(None)
+            except Exception as e:
+                raise HistoryFileError(file_name(files[i])) from e
+            finally:
+                if isinstance(cache, DatasetCache):
+                    # Only read again for another hour offset, which can wait for the disk
+                    cache.release(key)
+
+    with span("cache_store", rows=len(misses)):
+        for i, frame in zip(misses, parsed):
+            if frame is not None:
+                frame = cache.store(f"{digests[i]}-compact-{hour_offset}h", frame)
+            frames[i] = frame
+    if isinstance(cache, DatasetCache):
+        record_counters("dataset_cache", cache.stats())
+    return frames
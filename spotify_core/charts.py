@@ -0,0 +1,174 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import altair as alt
+import pandas as pd
+import pyarrow as pa
+
+from spotify_core.instrument import record_payload
+
+# Per-chart budget for the data shipped to the browser
+CHART_MAX_ROWS = int(os.environ.get("SPOTIFY_CHART_MAX_ROWS", 5000))
+CHART_MAX_BYTES = int(os.environ.get("SPOTIFY_CHART_MAX_BYTES", 1 << 20))
+# Compiled specs kept for reuse across reruns and sessions
+SPEC_CACHE_SIZE = 128
+
+logger = logging.getLogger(__name__)
+# Altair's data transformer registry is global, sessions run on their own threads
+_lock = threading.Lock()
+# alt.themes is deprecated from Altair 5.5 in favour of alt.theme
+_themes = alt.theme if hasattr(getattr(alt, "theme", None), "enable") else alt.themes
+
+
+def arrow_bytes(frame: pd.DataFrame) -> bytes:
+    """
+    Serialize a frame to Arrow IPC bytes the way Streamlit ships chart datasets
+    """
+    table = pa.Table.from_pandas(frame)
+    sink = pa.BufferOutputStream()
+    with pa.RecordBatchStreamWriter(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def chart_frame(
+    frame: pd.DataFrame,
+    fields: list,
+    name: str = "chart",
+    max_rows: int = CHART_MAX_ROWS,
+    max_bytes: int = CHART_MAX_BYTES,
+) -> pd.DataFrame:
+    """
+    Project a pre-aggregated frame onto the fields a chart encodes and hold it to the row and
+    byte budget. Rows are assumed to be in priority order, so the tail is dropped first
+    """
+    frame = frame[list(dict.fromkeys(fields))].reset_index(drop=True)
+    # Only ship the labels that occur, not the whole category dictionary
+    for column in frame.select_dtypes("category").columns:
+        frame[column] = frame[column].cat.remove_unused_categories()
+
+    rows = len(frame)
+    if rows > max_rows:
+        frame = frame.head(max_rows)
+    size = len(arrow_bytes(frame))
+    while size > max_bytes and len(frame) > 1:
+        frame = frame.head(max(1, int(len(frame) * max_bytes / size * 0.9)))
+        size = len(arrow_bytes(frame))
+    if len(frame) < rows:
+        logger.warning(
+            "Chart %s trimmed from %d to %d rows to fit %d rows / %d bytes",
+            name,
+            rows,
+            len(frame),
+            max_rows,
+            max_bytes,
+        )
+    return frame
+
+
+def present(order, values) -> list:
+    """
+    The part of a sort order that occurs in `values`, so specs do not carry unused labels
+    """
+    values = set(values)
+    return [value for value in order if value in values]
+
+
+def _to_dict(chart: alt.TopLevelMixin, transform, validate: bool = True) -> dict:
+    with _lock:
+        alt.data_transformers.register("spotify_chart", transform)
+        with _themes.enable("none"), alt.data_transformers.enable("spotify_chart"):
+            return chart.to_dict(validate=validate)
+
+
+def compile_chart(chart: alt.TopLevelMixin) -> dict:
+    """
+    Compile an Altair chart to a Vega-Lite spec whose datasets are already Arrow bytes, ready
+    for `st.vega_lite_chart(spec=...)`
+    """
+    datasets = {}
+
+    def to_arrow(data):
+        payload = arrow_bytes(data)
+        key = hashlib.md5(payload).hexdigest()
+        datasets[key] = payload
+        return {"name": key}
+
+    spec = _to_dict(chart, to_arrow)
+    spec["datasets"] = datasets
+    return spec
+
+
+def spec_bytes(spec: dict) -> int:
+    """
+    Size of a compiled spec on the wire: the Arrow datasets plus the JSON around them
+    """
+    datasets = spec.get("datasets", {})
+    rest = {key: value for key, value in spec.items() if key != "datasets"}
+    return sum(len(data) for data in datasets.values()) + len(json.dumps(rest))
+
+
+def frame_digest(frame: pd.DataFrame) -> str:
+    hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    columns = "|".join(f"{c}:{t}" for c, t in frame.dtypes.items()).encode()
+    return hashlib.blake2b(hashes.tobytes() + columns, digest_size=16).hexdigest()
+
+
+def chart_key(chart: alt.TopLevelMixin) -> tuple:
+    """
+    Digest of everything a chart renders, with each dataset standing in as the digest of its
+    rows. Skips schema validation, which is most of the cost of compiling
+    """
+    rows = []
+
+    def digest(data):
+        rows.append(len(data))
+        return {"name": frame_digest(data)}
+
+    spec = _to_dict(chart, digest, validate=False)
+    key = hashlib.blake2b(json.dumps(spec, sort_keys=True).encode(), digest_size=16).hexdigest()
+    return key, sum(rows)
+
+
+class SpecCache:
+    """
+    LRU of compiled specs keyed by `chart_key`
+    """
+
+    def __init__(self, size: int = SPEC_CACHE_SIZE):
+        self.size = size
+        self._specs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            spec = self._specs.get(key)
+            if spec is not None:
+                self._specs.move_to_end(key)
+                return spec, True
+        spec = build()
+        with self._lock:
+            self._specs[key] = spec
+            if len(self._specs) > self.size:
+                self._specs.popitem(last=False)
+        return spec, False
+
+
+_SPECS = SpecCache()
+
+
+def chart_spec(name: str, chart: alt.TopLevelMixin) -> dict:
+    """
+    Compiled spec of a chart, reused from earlier reruns and sessions while the chart and its
+    data are unchanged. The payload size is recorded for the debug panel
+    """
+    key, rows = chart_key(chart)
+    spec, hit = _SPECS.get_or_build(key, lambda: compile_chart(chart))
+    record_payload(name, rows, spec_bytes(spec), cached=hit)
+    # Streamlit pops the datasets out of the spec it is given
+    return copy.deepcopy(spec)
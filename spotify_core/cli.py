@@ -0,0 +1,163 @@
+"""
+Precompute summary tables for a directory of Spotify exports, one export per subdirectory of
+history files or export zips
+
+    python -m spotify_core.cli exports/ reports/ --workers 8
+
+Each export is written to reports/<export>/ as overview, top_artists, top_songs, artist_years,
+monthly_artists, monthly_tracks, sessions, a festivals ranking and one table per festival
+lineup, and reports/overview.csv collects one row per export. Each export's artist
+co-listening is saved as colisten.npz and all of them are summed into reports/colisten.npz,
+which the festival app reads from SPOTIFY_COLISTEN to recommend artists
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from spotify_core.aggregates import build_cube
+from spotify_core.colisten import CoListening
+from spotify_core.festival import LineupRegistry, lineup_files, load_lineup
+from spotify_core.ingest import expand_uploads, is_history_file, parse_files
+from spotify_core.leaderboards import artist_leaderboard, track_leaderboard
+from spotify_core.schema import concat_history
+from spotify_core.sessions import Sessions
+from spotify_core.summary import summarize_history
+
+
+def is_export_file(name: str) -> bool:
+    # History files, or the zips of a whole export (my_spotify_data.zip) as the apps accept
+    return is_history_file(name) or name.lower().endswith(".zip")
+
+
+def find_exports(directory: str) -> dict:
+    """
+    Map export name to its history files and export zips. The directory itself counts as one
+    export when it holds them directly
+    """
+    exports = {}
+    for root, _, names in os.walk(directory):
+        files = sorted(os.path.join(root, name) for name in names if is_export_file(name))
+        if files:
+            name = os.path.relpath(root, directory)
+            exports[os.path.basename(os.path.abspath(directory)) if name == "." else name] = files
+    return dict(sorted(exports.items()))
+
+
+def summary_tables(all_data: pd.DataFrame, registry: LineupRegistry) -> dict:
+    """
+    Per-user summary tables of a compact history, keyed by table name
+    """
+    summary = summarize_history(all_data)
+    cube = build_cube(summary.plays)
+    artist_years = cube.artist_years.frame
+    tables = {
+        "overview": pd.DataFrame([summary.overview()]),
+        "top_artists": summary.artist_hours.rename_axis("artistName").reset_index(),
+        "top_songs": summary.top_songs,
+        "artist_years": pd.DataFrame(
+            {
+                "artistName": cube.artists[artist_years["artist"]],
+                "year": artist_years["year"].to_numpy(),
+                "minutes": artist_years["minutes"].to_numpy(),
+                "plays": artist_years["plays"].to_numpy(),
+                "rank": cube.ranks.year_ranks[
+                    artist_years["artist"].to_numpy(),
+                    artist_years["year"].to_numpy() - cube.ranks.first_year,
+                ],
+            }
+        ),
+        "monthly_artists": artist_leaderboard(cube),
+        "monthly_tracks": track_leaderboard(cube),
+        "sessions": Sessions.from_plays(summary.plays).table,
+    }
+    matches = registry.match(all_data)
+    tables["festivals"] = matches.ranking()
+    for festival in registry.festivals:
+        match = matches.festival(festival)
+        days = match.plays[["artistName", "Day"]].drop_duplicates("artistName")
+        table = match.artist_minutes.merge(days, on="artistName", how="left")
+        tables["festival_" + festival.lower().replace(" ", "_")] = table
+    return tables
+
+
+def process_export(
+    name: str, files: list, out_dir: str, registry: LineupRegistry, hour_offset: int, fmt: str
+):
+    """
+    Parse, summarize and write one export. Returns its overview row
+    """
+    # Zips are opened in the worker, their members are read straight out of the archive
+    parsed = parse_files(expand_uploads(files), hour_offset, validate=True, workers=1)
+    frames = [frame for frame in parsed if frame is not None]
+    if not frames:
+        return {"export": name, "error": "no valid history files"}
+    all_data = concat_history(frames)
+    tables = summary_tables(all_data, registry)
+
+    target = os.path.join(out_dir, name)
+    os.makedirs(target, exist_ok=True)
+    CoListening.from_plays(all_data).save(os.path.join(target, "colisten.npz"))
+    for table, frame in tables.items():
+        path = os.path.join(target, f"{table}.{fmt}")
+        if fmt == "parquet":
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_csv(path, index=False)
+    return {"export": name, **tables["overview"].iloc[0].to_dict()}
+
+
+def _process_safely(*args):
+    try:
+        return process_export(*args)
+    except Exception as e:
+        return {"export": args[0], "error": f"{type(e).__name__}: {e}"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("exports", help="directory of exports, one per subdirectory")
+    parser.add_argument("out", help="directory to write the summary tables to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--hour-offset", type=int, default=16)
+    festivals = lineup_files()
+    parser.add_argument(
+        "--festival", nargs="*", default=list(festivals), choices=list(festivals), dest="festivals"
+    )
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    args = parser.parse_args(argv)
+
+    exports = find_exports(args.exports)
+    registry = LineupRegistry.build(
+        {festival: load_lineup(festivals[festival]) for festival in args.festivals}
+    )
+    jobs = [
+        (name, files, args.out, registry, args.hour_offset, args.format)
+        for name, files in exports.items()
+    ]
+    if args.workers > 1 and len(jobs) > 1:
+        # One export per task, each export is parsed serially inside its worker
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            rows = list(pool.map(_process_safely, *zip(*jobs)))
+    else:
+        rows = [_process_safely(*job) for job in jobs]
+
+    os.makedirs(args.out, exist_ok=True)
+    overview = pd.DataFrame(rows).convert_dtypes()
+    overview.to_csv(os.path.join(args.out, "overview.csv"), index=False)
+    failed = overview["error"].notna().sum() if "error" in overview else 0
+    matrices = [
+        os.path.join(args.out, name, "colisten.npz")
+        for name in exports
+        if os.path.exists(os.path.join(args.out, name, "colisten.npz"))
+    ]
+    if matrices:
+        colisten = CoListening.merge([CoListening.load(path) for path in matrices])
+        colisten.save(os.path.join(args.out, "colisten.npz"))
+    print(f"{len(rows) - failed} of {len(rows)} exports summarized into {args.out}")
+
+
+if __name__ == "__main__":
+    main()
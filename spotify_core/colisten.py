@@ -0,0 +1,218 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from spotify_core.instrument import span
+from spotify_core.sessions import SESSION_GAP_MINUTES, Sessions, wall_clock
+from spotify_core.summary import MIN_PLAY_MS
+
+# Two artists are co-listened when first played within this many artists of each other in
+# one session. Pairs grow with the window, not with the square of a session's artists
+COLISTEN_WINDOW = 10
+# Most listened artists that recommendations are scored against
+SEED_ARTISTS = 25
+# Co-listening counts merged from many exports by the CLI, added to the listener's own
+COLISTEN_PATH = os.environ.get("SPOTIFY_COLISTEN")
+
+
+def pair_counts(sessions: np.ndarray, artists: np.ndarray, n_artists: int, window: int):
+    """
+    Sessions in which each pair of artists was first played within `window` artists of each
+    other, for plays in time order. Returns the (lower, higher) artist codes and count of
+    every pair, each pair once, and the number of sessions of every artist
+    """
+    # First play of every artist in every session, kept in time order. A stable sort of the
+    # (session, artist) keys finds them several times faster than hashing
+    keys = sessions * n_artists + artists
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    new = np.ones(len(keys), dtype=bool)
+    np.not_equal(keys[1:], keys[:-1], out=new[1:])
+    first = np.zeros(len(keys), dtype=bool)
+    first[order[new]] = True
+    sessions, artists = sessions[first], artists[first]
+    artist_sessions = np.bincount(artists, minlength=n_artists)
+    keys = []
+    for offset in range(1, window + 1):
+        same = sessions[:-offset] == sessions[offset:]
+        a, b = artists[:-offset][same], artists[offset:][same]
+        keys.append(np.minimum(a, b) * n_artists + np.maximum(a, b))
+    keys, counts = np.unique(np.concatenate(keys), return_counts=True)
+    lower, higher = np.divmod(keys, n_artists)
+    return lower, higher, counts, artist_sessions
+
+
+@dataclass
+class CoListening:
+    """
+    Symmetric artist x artist co-listening counts in CSR form: the artists played near artist
+    i are `indices[indptr[i]:indptr[i + 1]]`, with the number of sessions in `counts`.
+    `sessions` is the number of sessions each artist was played in. Only pairs that occur are
+    stored, so memory follows the history rather than the square of its artists
+    """
+
+    artists: pd.Index
+    indptr: np.ndarray
+    indices: np.ndarray
+    counts: np.ndarray
+    sessions: np.ndarray
+
+    @classmethod
+    def from_pairs(cls, artists: pd.Index, lower, higher, counts, sessions) -> "CoListening":
+        """
+        Matrix of the output of `pair_counts`, mirrored so every row lists all its neighbours
+        """
+        n = len(artists)
+        # Row i holds its pairs with lower artists, then those with higher ones. The pairs
+        # come sorted by (lower, higher), so only the mirrored half needs a sort
+        below = np.bincount(higher, minlength=n)
+        above = np.bincount(lower, minlength=n)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(below + above, out=indptr[1:])
+        indices = np.empty(2 * len(lower), dtype=np.int32)
+        data = np.empty(2 * len(lower), dtype=np.int32)
+
+        mirrored = np.argsort(higher, kind="stable")
+        rows = higher[mirrored]
+        starts = np.cumsum(below) - below
+        positions = indptr[rows] + np.arange(len(rows)) - starts[rows]
+        indices[positions], data[positions] = lower[mirrored], counts[mirrored]
+        starts = np.cumsum(above) - above
+        positions = indptr[lower] + below[lower] + np.arange(len(lower)) - starts[lower]
+        indices[positions], data[positions] = higher, counts
+        return cls(artists, indptr, indices, data, np.asarray(sessions, dtype=np.int32))
+
+    @classmethod
+    def from_plays(
+        cls,
+        plays: pd.DataFrame,
+        gap_minutes: float = SESSION_GAP_MINUTES,
+        window: int = COLISTEN_WINDOW,
+        min_play_ms: int = MIN_PLAY_MS,
+    ) -> "CoListening":
+        """
+        Co-listening of a compact history, skipped plays and plays without an artist (podcast
+        episodes) left out
+        """
+        plays = plays[(plays["msPlayed"].to_numpy() > min_play_ms) & plays["artistName"].notna()]
+        with span("colisten", rows=len(plays)):
+            names = plays["artistName"].astype("category")
+            artists = names.cat.codes.to_numpy().astype(np.int64)
+            n = len(names.cat.categories)
+            session_ids = Sessions.from_plays(plays, gap_minutes).ids
+            end_ms = wall_clock(plays["endTime"]).astype(np.int64)
+            if len(end_ms) > 1 and (end_ms[1:] < end_ms[:-1]).any():
+                order = np.argsort(end_ms, kind="stable")
+                session_ids, artists = session_ids[order], artists[order]
+            pairs = pair_counts(session_ids, artists, n, window)
+            return cls.from_pairs(names.cat.categories, *pairs)
+
+    @classmethod
+    def merge(cls, matrices: list) -> "CoListening":
+        """
+        Sum the counts of several histories over the union of their artists
+        """
+        artists = pd.Index(
+            pd.unique(np.concatenate([m.artists.to_numpy(dtype=object) for m in matrices]))
+        )
+        n = len(artists)
+        keys, counts, sessions = [], [], np.zeros(n, dtype=np.int64)
+        for m in matrices:
+            codes = artists.get_indexer(m.artists)
+            rows = codes[np.repeat(np.arange(len(m.artists)), np.diff(m.indptr))]
+            cols = codes[m.indices]
+            upper = rows < cols
+            keys.append(rows[upper] * n + cols[upper])
+            counts.append(m.counts[upper])
+            sessions[codes] += m.sessions
+        keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        summed = np.bincount(inverse, weights=np.concatenate(counts), minlength=len(keys))
+        lower, higher = np.divmod(keys, n)
+        return cls.from_pairs(artists, lower, higher, summed.astype(np.int64), sessions)
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path,
+            artists=self.artists.to_numpy(dtype=str),
+            indptr=self.indptr,
+            indices=self.indices,
+            counts=self.counts,
+            sessions=self.sessions,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "CoListening":
+        with np.load(path) as data:
+            return cls(
+                pd.Index(data["artists"].astype(object)),
+                data["indptr"],
+                data["indices"],
+                data["counts"],
+                data["sessions"],
+            )
+
+    @property
+    def pairs(self) -> int:
+        return len(self.indices) // 2
+
+    def neighbours(self, artist: str) -> pd.Series:
+        """
+        Co-listening count of every artist played near `artist`, most first
+        """
+        code = self.artists.get_loc(artist)
+        start, stop = self.indptr[code], self.indptr[code + 1]
+        counts = pd.Series(
+            self.counts[start:stop], index=self.artists[self.indices[start:stop]], name="sessions"
+        )
+        return counts.sort_values(ascending=False, kind="stable")
+
+    def recommend(self, seeds: pd.Series) -> pd.DataFrame:
+        """
+        Score every artist by its cosine similarity to the `seeds` (artist name -> weight),
+        counting sessions as the vectors. Returns one row per artist played near a seed,
+        with its score and the seed that contributes most, seeds themselves left out
+        """
+        codes = self.artists.get_indexer(seeds.index)
+        known = codes >= 0
+        codes, weights = codes[known], seeds.to_numpy(dtype=np.float64)[known]
+        starts, lengths = self.indptr[codes], np.diff(self.indptr)[codes]
+        # Expand the seed rows into (seed, neighbour) entries without densifying
+        ends = np.cumsum(lengths)
+        positions = np.arange(ends[-1] if len(ends) else 0) - np.repeat(
+            ends - lengths - starts, lengths
+        )
+        seed = np.repeat(np.arange(len(codes)), lengths)
+        neighbour = self.indices[positions]
+        similarity = self.counts[positions] / np.sqrt(
+            self.sessions[codes][seed].astype(np.float64) * self.sessions[neighbour]
+        )
+        contribution = similarity * weights[seed]
+
+        score = np.bincount(neighbour, weights=contribution, minlength=len(self.artists))
+        # Seed with the largest contribution to each neighbour
+        order = np.lexsort((-contribution, neighbour))
+        top = (
+            order[np.r_[True, neighbour[order][1:] != neighbour[order][:-1]]]
+            if len(order)
+            else order
+        )
+        result = pd.DataFrame(
+            {
+                "artistName": self.artists[neighbour[top]].astype(object),
+                "score": score[neighbour[top]],
+                "because": self.artists[codes[seed[top]]].astype(object),
+            }
+        )
+        result = result[~np.isin(neighbour[top], codes)]
+        return result.sort_values("score", ascending=False, kind="stable", ignore_index=True)
+
+
+def seed_artists(plays: pd.DataFrame, n: int = SEED_ARTISTS) -> pd.Series:
+    """
+    The `n` most listened artists of a compact history, weighted by share of their listening
+    """
+    minutes = plays.groupby("artistName", observed=True)["msPlayed"].sum().nlargest(n)
+    minutes.index = minutes.index.astype(object)
+    return minutes / minutes.sum()
@@ -0,0 +1,103 @@
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+# Every column starts on a boundary of this many bytes, so each one maps as an aligned array
+ALIGNMENT = 64
+_LENGTH = struct.Struct("<Q")
+
+
+def _padding(offset: int) -> int:
+    return -offset % ALIGNMENT
+
+
+def _column_spec(name: str, values: pd.Series):
+    """
+    The header entry and fixed-width array of a column, or a TypeError for columns that have
+    no fixed-width layout
+    """
+    dtype = values.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        categories = dtype.categories
+        if len(categories) and categories.inferred_type != "string":
+            raise TypeError(f"{name}: only string categories can be shared")
+        spec = {"kind": "category", "categories": categories.tolist(), "ordered": dtype.ordered}
+        return spec, values.cat.codes.to_numpy()
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        # Stored as UTC, the zone is reapplied when the file is opened
+        spec = {"kind": "datetime", "tz": str(dtype.tz), "unit": dtype.unit}
+        return spec, values.array.tz_convert("UTC").asi8
+    if isinstance(dtype, np.dtype) and dtype.kind in "biufmM":
+        return {"kind": "array"}, values.to_numpy()
+    raise TypeError(f"{name}: {dtype} columns can not be shared")
+
+
+def write_columns(path: str, frame: pd.DataFrame):
+    """
+    Write a frame as one file of fixed-width columns: each column's values back to back, then a
+    JSON footer with the row count, the dtype and offset of every column and the string table
+    of every categorical. Categoricals are stored as their codes, so names are held once in the
+    footer however many rows use them
+    """
+    columns = []
+    with open(path, "wb") as fp:
+        position = 0
+        for name in frame.columns:
+            spec, values = _column_spec(name, frame[name])
+            values = np.ascontiguousarray(values)
+            fp.write(b"\0" * _padding(position))
+            position += _padding(position)
+            columns.append({"name": name, "dtype": values.dtype.str, "offset": position, **spec})
+            fp.write(values.tobytes())
+            position += values.nbytes
+        footer = json.dumps({"rows": len(frame), "columns": columns}).encode()
+        fp.write(footer)
+        fp.write(_LENGTH.pack(len(footer)))
+
+
+def open_columns(path: str) -> pd.DataFrame:
+    """
+    Open a file of `write_columns` as a frame whose columns are read-only views of a shared
+    memory mapping. Processes that open the same file share its pages, so each holds only the
+    string tables and, for zoned timestamps, the reapplied zone
+    """
+    with open(path, "rb") as fp:
+        fp.seek(-_LENGTH.size, 2)
+        (length,) = _LENGTH.unpack(fp.read(_LENGTH.size))
+        fp.seek(-_LENGTH.size - length, 2)
+        footer = json.loads(fp.read(length))
+    mapping = np.memmap(path, dtype=np.uint8, mode="r")
+    rows = footer["rows"]
+    columns = {}
+    for spec in footer["columns"]:
+        # A plain array over the mapping, so the frame holds ordinary numpy columns
+        values = np.ndarray(rows, np.dtype(spec["dtype"]), buffer=mapping, offset=spec["offset"])
+        if spec["kind"] == "category":
+            columns[spec["name"]] = pd.Categorical.from_codes(
+                values, spec["categories"], ordered=spec["ordered"]
+            )
+        elif spec["kind"] == "datetime":
+            times = pd.DatetimeIndex(values.view(f"datetime64[{spec['unit']}]"), copy=False)
+            columns[spec["name"]] = times.tz_localize("UTC").tz_convert(spec["tz"])
+        else:
+            columns[spec["name"]] = values
+    return pd.DataFrame(columns, copy=False)
+
+
+def mapped_bytes(frame: pd.DataFrame) -> int:
+    """
+    Bytes of a frame's columns that are views of a memory mapping rather than process memory
+    """
+    total = 0
+    for name in frame.columns:
+        values = frame[name].array
+        values = values.codes if isinstance(values, pd.Categorical) else values.to_numpy()
+        base = values
+        while isinstance(base, np.ndarray):
+            if isinstance(base, np.memmap):
+                total += values.nbytes
+                break
+            base = base.base
+    return total
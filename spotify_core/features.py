@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+DAYS_OF_WEEK = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+
+
+def iso_calendar(days: np.ndarray):
+    """
+    ISO year, ISO week and weekday (Monday=0) for an array of days since the epoch
+    """
+    # 1970-01-01 was a Thursday
+    dow = (days + 3) % 7
+    # The ISO year is the year of the Thursday in the same week
+    thursday = days - dow + 3
+    year_start = thursday.astype("datetime64[D]").astype("datetime64[Y]")
+    iso_year = year_start.astype(np.int64) + 1970
+    iso_week = (thursday - year_start.astype("datetime64[D]").astype(np.int64)) // 7 + 1
+    return iso_year, iso_week, dow
+
+
+def iso_to_date(iso_year, iso_week, dow) -> np.ndarray:
+    """
+    Inverse of `iso_calendar`, the datetime64[D] dates for ISO year, week and weekday arrays
+    """
+    # Widen first so compact int8/int16 calendar columns do not overflow
+    iso_year, iso_week, dow = (np.asarray(a, dtype=np.int64) for a in (iso_year, iso_week, dow))
+    jan4 = (iso_year - 1970).astype("datetime64[Y]").astype("datetime64[D]") + 3
+    week1_monday = jan4 - (jan4.astype(np.int64) + 3) % 7
+    return week1_monday + (iso_week - 1) * 7 + dow
+
+
+def add_features(all_data: pd.DataFrame, hour_offset: int = 0) -> pd.DataFrame:
+    """
+    Add date, weekday, hour, ISO week/year and minutes played to a renamed history frame
+    using only vectorized datetime64 arithmetic. The columns are added to a shallow copy, cached
+    frames are shared between loads with different hour offsets
+    """
+    all_data = all_data.copy(deep=False)
+    end_time = all_data["endTime"]
+    if hour_offset:
+        end_time = end_time + pd.Timedelta(hours=hour_offset)
+    all_data["endTime"] = end_time
+
+    # Work on the wall-clock time so timezone-aware endsong timestamps give local calendar fields
+    if end_time.dt.tz is not None:
+        end_time = end_time.dt.tz_localize(None)
+    minutes = end_time.to_numpy(dtype="datetime64[m]").astype(np.int64)
+    days = minutes // (24 * 60)
+    iso_year, iso_week, dow = iso_calendar(days)
+
+    all_data["date"] = days.astype("datetime64[D]").astype("datetime64[ns]")
+    all_data["dow"] = dow
+    all_data["day_of_week_str"] = pd.Categorical.from_codes(dow, DAYS_OF_WEEK, ordered=True)
+    all_data["time"] = (minutes % (24 * 60)) // 60
+    all_data["week"] = iso_week
+    all_data["year"] = iso_year
+    all_data["minutesPlayed"] = all_data["msPlayed"] / 60000
+    return all_data
@@ -0,0 +1,272 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from spotify_core.instrument import span
+from spotify_core.lineup import LineupIndex, normalize_names
+
+# Lineups bundled with the repo
+_LINEUP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FESTIVALS = {
+    "Coachella": os.path.join(_LINEUP_DIR, "coachella2023.csv"),
+    "Outside Lands": os.path.join(_LINEUP_DIR, "outsidelands2023.csv"),
+}
+# More lineup CSVs in either layout, one festival per file named after the file
+LINEUP_DIR = os.environ.get("SPOTIFY_LINEUP_DIR")
+MIN_FESTIVAL_MINUTES = 1
+
+
+@dataclass
+class FestivalMatch:
+    """
+    Plays of the artists on a lineup, with the day each one is playing
+    """
+
+    plays: pd.DataFrame
+    artist_minutes: pd.DataFrame
+
+    @property
+    def top_artist(self):
+        return self.artist_minutes["artistName"].iloc[0] if len(self.artist_minutes) else None
+
+    def artist_days(self) -> pd.DataFrame:
+        """
+        One row per matched artist and day they play, most listened first. `artists` is the
+        artist count of the row, so day totals are a plain stacked sum
+        """
+        days = self.plays[["artistName", "Day", "rank"]].drop_duplicates()
+        days = days.sort_values("rank", kind="stable").reset_index(drop=True)
+        # Plain string labels, the chart of a few dozen rows does not need a dictionary
+        days["artistName"] = days["artistName"].astype(object)
+        days["artists"] = 1
+        return days
+
+
+def load_lineup(path) -> pd.DataFrame:
+    """
+    Read a lineup CSV into `Artist` and `Day` columns.
+
+    Lineups are either an Artist,Day table or a single header row of artist names
+    """
+    lineup = pd.read_csv(path)
+    if "Artist" in lineup.columns:
+        return lineup
+    lineup = pd.DataFrame(lineup.columns)
+    lineup.columns = ["Artist"]
+    lineup["Day"] = "F"
+    lineup["Artist"] = lineup["Artist"].str.strip()
+    return lineup.drop_duplicates().reset_index(drop=True)
+
+
+def lineup_files(directory: str = LINEUP_DIR) -> dict:
+    """
+    Festival name -> lineup CSV for the bundled lineups and every CSV in `directory`
+    """
+    festivals = dict(FESTIVALS)
+    if directory:
+        for name in sorted(os.listdir(directory)):
+            if name.lower().endswith(".csv"):
+                festivals[os.path.splitext(name)[0]] = os.path.join(directory, name)
+    return festivals
+
+
+@lru_cache(maxsize=16)
+def lineup_index(path) -> LineupIndex:
+    """
+    The match index of a lineup CSV, built once per process
+    """
+    return LineupIndex.build(load_lineup(path))
+
+
+def match_artists(artists: pd.Series, index: LineupIndex):
+    """
+    Lineup row of every play, -1 for artists not on the lineup, and the name each lineup row
+    is shown under: the listener's most played spelling of it. Names are matched once per
+    distinct artist, not per play
+    """
+    artists = artists.astype("category")
+    names = artists.cat.categories
+    codes = artists.cat.codes.to_numpy()
+    matched = index.match(names)["row"].to_numpy()
+    rows = np.where(codes >= 0, matched[np.maximum(codes, 0)], -1)
+
+    plays = np.bincount(codes[codes >= 0], minlength=len(names))
+    spellings = (
+        pd.DataFrame({"row": matched, "plays": plays, "name": names.astype(object)})
+        .query("row >= 0")
+        .sort_values("plays", ascending=False, kind="stable")
+        .drop_duplicates("row")
+    )
+    display = np.full(len(index.lineup), None, dtype=object)
+    display[spellings["row"].to_numpy()] = spellings["name"].to_numpy()
+    return rows, display
+
+
+@dataclass
+class LineupRegistry:
+    """
+    Any number of lineups folded into one index of acts, so a history is matched against all
+    of them at once. Bookings of the same act at several festivals share one act
+    """
+
+    # Festival, Artist, Day and act id of every booking
+    bookings: pd.DataFrame
+    # Index over the distinct acts, an act's id is its row in `index.lineup`
+    index: LineupIndex
+
+    @classmethod
+    def build(cls, lineups: dict) -> "LineupRegistry":
+        """
+        Registry of festival name -> lineup frame
+        """
+        bookings = pd.concat(
+            [lineup.assign(Festival=festival) for festival, lineup in lineups.items()],
+            ignore_index=True,
+        )
+        acts, _ = pd.factorize(normalize_names(bookings["Artist"]))
+        bookings["act"] = acts
+        index = LineupIndex.build(bookings.drop_duplicates("act")[["Artist"]])
+        return cls(bookings, index)
+
+    @property
+    def festivals(self) -> list:
+        return list(self.bookings["Festival"].unique())
+
+    def match(
+        self, all_data: pd.DataFrame, min_minutes: float = MIN_FESTIVAL_MINUTES
+    ) -> "FestivalMatches":
+        """
+        Match a compact history against every lineup: names are matched once per distinct
+        artist and listening is totalled once per act, whatever the number of festivals
+        """
+        with span("lineup_join", rows=len(all_data)) as s:
+            acts, names = match_artists(all_data["artistName"], self.index)
+            keep = acts >= 0
+            all_data, acts = all_data[keep].reset_index(drop=True), acts[keep]
+            s.rows = len(all_data)
+
+        with span("artist_totals", rows=len(all_data)):
+            ms = np.bincount(
+                acts,
+                weights=all_data["msPlayed"].to_numpy(dtype=np.float64),
+                minlength=len(self.index.lineup),
+            )
+        return FestivalMatches(self, all_data, acts, names, ms, min_minutes)
+
+
+@lru_cache(maxsize=4)
+def festival_registry(directory: str = LINEUP_DIR) -> LineupRegistry:
+    """
+    Registry of the bundled lineups and those in `directory`, built once per process
+    """
+    festivals = lineup_files(directory)
+    return LineupRegistry.build({name: load_lineup(path) for name, path in festivals.items()})
+
+
+@dataclass
+class FestivalMatches:
+    """
+    A history matched against every lineup of a registry. `acts` is the act of each play,
+    `names` the name each act is shown under and `ms` the time listened to each act
+    """
+
+    registry: LineupRegistry
+    plays: pd.DataFrame
+    acts: np.ndarray
+    names: np.ndarray
+    ms: np.ndarray
+    min_minutes: float
+
+    def booked(self, festival: str = None) -> pd.DataFrame:
+        """
+        Bookings of the acts listened to for more than `min_minutes`, for one festival or all
+        """
+        bookings = self.registry.bookings
+        if festival is not None:
+            # An act billed on two days of one festival keeps its first day
+            bookings = bookings[bookings["Festival"] == festival].drop_duplicates("act")
+        bookings = bookings[self.ms[bookings["act"].to_numpy()] > self.min_minutes * 60000]
+        return bookings.assign(
+            artistName=self.names[bookings["act"].to_numpy()],
+            minutes=self.ms[bookings["act"].to_numpy()] / 60000,
+        )
+
+    def ranking(self) -> pd.DataFrame:
+        """
+        One row per festival, the one with the most hours of the listener's music first
+        """
+        with span("festival_rank"):
+            booked = self.booked().sort_values("minutes", ascending=False, kind="stable")
+            ranking = booked.groupby("Festival", sort=False).agg(
+                Artists=("act", "nunique"),
+                Hours=("minutes", "sum"),
+                **{"Top Artist": ("artistName", "first")},
+            )
+            ranking["Hours"] = ranking["Hours"] / 60
+            lineup = self.registry.bookings.groupby("Festival", sort=False)["act"].nunique()
+            ranking = ranking.reindex(lineup.index)
+            ranking["Artists"] = ranking["Artists"].fillna(0).astype(int)
+            ranking["Hours"] = ranking["Hours"].fillna(0.0)
+            ranking["Lineup Share"] = ranking["Artists"] / lineup
+            ranking = ranking.sort_values(["Hours", "Artists"], ascending=False, kind="stable")
+            ranking = ranking.reset_index()
+            ranking.insert(0, "Rank", np.arange(1, len(ranking) + 1))
+            return ranking
+
+    def recommendations(self, festival: str, colisten, seeds: pd.Series) -> pd.DataFrame:
+        """
+        Acts on one lineup the listener has not matched yet, ranked by co-listening with their
+        top artists in a `CoListening` matrix (artist name -> weight `seeds`). Acts the matrix
+        has never seen have no score and are left out
+        """
+        with span("recommend", rows=len(colisten.artists)) as s:
+            scores = colisten.recommend(seeds)
+            scores["act"] = self.registry.index.match(scores["artistName"])["row"].to_numpy()
+            # Spellings of one act keep their best score
+            scores = scores[scores["act"] >= 0].drop_duplicates("act")
+            bookings = self.registry.bookings
+            lineup = bookings[bookings["Festival"] == festival].drop_duplicates("act")
+            unheard = lineup[self.ms[lineup["act"].to_numpy()] <= self.min_minutes * 60000]
+            picks = unheard.merge(scores[["act", "score", "because"]], on="act")
+            s.rows = len(picks)
+            return picks.sort_values("score", ascending=False, kind="stable", ignore_index=True)[
+                ["Artist", "Day", "score", "because"]
+            ]
+
+    def festival(self, festival: str) -> FestivalMatch:
+        """
+        Plays of the artists on one lineup, sliced from the shared match
+        """
+        with span("festival_slice", rows=len(self.plays)) as s:
+            booked = self.booked(festival)
+            slot = np.full(len(self.ms), -1, dtype=np.int64)
+            slot[booked["act"].to_numpy()] = np.arange(len(booked))
+            slot = slot[self.acts]
+            keep = slot >= 0
+            plays, slot = self.plays[keep].reset_index(drop=True), slot[keep]
+
+            names = booked["artistName"].to_numpy()
+            plays["artistName"] = pd.Categorical.from_codes(slot, names)
+            plays["Artist"] = booked["Artist"].to_numpy()[slot]
+            plays["Day"] = booked["Day"].to_numpy()[slot]
+            plays["Total Minutes"] = booked["minutes"].to_numpy()[slot]
+            plays["rank"] = plays["Total Minutes"].rank(ascending=False)
+            artist_minutes = pd.DataFrame(
+                {"artistName": names, "Total Minutes": booked["minutes"].to_numpy()}
+            ).sort_values("Total Minutes", ascending=False, kind="stable", ignore_index=True)
+            s.rows = len(plays)
+        return FestivalMatch(plays=plays, artist_minutes=artist_minutes)
+
+
+def match_lineup(
+    all_data: pd.DataFrame, lineup: pd.DataFrame, min_minutes: float = MIN_FESTIVAL_MINUTES
+) -> FestivalMatch:
+    """
+    Keep the plays of a compact history whose artist is on one lineup, with the lineup's
+    `Artist` and `Day` joined on
+    """
+    registry = LineupRegistry.build({"lineup": lineup})
+    return registry.match(all_data, min_minutes).festival("lineup")
@@ -0,0 +1,53 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from spotify_core.features import DAYS_OF_WEEK, iso_to_date
+
+# The chart shows weeks 0-52, ISO week 53 falls off the end as it always has
+WEEKS = 53
+BUCKET_LABELS = ["0 min", "1-5 min", "5-15 min", "15-60 min", "60+ min"]
+BUCKET_BINS = [-1, 1, 5, 15, 60, 60 * 60 * 24]
+
+
+@lru_cache(maxsize=64)
+def date_axis(year: int) -> np.ndarray:
+    """
+    Dates of every cell of the week x weekday grid for an ISO year, flattened week-major.
+    Day index i of the grid is `date_axis(year)[i]`
+    """
+    week, dow = np.divmod(np.arange(WEEKS * 7), 7)
+    return iso_to_date(np.full(WEEKS * 7, year), week, dow)
+
+
+def heatmap_grid(days: pd.DataFrame, year: int) -> pd.DataFrame:
+    """
+    Minutes played in every cell of the 53 x 7 grid for a year, bucketed for the heatmap.
+
+    `days` has one or more rows per listened day with `week`, `dow` and `minutes` columns
+    """
+    year = int(year)
+    week = days["week"].to_numpy(dtype=np.int64)
+    dow = days["dow"].to_numpy(dtype=np.int64)
+    in_grid = week < WEEKS
+    # Day index of each play from the Monday of week 0
+    day_index = week[in_grid] * 7 + dow[in_grid]
+    minutes = np.bincount(
+        day_index,
+        weights=days["minutes"].to_numpy(dtype=np.float64)[in_grid],
+        minlength=WEEKS * 7,
+    )
+
+    grid_week, grid_dow = np.divmod(np.arange(WEEKS * 7), 7)
+    grid = pd.DataFrame(
+        {
+            "week": grid_week,
+            "day_of_week_str": pd.Categorical.from_codes(grid_dow, DAYS_OF_WEEK, ordered=True),
+            "year": year,
+            "minutesPlayed": minutes,
+        }
+    )
+    grid["min_bucket"] = pd.cut(grid["minutesPlayed"], bins=BUCKET_BINS, labels=BUCKET_LABELS)
+    grid["date"] = date_axis(year).astype("datetime64[ns]")
+    return grid
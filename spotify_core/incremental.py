@@ -0,0 +1,192 @@
+import numpy as np
+
+from spotify_core.aggregates import (
+    DAY_KEYS,
+    TRACK_KEYS,
+    PlayFragment,
+    cube_from_partials,
+    merge_partials,
+)
+from spotify_core.cache import file_digest, load_histories
+from spotify_core.ingest import INGEST_WORKERS
+from spotify_core.instrument import span
+from spotify_core.leaderboards import artist_leaderboard, track_leaderboard
+from spotify_core.queries import QUERY_ENGINE, query_engine
+from spotify_core.sessions import SESSION_GAP_MINUTES, SESSION_START_REASONS, Sessions, wall_clock
+from spotify_core.summary import MIN_ARTIST_MINUTES, MIN_PLAY_MS, filter_plays, summarize_tracks
+
+
+class IncrementalHistory:
+    """
+    An upload held as one fragment per file plus the partial aggregates summed over them.
+
+    `sync` parses only the files that were added and drops the ones that were removed, then
+    adds the new partials to the running sums. The summary and cube are rebuilt from the sums,
+    so updating costs the new file plus the size of the aggregates, not the whole history
+    """
+
+    def __init__(
+        self,
+        hour_offset: int = 0,
+        min_play_ms: int = MIN_PLAY_MS,
+        min_artist_minutes: float = MIN_ARTIST_MINUTES,
+        workers: int = INGEST_WORKERS,
+        cache=None,
+        session_gap: float = SESSION_GAP_MINUTES,
+        engine: str = QUERY_ENGINE,
+    ):
+        self.hour_offset = hour_offset
+        self.min_play_ms = min_play_ms
+        self.min_artist_minutes = min_artist_minutes
+        self.workers = workers
+        self.cache = cache
+        self.session_gap = session_gap
+        self.engine = engine
+        # Content hash -> fragment, in upload order
+        self.fragments = {}
+        self.days = None
+        self.tracks = None
+        self._summary = None
+        self._sessions = None
+        # Session filter -> cube, None for every play
+        self._cubes = {}
+        # Session filter -> drill-down queries of the query engine
+        self._queries = {}
+        # (session filter, "artists" or "tracks", window) -> leaderboard
+        self._leaderboards = {}
+
+    def sync(self, files: list) -> bool:
+        """
+        Match the fragments to `files`. Returns whether anything changed. A file that cannot
+        be read raises HistoryFileError and leaves the history as it was
+        """
+        wanted = {file_digest(file): file for file in files}
+        added = [digest for digest in wanted if digest not in self.fragments]
+        removed = [digest for digest in self.fragments if digest not in wanted]
+        if not added and not removed:
+            return False
+
+        with span("add_files", rows=len(added)):
+            frames = load_histories(
+                [wanted[digest] for digest in added],
+                hour_offset=self.hour_offset,
+                workers=self.workers,
+                cache=self.cache,
+            )
+            new = [PlayFragment.build(filter_plays(frame, self.min_play_ms)) for frame in frames]
+
+        fragments = {**self.fragments, **dict(zip(added, new))}
+        self.fragments = {digest: fragments[digest] for digest in wanted}
+        with span("merge_partials", rows=len(self.fragments)):
+            if not self.fragments:
+                self.days = self.tracks = None
+            elif removed or self.days is None:
+                # Sums cannot be taken apart, so a removal re-sums the remaining partials
+                parts = list(self.fragments.values())
+                self.days = merge_partials([f.days for f in parts], ["artistName"] + DAY_KEYS)
+                self.tracks = merge_partials([f.tracks for f in parts], TRACK_KEYS)
+            else:
+                self.days = merge_partials(
+                    [self.days] + [f.days for f in new], ["artistName"] + DAY_KEYS
+                )
+                self.tracks = merge_partials([self.tracks] + [f.tracks for f in new], TRACK_KEYS)
+        self._summary = self._sessions = None
+        self._cubes = {}
+        self._queries = {}
+        self._leaderboards = {}
+        return True
+
+    def summary(self):
+        if self._summary is None and self.tracks is not None:
+            self._summary = summarize_tracks(self.tracks, self.min_artist_minutes)
+        return self._summary
+
+    def sessions(self) -> Sessions:
+        """
+        Listening sessions over the plays of every fragment. Sessions run across file
+        boundaries, so they are found on the whole history rather than per file
+        """
+        if self._sessions is None and self.fragments:
+            names = self.days["artistName"].cat.categories
+            frames = [fragment.plays.frame for fragment in self.fragments.values()]
+            # Plays without an artist have code -1, which the appended -1 keeps as none
+            artists = [
+                np.append(names.get_indexer(fragment.artists), -1)[frame["artist"].to_numpy()]
+                for fragment, frame in zip(self.fragments.values(), frames)
+            ]
+            starts = None
+            if any("reason_start" in frame.columns for frame in frames):
+                starts = np.concatenate(
+                    [
+                        (
+                            frame["reason_start"].isin(SESSION_START_REASONS).to_numpy()
+                            if "reason_start" in frame.columns
+                            else np.zeros(len(frame), dtype=bool)
+                        )
+                        for frame in frames
+                    ]
+                )
+            self._sessions = Sessions.build(
+                np.concatenate([wall_clock(frame["endTime"]) for frame in frames]),
+                np.concatenate([frame["msPlayed"].to_numpy() for frame in frames]),
+                np.concatenate(artists),
+                starts,
+                self.session_gap,
+            )
+        return self._sessions
+
+    def _select(self, mask) -> list:
+        """
+        The fragments cut down to the plays in `mask`, all of them for None
+        """
+        fragments = list(self.fragments.values())
+        if mask is None:
+            return fragments
+        with span("session_filter", rows=int(mask.sum())):
+            sizes = np.cumsum([len(f.plays.frame) for f in fragments])[:-1]
+            return [f.select(m) for f, m in zip(fragments, np.split(mask, sizes))]
+
+    def cube(self, sessions: str = None):
+        """
+        The artist cube of every play, or of the plays in the sessions of a SESSION_FILTERS
+        entry. Each filtered cube is built once per upload
+        """
+        mask = None if sessions is None or self.days is None else self.sessions().mask(sessions)
+        key = None if mask is None else sessions
+        if key not in self._cubes and self.days is not None:
+            fragments = self._select(mask)
+            days, tracks = self.days, self.tracks
+            if mask is not None:
+                days = merge_partials([f.days for f in fragments], ["artistName"] + DAY_KEYS)
+                tracks = merge_partials([f.tracks for f in fragments], TRACK_KEYS)
+            self._cubes[key] = cube_from_partials(
+                days, tracks, fragments, min_artist_ms=self.min_artist_minutes * 60000
+            )
+        return self._cubes.get(key)
+
+    def queries(self, sessions: str = None):
+        """
+        The drill-down queries over the plays of `sessions`, answered by the query engine. The
+        pandas engine is the cube, the others load the plays of the fragments without it
+        """
+        if sessions not in self._queries and self.days is not None:
+            if self.engine == "pandas":
+                queries = self.cube(sessions)
+            else:
+                mask = None if sessions is None else self.sessions().mask(sessions)
+                queries = query_engine(
+                    self._select(mask), self.engine, self.min_artist_minutes * 60000
+                )
+            self._queries[sessions] = queries
+        return self._queries.get(sessions)
+
+    def leaderboard(self, kind: str, window: int = 1, sessions: str = None):
+        """
+        Monthly top artists or tracks of the plays of `sessions`, answered by the query engine,
+        see `artist_leaderboard`
+        """
+        key = (sessions, kind, window)
+        if key not in self._leaderboards and self.days is not None:
+            build = artist_leaderboard if kind == "artists" else track_leaderboard
+            self._leaderboards[key] = build(self.queries(sessions), window=window)
+        return self._leaderboards.get(key)
@@ -0,0 +1,45 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class ArtistIndex:
+    """
+    A frame sorted by artist code then year, with `offsets[code]:offsets[code + 1]` giving the
+    contiguous rows of each artist. Selecting an artist is a slice rather than a scan.
+    """
+
+    frame: pd.DataFrame
+    offsets: np.ndarray
+
+    @classmethod
+    def build(cls, frame: pd.DataFrame, n_artists: int, column: str = "artist"):
+        keys = [column, "year"] if "year" in frame.columns else [column]
+        frame = frame.sort_values(keys, kind="stable", ignore_index=True)
+        offsets = np.searchsorted(frame[column].to_numpy(), np.arange(n_artists + 1))
+        return cls(frame, offsets)
+
+    def artist(self, code) -> pd.DataFrame:
+        """
+        Rows for one artist, or every row when `code` is None
+        """
+        if code is None:
+            return self.frame
+        return self.frame.iloc[self.offsets[code] : self.offsets[code + 1]]
+
+    def artist_year(self, code, year) -> pd.DataFrame:
+        """
+        Rows for one artist in one year. Years are sorted within each artist so this is a
+        binary search inside the artist's range
+        """
+        if code is None:
+            return self.frame[self.frame["year"].to_numpy() == year]
+        start, stop = self.offsets[code], self.offsets[code + 1]
+        years = self.frame["year"].to_numpy()[start:stop]
+        lo, hi = np.searchsorted(years, [year, year + 1])
+        return self.frame.iloc[start + lo : start + hi]
+
+    def sizes(self) -> np.ndarray:
+        return np.diff(self.offsets)
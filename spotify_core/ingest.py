@@ -0,0 +1,571 @@
+import codecs
+import io
+import itertools
+import json
+import logging
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.json as pa_json
+from pandas.api.types import union_categoricals
+
+from spotify_core.features import add_features
+from spotify_core.instrument import span
+from spotify_core.schema import compact_history
+
+# Bytes pulled from the file per read and records buffered before they are flushed into columns
+READ_SIZE = 1 << 16
+CHUNK_ROWS = 20_000
+
+logger = logging.getLogger(__name__)
+
+# Change the column names to be more readable
+CHANGE_COLS = {
+    "master_metadata_track_name": "trackName",
+    "master_metadata_album_artist_name": "artistName",
+    "ts": "endTime",
+    "ms_played": "msPlayed",
+}
+
+# The columns the apps read from each export layout and the compact dtype each is parsed
+# into. Every other field of a record is skipped
+EXPORT_SCHEMAS = {
+    "streaming": {
+        "endTime": "datetime",
+        "artistName": "category",
+        "trackName": "category",
+        "msPlayed": "int32",
+    },
+    "endsong": {
+        "ts": "datetime",
+        "master_metadata_album_artist_name": "category",
+        "master_metadata_track_name": "category",
+        "ms_played": "int32",
+        "reason_start": "category",
+    },
+}
+# Fields a record must have to be read as each layout, endsong files from before reason_start
+# was added are still listening history
+REQUIRED_FIELDS = {
+    "streaming": set(EXPORT_SCHEMAS["streaming"]),
+    "endsong": set(EXPORT_SCHEMAS["endsong"]) - {"reason_start"},
+}
+# Timestamp layout of each export, a fixed format parses many times faster than inferring it
+TIME_FORMATS = {"streaming": "%Y-%m-%d %H:%M", "endsong": "ISO8601"}
+# Fields of the podcast-only StreamingHistory files, which hold no music
+PODCAST_FIELDS = {"podcastName", "episodeName"}
+
+# Files parsed at once when loading several uploads, 1 parses them one after another
+INGEST_WORKERS = int(os.environ.get("SPOTIFY_INGEST_WORKERS", 1))
+
+# Whitespace and commas between the records of the array
+_SEPARATOR = re.compile(r"[\s,]*")
+# Bytes of the array rewritten into separate records at a time for the columnar parser
+RECORD_READ_SIZE = 1 << 22
+# Arrow type each compact dtype is parsed as, timestamps are left as text for pandas
+_ARROW_TYPES = {"datetime": pa.string(), "category": pa.string(), "int32": pa.int64()}
+
+
+class HistorySchemaError(ValueError):
+    """
+    Raised when the first record of a file is not a listening record of a known export
+    """
+
+
+class HistoryFileError(ValueError):
+    """
+    Raised when one of several uploaded files cannot be read, naming the file
+    """
+
+    def __init__(self, name: str):
+        super().__init__(f"There was an error reading the file {name}")
+        self.name = name
+
+
+def _open_binary(file):
+    """
+    Return a binary file object for a path or raw bytes, or pass through an already open file
+    """
+    if isinstance(file, (str, os.PathLike)):
+        return open(file, "rb"), True
+    if isinstance(file, bytes):
+        return io.BytesIO(file), True
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return file, False
+
+
+def iter_records(file, read_size: int = READ_SIZE):
+    """
+    Yield the records of a JSON array one at a time while only holding `read_size` bytes
+    of undecoded text in memory
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer, pos = "", 0
+    started = False
+
+    while True:
+        raw = file.read(read_size)
+        eof = not raw
+        buffer = buffer[pos:] + text_decoder.decode(raw, final=eof)
+        pos = 0
+
+        while True:
+            # Skip the whitespace and commas between records
+            pos = _SEPARATOR.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Expected a JSON array of listening records")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The record is cut off at the end of the buffer, read some more
+                if eof:
+                    raise
+                break
+            yield record
+
+        if eof:
+            raise ValueError("Unexpected end of file while reading listening records")
+
+
+def sniff_schema(record) -> str:
+    """
+    The export layout of a record from its fields: "streaming", "endsong", "podcast" for
+    podcast-only StreamingHistory files, or None
+    """
+    if not isinstance(record, dict):
+        return None
+    fields = record.keys()
+    for schema, required in REQUIRED_FIELDS.items():
+        if required <= fields:
+            return schema
+    if PODCAST_FIELDS <= fields:
+        return "podcast"
+    return None
+
+
+def _columns(columns: dict, schema: str) -> pd.DataFrame:
+    """
+    Convert parsed values of the fields of a schema into its compact dtypes
+    """
+    chunk = {}
+    for col, dtype in EXPORT_SCHEMAS[schema].items():
+        values = columns[col]
+        if dtype == "int32":
+            chunk[col] = np.asarray(values, dtype=np.int64).astype(np.int32)
+        elif dtype == "datetime":
+            try:
+                chunk[col] = pd.to_datetime(values, format=TIME_FORMATS[schema])
+            except ValueError:
+                chunk[col] = pd.to_datetime(values)
+        else:
+            chunk[col] = pd.Categorical(values)
+    return pd.DataFrame(chunk)
+
+
+def _flush(rows: list, schema: str) -> pd.DataFrame:
+    """
+    Turn a bounded chunk of records into the typed columns of their schema, the rest of each
+    record is dropped here
+    """
+    return _columns({col: [row.get(col) for row in rows] for col in EXPORT_SCHEMAS[schema]}, schema)
+
+
+class _RecordStream(io.RawIOBase):
+    """
+    A JSON array of records read as whitespace-separated records, which the columnar JSON
+    parser can read. Only the commas between records and the outer brackets change, to spaces.
+    Strings are found with a vectorized scan of the quotes, carrying the state of a string,
+    escape or separator cut off at the end of a read into the next
+    """
+
+    def __init__(self, file, read_size: int = RECORD_READ_SIZE):
+        self.file = file
+        self.read_size = read_size
+        self.pending, self.offset = memoryview(b""), 0
+        self.in_string = False
+        self.depth = 0
+        # Backslashes that end the previous read, which may escape the first byte of the next
+        self.backslashes = 0
+        # Whether the previous read ended between a record and the comma after it
+        self.separator = False
+        self.started = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _rewrite(self, raw: bytes) -> bytes:
+        if not self.started:
+            self.started = True
+            if raw.startswith(codecs.BOM_UTF8):
+                raw = raw[len(codecs.BOM_UTF8) :]
+        data = np.frombuffer(raw, dtype=np.uint8)
+        quotes = np.flatnonzero(data == ord('"'))
+        # A quote is escaped by an odd run of backslashes. Escaped quotes are rare, so runs are
+        # only counted behind quotes that directly follow a backslash
+        behind = np.where(quotes > 0, data[quotes - 1] == ord("\\"), self.backslashes > 0)
+        escaped = np.zeros(len(quotes), dtype=bool)
+        for i in np.flatnonzero(behind):
+            pos = quotes[i]
+            while pos:
+                window = raw[max(pos - 64, 0) : pos]
+                kept = len(window.rstrip(b"\\"))
+                pos -= len(window) - kept
+                if kept:
+                    break
+            run = quotes[i] - pos + (self.backslashes if pos == 0 else 0)
+            escaped[i] = run % 2 == 1
+        quotes = quotes[~escaped]
+
+        # Brackets outside strings give the depth, records close back to depth 1
+        marks = np.sort(np.concatenate([np.flatnonzero(data == byte) for byte in b"[]{}"]))
+        marks = marks[(np.searchsorted(quotes, marks) + self.in_string) % 2 == 0]
+        kinds = data[marks]
+        step = np.isin(kinds, [ord("["), ord("{")]).astype(np.int64) * 2 - 1
+        after = self.depth + np.cumsum(step)
+        before = after - step
+
+        out = data.copy()
+        outer = ((kinds == ord("[")) & (before == 0)) | ((kinds == ord("]")) & (after == 0))
+        out[marks[outer]] = ord(" ")
+        # The comma after a record is the first comma outside strings after it, when no bracket
+        # comes first. A record closed at the end of the previous read counts from the start
+        ends = marks[(kinds == ord("}")) & (after == 1)]
+        if self.separator:
+            ends = np.r_[-1, ends]
+        commas = np.flatnonzero(data == ord(","))
+        commas = commas[(np.searchsorted(quotes, commas) + self.in_string) % 2 == 0]
+        following = np.searchsorted(commas, ends)
+        comma = commas[np.minimum(following, len(commas) - 1)] if len(commas) else following
+        bracket = np.append(marks, len(raw))[np.searchsorted(marks, ends, side="right")]
+        separator = (following < len(commas)) & (comma < bracket)
+        out[comma[separator]] = ord(" ")
+        self.separator = bool(len(ends)) and not separator[-1] and bracket[-1] == len(raw)
+
+        self.in_string = (self.in_string + len(quotes)) % 2 == 1
+        if len(after):
+            self.depth = int(after[-1])
+        run = len(raw) - len(raw.rstrip(b"\\"))
+        self.backslashes = run if run < len(raw) else self.backslashes + run
+        return out.tobytes()
+
+    def readinto(self, buffer) -> int:
+        # Fill the whole buffer, the parser takes a short read for the end of a block
+        filled = 0
+        while filled < len(buffer):
+            if self.offset == len(self.pending):
+                raw = self.file.read(self.read_size)
+                if not raw:
+                    break
+                self.pending, self.offset = memoryview(self._rewrite(raw)), 0
+            n = min(len(buffer) - filled, len(self.pending) - self.offset)
+            buffer[filled : filled + n] = self.pending[self.offset : self.offset + n]
+            self.offset += n
+            filled += n
+        return filled
+
+
+def _read_records(records, schema: str, chunk_rows: int = CHUNK_ROWS) -> pd.DataFrame:
+    """
+    Flush records of a layout into compact columns every `chunk_rows` records
+    """
+    chunks, rows = [], []
+    for record in records:
+        rows.append(record)
+        if len(rows) >= chunk_rows:
+            chunks.append(_flush(rows, schema))
+            rows = []
+    if rows:
+        chunks.append(_flush(rows, schema))
+    # String tables of the chunks are merged rather than falling back to objects
+    categories = [col for col, dtype in EXPORT_SCHEMAS[schema].items() if dtype == "category"]
+    frame = pd.concat([chunk.drop(columns=categories) for chunk in chunks], ignore_index=True)
+    for col in categories:
+        frame[col] = union_categoricals([chunk[col] for chunk in chunks], sort_categories=True)
+    return frame[list(EXPORT_SCHEMAS[schema])]
+
+
+def _read_columnar(fp, schema: str, read_size: int = RECORD_READ_SIZE) -> pd.DataFrame:
+    """
+    Parse only the fields of a layout with the columnar JSON parser, which skips the other
+    fields of each record without building Python objects for them
+    """
+    fields = EXPORT_SCHEMAS[schema]
+    options = pa_json.ParseOptions(
+        explicit_schema=pa.schema([(col, _ARROW_TYPES[dtype]) for col, dtype in fields.items()]),
+        unexpected_field_behavior="ignore",
+        newlines_in_values=True,
+    )
+    table = pa_json.read_json(_RecordStream(fp, read_size), parse_options=options)
+    columns = {}
+    for col, dtype in fields.items():
+        values = table.column(col)
+        if dtype == "category":
+            # Sorted string tables like the record reader, so codes do not depend on the reader
+            names = values.dictionary_encode().to_pandas()
+            columns[col] = names.cat.reorder_categories(names.cat.categories.sort_values())
+        elif dtype == "int32" and values.null_count:
+            raise ValueError(f"Records without {col}")
+        else:
+            columns[col] = values.to_numpy()
+    return _columns(columns, schema)
+
+
+def read_history(file, chunk_rows: int = CHUNK_ROWS, read_size: int = READ_SIZE) -> pd.DataFrame:
+    """
+    Read a StreamingHistory or endsong file. The layout is sniffed from the first record, so a
+    file of anything else raises HistorySchemaError before the rest is read. Only the columns of
+    the layout are then parsed, straight into compact dtypes, so time and memory scale with the
+    columns read. Files that cannot be rewound, or that the columnar parser rejects, are read
+    record by record and flushed every `chunk_rows` records instead
+    """
+    fp, should_close = _open_binary(file)
+    try:
+        records = iter_records(fp, read_size=read_size)
+        first = next(records, None)
+        if first is None:
+            raise HistorySchemaError("No listening records in the file")
+        schema = sniff_schema(first)
+        if schema not in EXPORT_SCHEMAS:
+            raise HistorySchemaError(f"Not a listening history file ({schema or 'unknown'})")
+        if not fp.seekable():
+            return _read_records(itertools.chain([first], records), schema, chunk_rows)
+        fp.seek(0)
+        try:
+            return _read_columnar(fp, schema)
+        except pa.ArrowInvalid as e:
+            # Several times slower, so it is logged and timed as its own stage
+            logger.warning("%s read record by record: %s", file_name(file), e)
+            fp.seek(0)
+            with span("read_records_fallback"):
+                return _read_records(iter_records(fp, read_size=read_size), schema, chunk_rows)
+    finally:
+        if should_close:
+            fp.close()
+
+
+def read_history_legacy(file) -> pd.DataFrame:
+    """
+    Original reader that materializes the whole file with pd.read_json, kept for comparison
+    """
+    fp, should_close = _open_binary(file)
+    try:
+        return pd.read_json(path_or_buf=fp)
+    finally:
+        if should_close:
+            fp.close()
+
+
+def normalize_history(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rename the endsong columns to the StreamingHistory names and parse the timestamps
+    """
+    frame = frame.rename(columns={i: CHANGE_COLS[i] for i in CHANGE_COLS if i in frame.columns})
+    if "endTime" in frame.columns:
+        frame["endTime"] = pd.to_datetime(frame["endTime"])
+    return frame
+
+
+def validate_upload_files(file: pd.DataFrame):
+    """
+    Validate that a renamed frame has the columns of listening history. Files are sniffed when
+    they are read, this guards frames built some other way
+    """
+    return all(col in file.columns for col in EXPORT_SCHEMAS["streaming"])
+
+
+def enrich_history(frame: pd.DataFrame, hour_offset: int = 0, validate: bool = False):
+    """
+    Add the features to a renamed history frame and compact it. With `validate`, frames that are
+    not listening history give None instead
+    """
+    if validate and not validate_upload_files(frame):
+        return None
+    with span("features", rows=len(frame)):
+        frame = add_features(frame, hour_offset=hour_offset)
+    with span("compact", rows=len(frame)):
+        return compact_history(frame)
+
+
+def read_normalized(file) -> pd.DataFrame:
+    """
+    Read and rename one file
+    """
+    with span("parse") as s:
+        frame = read_history(file)
+        s.rows = len(frame)
+    with span("rename", rows=len(frame)):
+        return normalize_history(frame)
+
+
+def parse_file(file, hour_offset: int = 0, validate: bool = False):
+    """
+    Read, rename, enrich and compact one file. With `validate`, a file that is not listening
+    history gives None
+    """
+    try:
+        normalized = read_normalized(file)
+    except HistorySchemaError:
+        if validate:
+            return None
+        raise
+    return enrich_history(normalized, hour_offset, validate)
+
+
+def is_history_file(name: str) -> bool:
+    """
+    Whether a file name looks like a listening history file of an export
+    """
+    return "StreamingHistory" in name or "endsong_" in name
+
+
+def file_name(file) -> str:
+    return getattr(file, "name", None) or os.path.basename(str(file))
+
+
+class ArchiveMember(io.BufferedIOBase):
+    """
+    A history file inside an uploaded export zip. The member is decompressed as it is read, so
+    it never sits in memory whole, and rewinding restarts the decompression
+    """
+
+    def __init__(self, archive: zipfile.ZipFile, info: zipfile.ZipInfo, file_id: str = None):
+        super().__init__()
+        self.archive = archive
+        self.info = info
+        self.name = os.path.basename(info.filename)
+        self.size = info.file_size
+        # Uploads keep their file_id across reruns, so members can too
+        self.file_id = file_id
+        self._member = None
+
+    def _open(self):
+        if self._member is None:
+            self._member = self.archive.open(self.info)
+        return self._member
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        return self._open().read(size)
+
+    def read1(self, size: int = -1) -> bytes:
+        return self._open().read1(size)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._open().seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._open().tell()
+
+    def close(self):
+        if self._member is not None:
+            self._member.close()
+        super().close()
+
+
+def is_listening_file(file) -> bool:
+    """
+    Whether the first record of a file is a listening record, without reading the rest
+    """
+    fp, should_close = _open_binary(file)
+    try:
+        return sniff_schema(next(iter_records(fp), None)) in EXPORT_SCHEMAS
+    except ValueError:
+        return False
+    finally:
+        if should_close:
+            fp.close()
+        else:
+            fp.seek(0)
+
+
+def expand_uploads(files: list) -> list:
+    """
+    Replace each uploaded export zip by its listening history members, in archive order. Only
+    members named like history files are opened and only their first record is sniffed, so
+    everything else in the archive is never decompressed. Other uploads pass through. A zip
+    that cannot be opened raises HistoryFileError
+    """
+    expanded = []
+    for file in files:
+        name = file_name(file)
+        if not name.lower().endswith(".zip"):
+            expanded.append(file)
+            continue
+        try:
+            if hasattr(file, "seek"):
+                file.seek(0)
+            archive = zipfile.ZipFile(file)
+        except zipfile.BadZipFile as e:
+            raise HistoryFileError(name) from e
+        file_id = getattr(file, "file_id", None)
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.endswith(".json"):
+                continue
+            if not is_history_file(os.path.basename(info.filename)):
+                continue
+            member = ArchiveMember(archive, info, file_id and f"{file_id}/{info.filename}")
+            if is_listening_file(member):
+                expanded.append(member)
+    return expanded
+
+
+def _payload(file):
+    """
+    Something a worker process can open: paths stay paths, uploads are passed as their bytes
+    """
+    if isinstance(file, (str, os.PathLike)):
+        return file
+    file.seek(0)
+    return file.read()
+
+
+def parse_files(
+    files: list,
+    hour_offset: int = 0,
+    validate: bool = False,
+    workers: int = INGEST_WORKERS,
+    executor: str = "process",
+) -> list:
+    """
+    Parse several files, fanning them out over a process or thread pool when `workers` > 1.
+    Workers return compact frames, so only dictionary codes and small ints cross back
+    """
+    if workers <= 1 or len(files) <= 1:
+        results = []
+        for file in files:
+            try:
+                results.append(parse_file(file, hour_offset, validate))
+            except Exception as e:
+                raise HistoryFileError(file_name(file)) from e
+        return results
+
+    pool_type = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    with pool_type(max_workers=workers) as pool:
+        futures = [pool.submit(parse_file, _payload(file), hour_offset, validate) for file in files]
+        results = []
+        for file, future in zip(files, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                raise HistoryFileError(file_name(file)) from e
+        return results
@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+
+# Set to 1 to record spans in every session, the apps also turn them on with ?debug=1
+DEBUG = os.environ.get("SPOTIFY_DEBUG", "0") == "1"
+# Append every finished run's spans to this file as JSON lines
+SPAN_LOG = os.environ.get("SPOTIFY_SPAN_LOG")
+
+logger = logging.getLogger(__name__)
+
+# The recorder of the script run on this thread, None when instrumentation is off
+_recorder = ContextVar("spotify_recorder", default=None)
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    """
+    Resident memory of the process, 0 where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return 0
+
+
+class Span:
+    """
+    One timed stage. Set `rows` inside the block to record how many rows it produced
+    """
+
+    __slots__ = ("name", "depth", "rows", "wall", "cpu", "memory", "_recorder", "_start")
+
+    def __init__(self, recorder, name: str, rows=None):
+        self.name = name
+        self.rows = rows
+        self._recorder = recorder
+
+    def __enter__(self):
+        self.depth = self._recorder._depth
+        self._recorder._depth += 1
+        self._start = (time.perf_counter(), time.thread_time(), rss_bytes())
+        return self
+
+    def __exit__(self, *exc):
+        wall, cpu, memory = self._start
+        self.wall = time.perf_counter() - wall
+        self.cpu = time.thread_time() - cpu
+        self.memory = rss_bytes() - memory
+        self._recorder._depth -= 1
+        self._recorder.spans.append(self)
+        return False
+
+    def record(self) -> dict:
+        return {
+            "stage": self.name,
+            "depth": self.depth,
+            "wall_s": round(self.wall, 6),
+            "cpu_s": round(self.cpu, 6),
+            "rows": self.rows,
+            "memory_delta_mb": round(self.memory / 1e6, 3),
+        }
+
+
+class _NullSpan:
+    """
+    Stands in for a span when nothing is recording, so instrumented code costs one call
+    """
+
+    __slots__ = ("rows",)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Recorder:
+    """
+    Collects the spans of one script run. CPU time is the recording thread's own, so other
+    sessions on the same server do not show up in it
+    """
+
+    def __init__(self, app: str = None):
+        self.app = app
+        self.started = time.time()
+        self.spans = []
+        self.payloads = []
+        # Cache name -> counters at the end of the run
+        self.counters = {}
+        self._depth = 0
+
+    def span(self, name: str, rows=None) -> Span:
+        return Span(self, name, rows)
+
+    def records(self) -> list:
+        # Spans finish innermost first, list them in the order they started
+        return [s.record() for s in sorted(self.spans, key=lambda s: s._start[0])]
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "app": self.app,
+                "started": self.started,
+                "spans": self.records(),
+                "payloads": self.payloads,
+                "counters": self.counters,
+            }
+        )
+
+    def log(self):
+        """
+        Emit the run as one structured log line, and append it to SPOTIFY_SPAN_LOG when set
+        """
+        line = self.to_json()
+        logger.info(line)
+        if SPAN_LOG:
+            with open(SPAN_LOG, "a") as fp:
+                fp.write(line + "\n")
+
+
+def start_recording(app: str = None) -> Recorder:
+    """
+    Record the spans of this thread into a fresh recorder
+    """
+    recorder = Recorder(app)
+    _recorder.set(recorder)
+    return recorder
+
+
+def stop_recording():
+    _recorder.set(None)
+
+
+def span(name: str, rows=None):
+    """
+    Time a block under `name` if this thread is recording, otherwise do nothing
+    """
+    recorder = _recorder.get()
+    if recorder is None:
+        return _NULL_SPAN
+    return Span(recorder, name, rows)
+
+
+def record_payload(chart: str, rows: int, nbytes: int, cached: bool = False):
+    """
+    Note the size of a chart sent to the browser if this thread is recording
+    """
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.payloads.append(
+            {"chart": chart, "rows": rows, "kb": round(nbytes / 1e3, 1), "cached": cached}
+        )
+
+
+def record_counters(name: str, counters: dict):
+    """
+    Note the counters of a cache if this thread is recording, the last call per name wins
+    """
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.counters[name] = dict(counters)
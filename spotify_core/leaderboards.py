@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+
+from spotify_core.aggregates import ArtistCube
+from spotify_core.features import iso_to_date
+from spotify_core.instrument import span
+from spotify_core.sessions import wall_clock
+
+# Entries on each leaderboard
+LEADERBOARD_SIZE = 10
+# Rolling windows offered by the app, in months
+LEADERBOARD_WINDOWS = {"Month": 1, "3 months": 3, "12 months": 12}
+# Cells of the month x item matrix held at once, 4M float64 cells is 32 MB
+BLOCK_CELLS = 1 << 22
+
+
+def rolling_top_k(
+    periods: np.ndarray,
+    items: np.ndarray,
+    ms: np.ndarray,
+    n_periods: int,
+    n_items: int,
+    k: int = LEADERBOARD_SIZE,
+    window: int = 1,
+    block_cells: int = BLOCK_CELLS,
+) -> tuple:
+    """
+    The `k` items with the most `ms` over the `window` periods ending at each period, for
+    (period, item, ms) entries. Returns (n_periods, k) arrays of items and totals, best first,
+    padded with -1 and 0 where fewer than `k` items played.
+
+    Items are taken in blocks of a dense period x item matrix: a cumulative sum down the periods
+    turns every window into one subtraction, and a partial sort per period keeps the block's top
+    `k`, merged into the running top `k`. Cost is periods x items whatever the window
+    """
+    order = np.argsort(items, kind="stable")
+    periods, items, ms = periods[order], items[order], ms[order]
+    block = max(1, block_cells // max(n_periods, 1))
+    best = np.full((n_periods, 0), -1, dtype=np.int64)
+    totals = np.zeros((n_periods, 0))
+    for lo in range(0, n_items, block):
+        hi = min(lo + block, n_items)
+        start, stop = np.searchsorted(items, [lo, hi])
+        width = hi - lo
+        # ms are whole numbers, so sums and differences of them are exact in float64
+        dense = np.bincount(
+            periods[start:stop] * width + items[start:stop] - lo,
+            weights=ms[start:stop],
+            minlength=n_periods * width,
+        ).reshape(n_periods, width)
+        if window > 1:
+            dense = np.cumsum(dense, axis=0)
+            dense[window:] -= dense[:-window].copy()
+        take = min(k, width)
+        top = np.argpartition(-dense, take - 1, axis=1)[:, :take]
+        best = np.hstack([best, top + lo])
+        totals = np.hstack([totals, np.take_along_axis(dense, top, axis=1)])
+        if best.shape[1] > k:
+            keep = np.argpartition(-totals, k - 1, axis=1)[:, :k]
+            best = np.take_along_axis(best, keep, axis=1)
+            totals = np.take_along_axis(totals, keep, axis=1)
+
+    # Best first, ties to the lower item code
+    rank = np.lexsort((best, -totals), axis=1)
+    best = np.take_along_axis(best, rank, axis=1)
+    totals = np.take_along_axis(totals, rank, axis=1)
+    best[totals <= 0] = -1
+    totals[totals <= 0] = 0
+    if best.shape[1] < k:
+        pad = k - best.shape[1]
+        best = np.pad(best, ((0, 0), (0, pad)), constant_values=-1)
+        totals = np.pad(totals, ((0, 0), (0, pad)))
+    return best, totals
+
+
+def leaderboard_frame(best: np.ndarray, totals: np.ndarray, first_month: int) -> pd.DataFrame:
+    """
+    Long table of `rolling_top_k` output over months counted from `first_month` (months since
+    1970): month, rank, item and minutes, without the padding
+    """
+    n_periods, k = best.shape
+    months = np.datetime64(int(first_month), "M") + np.arange(n_periods)
+    played = best.ravel() >= 0
+    return pd.DataFrame(
+        {
+            "month": np.repeat(months, k).astype("datetime64[ns]")[played],
+            "rank": np.tile(np.arange(1, k + 1), n_periods)[played],
+            "item": best.ravel()[played],
+            "minutes": totals.ravel()[played] / 60000,
+        }
+    )
+
+
+def artist_leaderboard(
+    cube: ArtistCube, k: int = LEADERBOARD_SIZE, window: int = 1
+) -> pd.DataFrame:
+    """
+    Top `k` artists by minutes in every month, or over the `window` months ending at every
+    month, from the day totals of the cube or of another query engine
+    """
+    days = cube.day_totals()
+    with span("artist_leaderboard", rows=len(days)):
+        months = iso_to_date(days["year"], days["week"], days["dow"]).astype("datetime64[M]")
+        months = months.astype(np.int64)
+        if not len(months):
+            return pd.DataFrame(columns=["month", "rank", "artistName", "minutes"])
+        first = months.min()
+        best, totals = rolling_top_k(
+            months - first,
+            days["artist"].to_numpy(np.int64),
+            np.round(days["minutes"].to_numpy() * 60000),
+            int(months.max() - first) + 1,
+            len(cube.artists),
+            k,
+            window,
+        )
+        board = leaderboard_frame(best, totals, first)
+        board.insert(2, "artistName", cube.artists[board.pop("item")].astype(object))
+    return board
+
+
+def track_leaderboard(cube: ArtistCube, k: int = LEADERBOARD_SIZE, window: int = 1) -> pd.DataFrame:
+    """
+    Top `k` tracks by minutes in every month, or over the `window` months ending at every
+    month, from the plays of the cube's fragments. A track is a (track name, artist) pair
+    """
+    months, artists, names, codes, ms = [], [], [], [], []
+    for fragment in cube.fragments:
+        frame = fragment.plays.frame
+        # Plays without an artist (podcast episodes) have code -1, which the appended -1 keeps
+        # out along with the artists the cube dropped
+        lookup = np.append(cube.artists.get_indexer(fragment.artists), -1)
+        artist = lookup[frame["artist"].to_numpy()]
+        track_name = frame["trackName"].to_numpy()
+        keep = (artist >= 0) & pd.notna(track_name)
+        # Track names are hashed once per fragment, then only the distinct names are merged
+        track, track_names = pd.factorize(track_name[keep])
+        months.append(wall_clock(frame["endTime"])[keep].astype("datetime64[M]").astype(np.int64))
+        artists.append(artist[keep])
+        names.append(track_names)
+        codes.append(track)
+        ms.append(frame["msPlayed"].to_numpy()[keep])
+    months = np.concatenate(months)
+    with span("track_leaderboard", rows=len(months)):
+        if not len(months):
+            return pd.DataFrame(columns=["month", "rank", "trackName", "artistName", "minutes"])
+        lookup, track_names = pd.factorize(np.concatenate(names))
+        ends = np.cumsum([len(n) for n in names])
+        track = np.concatenate(
+            [lookup[end - len(n) : end][c] for n, c, end in zip(names, codes, ends)]
+        )
+        pairs, pair_keys = pd.factorize(np.concatenate(artists) * len(track_names) + track)
+        first = months.min()
+        best, totals = rolling_top_k(
+            months - first,
+            pairs,
+            np.concatenate(ms).astype(np.float64),
+            int(months.max() - first) + 1,
+            len(pair_keys),
+            k,
+            window,
+        )
+        board = leaderboard_frame(best, totals, first)
+        artist, track = np.divmod(pair_keys[board.pop("item").to_numpy()], len(track_names))
+        board.insert(2, "trackName", track_names[track].astype(object))
+        board.insert(3, "artistName", cube.artists[artist].astype(object))
+    return board
@@ -0,0 +1,164 @@
+import re
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Letters that Unicode decomposition does not split into a base letter and an accent
+_FOLD = str.maketrans({"ø": "o", "ł": "l", "đ": "d", "æ": "ae", "œ": "oe", "ı": "i"})
+# Words that join several acts in one billing or credit, on normalized names
+CREDIT_SPLIT = r" (?:b2b|b3b|vs|feat|ft|featuring) "
+# Lowest trigram similarity accepted as a fuzzy match. Short names are only matched exactly,
+# one letter apart they are as often different acts ("Gabriel", "Gabriels") as typos
+FUZZY_THRESHOLD = 0.75
+FUZZY_MIN_LENGTH = 8
+
+
+def normalize_names(names: pd.Series) -> pd.Series:
+    """
+    Fold artist names to match keys: accents and case folded, "&" and "+" spelled "and",
+    punctuation dropped and a leading "the" removed, so "The Beyoncé & Co." becomes "beyonce and co"
+    """
+    names = names.astype(str).str.normalize("NFKD").str.replace(r"[\u0300-\u036f]", "", regex=True)
+    names = names.str.casefold().str.translate(_FOLD)
+    names = names.str.replace(r"\s*[&+]\s*", " and ", regex=True)
+    # Dots and apostrophes join their neighbours, "J.I.D" is "jid" and "O'Neal" is "oneal"
+    names = names.str.replace(r"['’.]", "", regex=True)
+    names = names.str.replace(r"[\W_]+", " ", regex=True).str.strip()
+    return names.str.replace(r"^the (?=.)", "", regex=True)
+
+
+def trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class LineupIndex:
+    """
+    A lineup with its artist names folded to match keys, built once per lineup.
+
+    Every act is indexed under its full name, the name without and within parentheses, the
+    name without spaces and, for billings like "ÂME B2B TRIKK", under each act. Names that
+    miss all of those fall back to the closest key by trigram similarity
+    """
+
+    lineup: pd.DataFrame
+    # Match key -> lineup row, full names win over aliases
+    keys: dict
+    # Lineup row and trigram count of every key, in the order of `keys`
+    key_rows: np.ndarray
+    key_sizes: np.ndarray
+    # Trigram -> id, the keys containing trigram g are postings[offsets[g] : offsets[g + 1]]
+    gram_ids: dict
+    postings: np.ndarray
+    offsets: np.ndarray
+
+    @classmethod
+    def build(cls, lineup: pd.DataFrame) -> "LineupIndex":
+        lineup = lineup.reset_index(drop=True)
+        names = lineup["Artist"].astype(str)
+        full = normalize_names(names)
+        aliases = [
+            full,
+            normalize_names(names.str.replace(r"\s*\([^)]*\)", "", regex=True)),
+            normalize_names(names.str.extract(r"\(([^)]*)\)", expand=False).fillna("")),
+        ]
+        aliases += full.str.split(CREDIT_SPLIT, regex=True, expand=True).T.to_numpy().tolist()
+        # Spacing varies more than spelling, "1999.ODDS" is billed as "1999 ODDS" too
+        aliases.append(full.str.replace(" ", "", regex=False))
+
+        keys = {}
+        for alias in aliases:
+            for row, key in enumerate(alias):
+                if isinstance(key, str) and key:
+                    keys.setdefault(key, row)
+
+        gram_ids, gram_of, key_of, sizes = {}, [], [], []
+        for k, key in enumerate(keys):
+            grams = trigrams(key)
+            sizes.append(len(grams))
+            for gram in grams:
+                gram_of.append(gram_ids.setdefault(gram, len(gram_ids)))
+                key_of.append(k)
+        gram_of = np.asarray(gram_of, dtype=np.int64)
+        postings = np.asarray(key_of, dtype=np.int64)[np.argsort(gram_of, kind="stable")]
+        offsets = np.zeros(len(gram_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(gram_of, minlength=len(gram_ids)), out=offsets[1:])
+        return cls(
+            lineup,
+            keys,
+            np.fromiter(keys.values(), dtype=np.int64, count=len(keys)),
+            np.asarray(sizes, dtype=np.float64),
+            gram_ids,
+            postings,
+            offsets,
+        )
+
+    def fuzzy(self, keys: list) -> tuple:
+        """
+        Lineup row of the most similar match key to each name by Dice coefficient over trigrams,
+        -1 below the threshold, and the similarity. All names are scored in one pass
+        """
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        scores = np.zeros(len(keys))
+        query, gram, sizes = [], [], np.zeros(len(keys))
+        for i, key in enumerate(keys):
+            if len(key) < FUZZY_MIN_LENGTH:
+                continue
+            grams = trigrams(key)
+            sizes[i] = len(grams)
+            for g in grams:
+                if g in self.gram_ids:
+                    query.append(i)
+                    gram.append(self.gram_ids[g])
+        if not query:
+            return rows, scores
+
+        # Expand each (name, trigram) pair to the keys sharing the trigram and count the pairs
+        gram = np.asarray(gram, dtype=np.int64)
+        lengths = self.offsets[gram + 1] - self.offsets[gram]
+        ends = np.cumsum(lengths)
+        positions = np.arange(ends[-1]) - np.repeat(ends - lengths - self.offsets[gram], lengths)
+        pairs = np.repeat(np.asarray(query, dtype=np.int64), lengths) * len(self.key_rows)
+        pairs, shared = np.unique(pairs + self.postings[positions], return_counts=True)
+        name, key = np.divmod(pairs, len(self.key_rows))
+        dice = 2 * shared / (sizes[name] + self.key_sizes[key])
+
+        # Best key per name, the earliest key on ties so full names win over aliases
+        order = np.lexsort((key, -dice, name))
+        first = order[np.r_[True, name[order][1:] != name[order][:-1]]]
+        good = first[dice[first] >= FUZZY_THRESHOLD]
+        rows[name[good]] = self.key_rows[key[good]]
+        scores[name[good]] = dice[good]
+        return rows, scores
+
+    def match(self, names) -> pd.DataFrame:
+        """
+        Lineup row of each name, -1 where nothing matched, and how it matched: `exact` on the
+        folded name, `alias` on one act of a "feat." or "B2B" name or the name without spaces, or
+        `fuzzy` with its trigram score
+        """
+        names = pd.Series(np.asarray(names, dtype=object))
+        keys = normalize_names(names)
+        rows = keys.map(self.keys).fillna(-1).to_numpy(dtype=np.int64)
+        how = np.where(rows >= 0, "exact", None).astype(object)
+        score = (rows >= 0).astype(np.float64)
+
+        # Only names that missed exactly are split or scored, one lookup per distinct name
+        fuzzy, credits = [], re.compile(CREDIT_SPLIT)
+        for i in np.flatnonzero(rows < 0):
+            key = keys.iat[i]
+            parts = credits.split(key) + [key.replace(" ", "")]
+            parts = [part for part in parts if part in self.keys]
+            if parts:
+                rows[i], how[i], score[i] = self.keys[parts[0]], "alias", 1.0
+            else:
+                fuzzy.append(i)
+        fuzzy = np.asarray(fuzzy, dtype=np.int64)
+        fuzzy_rows, fuzzy_scores = self.fuzzy(keys.to_numpy()[fuzzy].tolist())
+        found = fuzzy[fuzzy_rows >= 0]
+        rows[found] = fuzzy_rows[fuzzy_rows >= 0]
+        how[found] = "fuzzy"
+        score[found] = fuzzy_scores[fuzzy_rows >= 0]
+        return pd.DataFrame({"name": names, "key": keys, "row": rows, "how": how, "score": score})
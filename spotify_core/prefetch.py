@@ -0,0 +1,187 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+import pandas as pd
+
+from spotify_core.heatmap import heatmap_grid
+
+# Most listened artists whose drill-down is computed before they are picked
+PREFETCH_ARTISTS = int(os.environ.get("SPOTIFY_PREFETCH_ARTISTS", 10))
+# Drill-down views kept per session, least recently used dropped first
+PREFETCH_VIEWS = 64
+# Background threads computing the views, shared by every session of the process
+PREFETCH_WORKERS = int(os.environ.get("SPOTIFY_PREFETCH_WORKERS", 1))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def prefetch_executor() -> ThreadPoolExecutor:
+    """
+    The process-wide pool that prefetches drill-down views. Sessions come and go without a
+    hook to clean up after them, so they share its threads rather than each starting its own
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(PREFETCH_WORKERS, thread_name_prefix="drilldown")
+    return _executor
+
+
+@dataclass
+class ArtistView:
+    """
+    Lifetime drill-down of an artist, or of all artists for code None
+    """
+
+    songs: pd.DataFrame
+    years: pd.Series
+    monthly: pd.DataFrame
+
+    @property
+    def top_year(self):
+        return self.years.sort_values(ascending=False).index[0]
+
+
+@dataclass
+class YearView:
+    """
+    Drill-down of an artist in one year. `rank` is None for all artists
+    """
+
+    days: pd.DataFrame
+    grid: pd.DataFrame
+    tracks: pd.DataFrame
+    rank: float
+
+
+def artist_view(queries, code) -> ArtistView:
+    return ArtistView(
+        songs=queries.artist_songs(code), years=queries.years(code), monthly=queries.monthly(code)
+    )
+
+
+def year_view(queries, code, year) -> YearView:
+    days = queries.artist_days(code, year)
+    return YearView(
+        days=days,
+        grid=heatmap_grid(days, year),
+        tracks=queries.year_tracks(code, year),
+        rank=None if code is None else queries.yearly_rank(code, year),
+    )
+
+
+class DrillDownCache:
+    """
+    Bounded cache of one session's drill-down views over the queries of an upload, the cube or
+    a query engine. `prefetch` computes the views of likely picks on `executor`, by default
+    the process-wide `prefetch_executor`, while the page renders, so picking them reads the
+    cache. Binding other queries, after the upload or session filter changed, cancels the
+    queued work and drops every view
+    """
+
+    def __init__(self, max_views: int = PREFETCH_VIEWS, executor: Executor = None):
+        self.max_views = max_views
+        self._executor = executor or prefetch_executor()
+        self._lock = threading.Lock()
+        self._queries = None
+        # Key -> future of the view, least recently used first
+        self._views = OrderedDict()
+        # Queued year prefetches, whose keys are only known once they run
+        self._pending = []
+        self.hits = self.misses = self.prefetched = self.cancelled = 0
+
+    def bind(self, queries):
+        with self._lock:
+            if queries is self._queries:
+                return
+            for future in [*self._views.values(), *self._pending]:
+                if future.cancel():
+                    self.cancelled += 1
+            self._views = OrderedDict()
+            self._pending = []
+            self._queries = queries
+
+    def _store(self, queries, key, future: Future):
+        with self._lock:
+            # Views of queries that were replaced meanwhile are dropped
+            if queries is not self._queries:
+                return
+            self._views[key] = future
+            self._views.move_to_end(key)
+            while len(self._views) > self.max_views:
+                _, old = self._views.popitem(last=False)
+                old.cancel()
+
+    def _lookup(self, queries, key, build) -> tuple:
+        """
+        The view under `key` and whether it was cached. A view still queued is taken off the
+        queue and built here rather than waited for; one being built is waited for
+        """
+        with self._lock:
+            future = self._views.get(key) if queries is self._queries else None
+            if future is not None:
+                self._views.move_to_end(key)
+        if future is not None and not future.cancel():
+            return future.result(), True
+        view = build()
+        future = Future()
+        future.set_result(view)
+        self._store(queries, key, future)
+        return view, False
+
+    def _get(self, key, build):
+        queries = self._queries
+        view, hit = self._lookup(queries, key, lambda: build(queries))
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return view
+
+    def artist(self, code) -> ArtistView:
+        return self._get(("artist", code), lambda queries: artist_view(queries, code))
+
+    def year(self, code, year) -> YearView:
+        return self._get(("year", code, year), lambda queries: year_view(queries, code, year))
+
+    def _prefetch_year(self, queries, code):
+        if queries is not self._queries:
+            return
+        # Queued behind the artist's own view, which gives the year
+        artist, _ = self._lookup(queries, ("artist", code), lambda: artist_view(queries, code))
+        year = artist.top_year
+        self._lookup(queries, ("year", code, year), lambda: year_view(queries, code, year))
+        with self._lock:
+            self.prefetched += 1
+
+    def prefetch(self, codes: list):
+        """
+        Queue the lifetime view of every artist code and the view of its most listened year,
+        the ones the app opens when the artist is picked. Codes already cached are skipped
+        """
+        with self._lock:
+            queries = self._queries
+            codes = [code for code in codes if ("artist", code) not in self._views]
+            self._pending = [future for future in self._pending if not future.done()]
+        for code in codes:
+            artist = self._executor.submit(artist_view, queries, code)
+            self._store(queries, ("artist", code), artist)
+            year = self._executor.submit(self._prefetch_year, queries, code)
+            with self._lock:
+                self._pending.append(year)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "prefetched": self.prefetched,
+                "cancelled": self.cancelled,
+                "entries": len(self._views),
+                "max_views": self.max_views,
+            }
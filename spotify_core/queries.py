@@ -0,0 +1,178 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from spotify_core.aggregates import cube_from_fragments, fragment_plays
+from spotify_core.instrument import span
+from spotify_core.ranks import RankTable
+
+try:
+    import duckdb
+except ImportError:
+    # Optional, only needed for SPOTIFY_QUERY_ENGINE=duckdb
+    duckdb = None
+
+# "pandas" answers the drill-down queries from the cube's pre-aggregated tables, "duckdb" runs
+# them as SQL over the plays in an embedded columnar database
+QUERY_ENGINES = ["pandas", "duckdb"]
+QUERY_ENGINE = os.environ.get("SPOTIFY_QUERY_ENGINE", "pandas")
+
+# The calendar date of the ISO year, week and weekday columns, as `iso_to_date`. The compact
+# columns are widened first so the week arithmetic does not overflow
+_DATE = (
+    "make_date(year::INTEGER, 1, 4) - (isodow(make_date(year::INTEGER, 1, 4)) - 1)::INTEGER"
+    " + (week::INTEGER - 1) * 7 + dow::INTEGER"
+)
+
+
+def _where(code=None, year=None) -> tuple:
+    clauses, params = [], []
+    if code is not None:
+        clauses.append("artist = ?")
+        params.append(int(code))
+    if year is not None:
+        clauses.append("year = ?")
+        params.append(int(year))
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+class DuckDBCube:
+    """
+    The drill-down queries of `ArtistCube` run by DuckDB over the plays of the fragments
+    instead of read from pre-aggregated tables. Artists are coded by lifetime minutes as in
+    the cube, so codes are ranks and every query returns what the cube's does
+    """
+
+    def __init__(self, fragments: list, min_artist_ms: int = 0):
+        if duckdb is None:
+            raise ImportError("The duckdb query engine needs the duckdb package")
+        self.fragments = fragments
+        self._db = duckdb.connect()
+        with span("duckdb_load", rows=sum(len(f.plays.frame) for f in fragments)):
+            # Each fragment's plays are appended with their artist and track names, so the
+            # history is never concatenated in pandas
+            self._db.execute(
+                "CREATE TABLE loaded (artistName VARCHAR, year SMALLINT, week TINYINT,"
+                " dow TINYINT, msPlayed INTEGER, trackName VARCHAR)"
+            )
+            for fragment in fragments:
+                frame = fragment.plays.frame
+                plays = pd.DataFrame(
+                    {
+                        "artistName": pd.Categorical.from_codes(
+                            frame["artist"].to_numpy(), fragment.artists
+                        ),
+                        **{column: frame[column] for column in ["year", "week", "dow", "msPlayed"]},
+                        "trackName": frame["trackName"].astype("category"),
+                    }
+                )
+                self._db.register("frame", plays)
+                self._db.execute(
+                    "INSERT INTO loaded SELECT artistName, year, week, dow, msPlayed, trackName"
+                    " FROM frame"
+                )
+                self._db.unregister("frame")
+            totals = self._db.execute(
+                "SELECT artistName, sum(msPlayed) AS ms FROM loaded WHERE artistName IS NOT NULL"
+                " GROUP BY artistName HAVING sum(msPlayed) > ? ORDER BY ms DESC, artistName",
+                [min_artist_ms],
+            ).df()
+            self.artists = pd.Index(totals["artistName"].astype(object), name="artistName")
+
+            # Plays of artists under the floor, or without one (podcast episodes), have no code
+            # and are left out by the join. Stored in artist then year order so filters on either
+            # skip most of the table
+            codes = pd.DataFrame(
+                {"artistName": self.artists, "artist": np.arange(len(self.artists), dtype=np.int32)}
+            )
+            self._db.register("codes", codes)
+            self._db.execute(
+                "CREATE TABLE plays AS SELECT artist, year, week, dow, msPlayed, trackName"
+                " FROM loaded JOIN codes USING (artistName) ORDER BY artist, year"
+            )
+            self._db.unregister("codes")
+            self._db.execute("DROP TABLE loaded")
+            artist_years = self._query(
+                "SELECT artist, year, sum(msPlayed) AS ms FROM plays GROUP BY artist, year"
+            )
+            self.ranks = RankTable.build(
+                artist_years["artist"].to_numpy(),
+                artist_years["year"].to_numpy(),
+                artist_years["ms"].to_numpy(),
+                len(self.artists),
+            )
+
+    def _query(self, sql: str, params: list = ()) -> pd.DataFrame:
+        # A cursor per query, sessions run on their own threads
+        with self._db.cursor() as cursor:
+            return cursor.execute(sql, list(params)).df()
+
+    def code(self, artist: str):
+        return self.artists.get_loc(artist)
+
+    def artist_plays(self, code, year=None) -> pd.DataFrame:
+        return fragment_plays(self.fragments, None if code is None else self.artists[code], year)
+
+    def artist_days(self, code, year=None) -> pd.DataFrame:
+        where, params = _where(code, year)
+        return self._query(
+            "SELECT year, week, dow, sum(msPlayed) / 60000 AS minutes, count(*) AS plays"
+            f" FROM plays{where} GROUP BY year, week, dow ORDER BY year, week, dow",
+            params,
+        )
+
+    def artist_songs(self, code) -> pd.DataFrame:
+        where, params = _where(code)
+        return self._query(
+            "SELECT trackName, artist, sum(msPlayed) / 60000 AS minutes, count(*) AS plays"
+            f" FROM plays{where} GROUP BY artist, trackName ORDER BY artist, trackName",
+            params,
+        )
+
+    def year_tracks(self, code, year) -> pd.DataFrame:
+        where, params = _where(code, year)
+        return self._query(
+            "SELECT trackName, sum(msPlayed) / 60000 AS minutes, count(*) AS plays"
+            f" FROM plays{where} GROUP BY trackName ORDER BY trackName",
+            params,
+        )
+
+    def years(self, code) -> pd.Series:
+        where, params = _where(code)
+        years = self._query(
+            "SELECT year, sum(msPlayed) / 60000 AS minutes"
+            f" FROM plays{where} GROUP BY year ORDER BY year",
+            params,
+        )
+        return years.set_index("year")["minutes"]
+
+    def monthly(self, code) -> pd.DataFrame:
+        where, params = _where(code)
+        return self._query(
+            f"SELECT strftime({_DATE}, '%Y-%m') AS year_month,"
+            " sum(msPlayed) / 60000 AS minutesPlayed"
+            f" FROM plays{where} GROUP BY year_month ORDER BY year_month",
+            params,
+        )
+
+    def yearly_rank(self, code, year) -> float:
+        return self.ranks.rank(code, year)
+
+    def day_totals(self) -> pd.DataFrame:
+        return self._query(
+            "SELECT artist, year, week, dow, sum(msPlayed) / 60000 AS minutes, count(*) AS plays"
+            " FROM plays GROUP BY artist, year, week, dow ORDER BY artist, year, week, dow"
+        )
+
+
+def query_engine(fragments: list, engine: str = QUERY_ENGINE, min_artist_ms: int = 0):
+    """
+    The drill-down queries over the plays of `fragments` run by `engine`, one of QUERY_ENGINES.
+    The pandas engine is the cube of their partials, the others load the plays without it
+    """
+    if engine == "pandas":
+        return cube_from_fragments(fragments, min_artist_ms)
+    if engine == "duckdb":
+        return DuckDBCube(fragments, min_artist_ms)
+    raise ValueError(f"Unknown query engine {engine!r}, expected one of {QUERY_ENGINES}")
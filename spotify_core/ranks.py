@@ -0,0 +1,93 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+def average_ranks(values: np.ndarray, present: np.ndarray) -> np.ndarray:
+    """
+    Rank of every row in each column of `values`, largest first, with tied rows sharing the
+    mean of their ranks as Series.rank does. Rows not `present` in a column are left out of
+    its ranking and get NaN
+    """
+    n = len(values)
+    keys = np.where(present, values, -1)
+    order = np.argsort(-keys, axis=0, kind="stable")
+    ordered = np.take_along_axis(keys, order, axis=0)
+    # First and last position of the run of equal values each sorted row belongs to
+    position = np.broadcast_to(np.arange(n)[:, None], values.shape)
+    starts = np.ones(values.shape, dtype=bool)
+    starts[1:] = ordered[1:] != ordered[:-1]
+    ends = np.ones(values.shape, dtype=bool)
+    ends[:-1] = starts[1:]
+    first = np.maximum.accumulate(np.where(starts, position, 0), axis=0)
+    last = np.minimum.accumulate(np.where(ends, position, n - 1)[::-1], axis=0)[::-1]
+    ranks = np.empty(values.shape)
+    np.put_along_axis(ranks, order, (first + last) / 2 + 1, axis=0)
+    ranks[~present] = np.nan
+    return ranks
+
+
+@dataclass
+class RankTable:
+    """
+    Milliseconds of every artist in every year as a dense artist x year matrix, with each
+    artist's lifetime rank and rank in every year computed once, so any rank is an index.
+    Rows are artist codes, columns the years from `first_year` on. Years an artist did not
+    play have a NaN rank
+    """
+
+    first_year: int
+    ms: np.ndarray
+    year_ranks: np.ndarray
+    lifetime: np.ndarray
+
+    @classmethod
+    def build(cls, artists: np.ndarray, years: np.ndarray, ms: np.ndarray, n_artists: int):
+        """
+        Table of (artist code, year, ms) rows, several rows of one artist and year are summed
+        """
+        years = np.asarray(years, dtype=np.int64)
+        first = int(years.min()) if len(years) else 0
+        n_years = int(years.max()) - first + 1 if len(years) else 0
+        cells = np.asarray(artists, dtype=np.int64) * n_years + years - first
+        size = n_artists * n_years
+        # ms are whole numbers, so their float64 sums are exact
+        totals = np.bincount(cells, weights=ms, minlength=size).astype(np.int64)
+        played = np.bincount(cells, minlength=size) > 0
+        totals, played = totals.reshape(n_artists, n_years), played.reshape(n_artists, n_years)
+
+        lifetime = np.empty(n_artists, dtype=np.int64)
+        lifetime[np.argsort(-totals.sum(axis=1), kind="stable")] = np.arange(1, n_artists + 1)
+        return cls(first, totals, average_ranks(totals, played), lifetime)
+
+    @property
+    def years(self) -> np.ndarray:
+        return np.arange(self.first_year, self.first_year + self.ms.shape[1])
+
+    def rank(self, code, year) -> float:
+        """
+        Rank of an artist among the artists played in `year`, NaN if it was not played
+        """
+        column = int(year) - self.first_year
+        if not 0 <= column < self.ms.shape[1]:
+            return np.nan
+        return float(self.year_ranks[code, column])
+
+    def trajectories(self, codes) -> pd.DataFrame:
+        """
+        Rank and minutes of each artist code in every year it was played, one row per
+        artist and year
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        n_years = self.ms.shape[1]
+        ranks = self.year_ranks[codes].ravel()
+        played = ~np.isnan(ranks)
+        return pd.DataFrame(
+            {
+                "artist": np.repeat(codes, n_years)[played],
+                "year": np.tile(self.years, len(codes))[played],
+                "rank": ranks[played],
+                "minutes": self.ms[codes].ravel()[played] / 60000,
+            }
+        )
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Compact working schema. Artist and track names are dictionary codes into shared string
+# tables (categoricals), calendar fields are small ints and minutes are derived from msPlayed
+COMPACT_SCHEMA = {
+    "endTime": None,
+    "artistName": "category",
+    "trackName": "category",
+    "msPlayed": "int32",
+    "year": "int16",
+    "week": "int8",
+    "dow": "int8",
+    "time": "int8",
+    # Why a play started, only in endsong exports
+    "reason_start": "category",
+}
+CATEGORY_COLUMNS = [col for col, dtype in COMPACT_SCHEMA.items() if dtype == "category"]
+
+
+def compact_history(all_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Project an enriched history frame onto the compact schema
+    """
+    columns = [col for col in COMPACT_SCHEMA if col in all_data.columns]
+    dtypes = {col: COMPACT_SCHEMA[col] for col in columns if COMPACT_SCHEMA[col] is not None}
+    return all_data[columns].astype(dtypes)
+
+
+def concat_history(frames: list) -> pd.DataFrame:
+    """
+    Concatenate compact frames, merging their string tables instead of falling back to objects
+    """
+    columns = list(dict.fromkeys(col for f in frames for col in f.columns))
+    categories = [col for col in CATEGORY_COLUMNS if col in columns]
+    # Columns only some exports have (reason_start) are missing values in the others
+    frames = [
+        f.assign(
+            **{
+                col: pd.Categorical.from_codes(np.full(len(f), -1, dtype=np.int8), [])
+                for col in categories
+                if col not in f.columns
+            }
+        )
+        for f in frames
+    ]
+    all_data = pd.concat([f.drop(columns=categories) for f in frames], ignore_index=True)
+    for col in categories:
+        all_data[col] = union_categoricals([f[col] for f in frames], sort_categories=True)
+    return all_data[columns]
+
+
+def map_categories(values: pd.Series, func) -> pd.Series:
+    """
+    Apply a string transform to the string table of a categorical column instead of every row.
+    Categories that collide after the transform are merged
+    """
+    values = values.astype("category")
+    mapped = func(pd.Series(values.cat.categories))
+    codes, uniques = pd.factorize(mapped)
+    old_codes = values.cat.codes.to_numpy()
+    new_codes = np.where(old_codes >= 0, codes[old_codes], -1)
+    return pd.Series(pd.Categorical.from_codes(new_codes, uniques), index=values.index)
+
+
+def bytes_per_row(frame: pd.DataFrame) -> float:
+    return frame.memory_usage(deep=True).sum() / max(len(frame), 1)
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> str:
+    """
+    The bytes per row of a frame before and after compaction, by column, as a table
+    """
+    before_cols = before.memory_usage(deep=True, index=False) / max(len(before), 1)
+    after_cols = after.memory_usage(deep=True, index=False) / max(len(after), 1)
+    lines = [f"{'column':<20} {'before':>10} {'after':>10}"]
+    for col in before_cols.index.union(after_cols.index, sort=False):
+        lines.append(f"{col:<20} {before_cols.get(col, 0):>10.1f} {after_cols.get(col, 0):>10.1f}")
+    lines.append(
+        f"{'bytes per row':<20} {bytes_per_row(before):>10.1f} {bytes_per_row(after):>10.1f}"
+    )
+    return "\n".join(lines)
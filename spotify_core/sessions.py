@@ -0,0 +1,173 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from spotify_core.features import DAYS_OF_WEEK
+from spotify_core.instrument import span
+
+# A pause longer than this between the end of one play and the start of the next ends a session
+SESSION_GAP_MINUTES = 30
+# Plays with these `reason_start` values (endsong exports only) open a session whatever the gap
+SESSION_START_REASONS = ["appload"]
+# Part of the day a session starts in, by hour
+PARTS_OF_DAY = ["Night", "Morning", "Afternoon", "Evening"]
+PART_OF_DAY_HOURS = np.array([0] * 5 + [1] * 7 + [2] * 5 + [3] * 5 + [0] * 2, dtype=np.int8)
+# Drill-down filters over the session table, None keeps every play
+SESSION_FILTERS = {
+    "All sessions": None,
+    "Morning sessions": lambda s: s["part_of_day"] == "Morning",
+    "Afternoon sessions": lambda s: s["part_of_day"] == "Afternoon",
+    "Evening sessions": lambda s: s["part_of_day"] == "Evening",
+    "Night sessions": lambda s: s["part_of_day"] == "Night",
+    "Long sessions (1h+)": lambda s: s["minutes"] >= 60,
+    "Single-artist sessions": lambda s: s["artists"] == 1,
+}
+
+
+def wall_clock(times) -> np.ndarray:
+    """
+    Naive millisecond times on the wall clock of their zone, endsong exports are in UTC
+    """
+    times = pd.DatetimeIndex(times)
+    if times.tz is not None:
+        times = times.tz_localize(None)
+    return times.as_unit("ms").to_numpy()
+
+
+def session_breaks(
+    end_ms: np.ndarray,
+    ms_played: np.ndarray,
+    gap_minutes: float = SESSION_GAP_MINUTES,
+    starts: np.ndarray = None,
+) -> np.ndarray:
+    """
+    Which plays open a session, for plays in time order given as end times and durations in
+    milliseconds. `starts` flags plays that open a session regardless of the gap
+    """
+    # A play opens a session when it starts more than the gap after the previous one ended
+    new = np.empty(len(end_ms), dtype=bool)
+    new[:1] = True
+    np.greater(end_ms[1:] - ms_played[1:] - end_ms[:-1], gap_minutes * 60000, out=new[1:])
+    if starts is not None:
+        new |= starts
+    return new
+
+
+@dataclass
+class Sessions:
+    """
+    Listening sessions of a history: the session of every play, numbered in time order, and
+    one row per session with its start, length in wall time and listening, plays, distinct
+    artists and part of the day
+    """
+
+    ids: np.ndarray
+    table: pd.DataFrame
+
+    @classmethod
+    def build(
+        cls,
+        end_time: np.ndarray,
+        ms_played: np.ndarray,
+        artists: np.ndarray,
+        starts: np.ndarray = None,
+        gap_minutes: float = SESSION_GAP_MINUTES,
+    ) -> "Sessions":
+        """
+        Sessionize plays given as arrays: end times, milliseconds played, integer artist codes,
+        -1 for none, and optionally flags for plays that open a session. One sort, then every
+        aggregate is a reduction over the contiguous plays of each session
+        """
+        with span("sessions", rows=len(end_time)):
+            end_ms = wall_clock(end_time).astype(np.int64)
+            ms_played = np.asarray(ms_played, dtype=np.int64)
+            artists = np.asarray(artists, dtype=np.int64)
+            order = None
+            if len(end_ms) > 1 and (end_ms[1:] < end_ms[:-1]).any():
+                # Exports are a handful of files that are each in time order, which a stable
+                # sort merges as runs instead of sorting from scratch
+                order = np.argsort(end_ms, kind="stable")
+                end_ms, ms_played, artists = end_ms[order], ms_played[order], artists[order]
+                starts = None if starts is None else np.asarray(starts)[order]
+
+            new = session_breaks(end_ms, ms_played, gap_minutes, starts)
+            ids = np.cumsum(new) - 1
+            bounds = np.flatnonzero(new)
+            n = len(bounds)
+            if n:
+                start_ms = np.minimum.reduceat(end_ms - ms_played, bounds)
+                stop_ms = np.maximum.reduceat(end_ms, bounds)
+                ms = np.add.reduceat(ms_played, bounds)
+            else:
+                start_ms = stop_ms = ms = np.zeros(0, dtype=np.int64)
+            plays = np.diff(np.append(bounds, len(ids)))
+
+            # Distinct (session, artist) pairs, counted per session. Sorting the pair keys is
+            # several times faster than hashing them. Plays without an artist (podcast
+            # episodes) have code -1 and are left out
+            width = int(artists.max(initial=0)) + 1
+            known = artists >= 0
+            pairs = np.sort((ids * width + artists)[known])
+            first = np.empty(len(pairs), dtype=bool)
+            first[:1] = True
+            np.not_equal(pairs[1:], pairs[:-1], out=first[1:])
+            distinct = np.bincount(pairs[first] // width, minlength=n)
+
+            hour = (start_ms // 3_600_000) % 24
+            table = pd.DataFrame(
+                {
+                    "start": start_ms.astype("datetime64[ms]"),
+                    "end": stop_ms.astype("datetime64[ms]"),
+                    "length": (stop_ms - start_ms) / 60000,
+                    "minutes": ms / 60000,
+                    "plays": plays,
+                    "artists": distinct,
+                    "diversity": distinct / np.maximum(plays, 1),
+                    "hour": hour.astype(np.int8),
+                    "day_of_week": pd.Categorical.from_codes(
+                        (start_ms // 86_400_000 + 3) % 7, DAYS_OF_WEEK
+                    ),
+                    "part_of_day": pd.Categorical.from_codes(PART_OF_DAY_HOURS[hour], PARTS_OF_DAY),
+                }
+            )
+            if order is not None:
+                ids[order] = ids.copy()
+        return cls(ids, table)
+
+    @classmethod
+    def from_plays(cls, plays: pd.DataFrame, gap_minutes: float = SESSION_GAP_MINUTES):
+        """
+        Sessionize a compact history frame
+        """
+        reasons = plays.get("reason_start")
+        starts = None if reasons is None else reasons.isin(SESSION_START_REASONS).to_numpy()
+        return cls.build(
+            plays["endTime"],
+            plays["msPlayed"].to_numpy(),
+            plays["artistName"].astype("category").cat.codes.to_numpy(),
+            starts,
+            gap_minutes,
+        )
+
+    def mask(self, name: str) -> np.ndarray:
+        """
+        Which plays belong to the sessions of a SESSION_FILTERS entry, None for all of them
+        """
+        keep = SESSION_FILTERS[name]
+        if keep is None:
+            return None
+        return keep(self.table).to_numpy()[self.ids]
+
+    def overview(self, name: str = "All sessions") -> dict:
+        """
+        Session count, median length in minutes and distinct artists per session of a filter
+        """
+        table = self.table
+        if SESSION_FILTERS[name] is not None:
+            table = table[SESSION_FILTERS[name](table).to_numpy()]
+        return {
+            "sessions": len(table),
+            "median_minutes": float(table["length"].median()) if len(table) else 0.0,
+            "artists_per_session": float(table["artists"].mean()) if len(table) else 0.0,
+        }
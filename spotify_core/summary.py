@@ -0,0 +1,148 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from spotify_core.aggregates import TRACK_KEYS, partial_aggregates
+from spotify_core.instrument import span
+
+# Plays shorter than this are skips, artists under the minute floor are noise
+MIN_PLAY_MS = 10000
+MIN_ARTIST_MINUTES = 5
+
+
+@dataclass
+class HistorySummary:
+    """
+    Headline tables of a listening history, as shown at the top of the history app.
+
+    `plays` (unskipped plays of the kept artists) and `full_songs` (every unskipped play) are
+    only set by `summarize_history`. Summaries built from partials by `summarize_tracks`, as
+    the incremental history's are, never hold the plays and leave both None
+    """
+
+    artist_hours: pd.Series
+    top_songs: pd.DataFrame
+    timespan: tuple
+    artists: int
+    tracks: int
+    hours: int
+    plays: Optional[pd.DataFrame] = None
+    full_songs: Optional[pd.DataFrame] = None
+
+    def overview(self) -> dict:
+        """
+        One flat row of headline numbers
+        """
+        return {
+            "first_year": self.timespan[0],
+            "last_year": self.timespan[1],
+            "artists": self.artists,
+            "tracks": self.tracks,
+            "hours": self.hours,
+            "top_artist": self.artist_hours.index[0] if len(self.artist_hours) else None,
+        }
+
+
+def filter_plays(all_data: pd.DataFrame, min_play_ms: int = MIN_PLAY_MS) -> pd.DataFrame:
+    """
+    Drop skipped plays
+    """
+    return all_data[all_data["msPlayed"] > min_play_ms]
+
+
+def filter_min_minutes(all_data: pd.DataFrame, minutes: float) -> pd.DataFrame:
+    """
+    Keep artists with more than `minutes` of listening in total
+    """
+    return all_data.groupby("artistName", observed=True).filter(
+        lambda x: x["msPlayed"].sum() > minutes * 60000
+    )
+
+
+def artist_totals(all_data: pd.DataFrame) -> pd.Series:
+    """
+    Minutes played per artist, largest first
+    """
+    totals = (
+        all_data.groupby(["artistName"], observed=True)["msPlayed"]
+        .sum()
+        .sort_values(ascending=False)
+        / 60000
+    )
+    # Plain string labels so charts do not ship the whole artist dictionary
+    totals.index = totals.index.astype(object)
+    return totals
+
+
+def top_songs(all_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Number of plays per song, most played first
+    """
+    songs = (
+        all_data.groupby(["artistName", "trackName"], observed=True)["msPlayed"]
+        .count()
+        .sort_values(ascending=False)
+    )
+    songs = songs.rename("Listens")
+    songs = songs.reset_index().astype({"artistName": object, "trackName": object})
+    songs["rank"] = songs["Listens"].rank(ascending=False)
+    return songs
+
+
+def summarize_tracks(
+    tracks: pd.DataFrame, min_artist_minutes: float = MIN_ARTIST_MINUTES
+) -> HistorySummary:
+    """
+    Headline tables from artist x year x track partials of unskipped plays. `plays` and
+    `full_songs` are left None, everything else only needs the partials
+    """
+    names = tracks["artistName"].cat.categories
+    codes = tracks["artistName"].cat.codes.to_numpy()
+    with span("artist_filter", rows=len(tracks)):
+        totals = np.bincount(codes, weights=tracks["ms"].to_numpy(), minlength=len(names))
+        observed = np.bincount(codes, minlength=len(names)) > 0
+        keep = observed & (totals > min_artist_minutes * 60000)
+        kept = tracks[keep[codes]]
+    with span("artist_totals", rows=int(keep.sum())):
+        artist_hours = pd.Series(
+            totals[keep] / 60000 / 60, index=names[keep].astype(object), name="Hours"
+        ).sort_values(ascending=False)
+        artist_hours.index.name = "artistName"
+    with span("top_songs", rows=len(tracks)):
+        songs = (
+            tracks.groupby(["artistName", "trackName"], observed=True)["plays"]
+            .sum()
+            .sort_values(ascending=False)
+            .rename("Listens")
+            .reset_index()
+            .astype({"artistName": object, "trackName": object})
+        )
+        songs["rank"] = songs["Listens"].rank(ascending=False)
+    with span("overview", rows=len(kept)):
+        return HistorySummary(
+            artist_hours=artist_hours,
+            top_songs=songs,
+            timespan=(kept["year"].min(), kept["year"].max()),
+            artists=int(keep.sum()),
+            tracks=kept.groupby(["artistName", "trackName"], observed=True).ngroups,
+            hours=int(kept["ms"].sum() / 60000 / 60),
+        )
+
+
+def summarize_history(
+    all_data: pd.DataFrame,
+    min_play_ms: int = MIN_PLAY_MS,
+    min_artist_minutes: float = MIN_ARTIST_MINUTES,
+) -> HistorySummary:
+    """
+    Filter a compact history and compute the headline tables
+    """
+    with span("play_filter", rows=len(all_data)):
+        full_songs = filter_plays(all_data, min_play_ms)
+        tracks = partial_aggregates(full_songs, TRACK_KEYS)
+    summary = summarize_tracks(tracks, min_artist_minutes)
+    summary.full_songs = full_songs
+    summary.plays = full_songs[full_songs["artistName"].isin(summary.artist_hours.index)]
+    return summary
@@ -10,8 +10,21 @@ import calplot as cp
 import calendar
 from streamlit_extras.badges import badge
 
+from spotify_core.charts import chart_frame, chart_spec, present
+from spotify_core.heatmap import BUCKET_LABELS
+from spotify_core.incremental import IncrementalHistory
+from spotify_core.ingest import HistoryFileError, expand_uploads
+from spotify_core.instrument import DEBUG, record_counters, span, start_recording
+from spotify_core.leaderboards import LEADERBOARD_SIZE, LEADERBOARD_WINDOWS
+from spotify_core.prefetch import PREFETCH_ARTISTS, DrillDownCache
+from spotify_core.sessions import SESSION_FILTERS, SESSION_GAP_MINUTES
+
 
 st.set_page_config(layout="wide", page_title="My Spotify History")
+# Stage timings for this run, shown at the bottom with SPOTIFY_DEBUG=1 or ?debug=1
+recorder = None
+if DEBUG or st.query_params.get("debug") == "1":
+    recorder = start_recording("spotify_history")
 pd.set_option("mode.chained_assignment", None)
 corner_radius = 4
 days_of_week = [
@@ -38,11 +51,6 @@ def get_month_weeks(year):
     return month_weeks
 
 
-def build_date_from_pieces(row):
-    dt = datetime.strptime(f"{row['year']}-{row['week']}-{row['day_of_week_str']}", "%Y-%W-%A")
-    return dt.date()
-
-
 # Filter for the minimum minutes played grouped by artist
 st.title("🎁 Spotify History 🎶")
 st.markdown("Deep dive into your all-time listening data.")
@@ -63,39 +71,41 @@ with col2:
         """
     ## How to use
     1. Download your Spotify listening history from [here](https://www.spotify.com/us/account/privacy/). Note that this takes about 5 days for the last year or 30 days for your entire listening history
-    2. Unzip the file and attach all of the files like `StreamingHistory#.json` or `endsong_#.json` into the app
+    2. Attach the `my_spotify_data.zip` you get as it is, or unzip it and attach all of the files like `StreamingHistory#.json` or `endsong_#.json`
     3. Run the app and visualize your music history!
     """
     )
     badge("twitter", "TYLERSlMONS", "https://twitter.com/TYLERSlMONS")
 
-# Change the column names to be more readable
-change_cols = {
-    "master_metadata_track_name": "trackName",
-    "master_metadata_album_artist_name": "artistName",
-    "ts": "endTime",
-    "ms_played": "msPlayed",
-}
-
 history = st.file_uploader(
-    "Upload your Spotify listening history", type="json", accept_multiple_files=True
+    "Upload your Spotify listening history", type=["json", "zip"], accept_multiple_files=True
 )
 
 
-@st.cache_data()
-def get_all_data():
+def get_history():
+    """
+    The session's history, synced with the uploads. Only added files are parsed, through the
+    on-disk cache, and removed files are dropped
+    """
     if history:
-        listening_history = []
-        for i in history:
-            try:
-                listening_history.append(pd.read_json(path_or_buf=i))
-            except:
-                st.error(
-                    f"There was an error reading the file {i.name}. Please remove the file and try again."
-                )
-                st.stop()
-        all_data = pd.concat(listening_history).reset_index()
-        return all_data
+        if "history" not in st.session_state:
+            st.session_state["history"] = IncrementalHistory(hour_offset=16)
+        store = st.session_state["history"]
+        try:
+            # Export zips are read member by member, straight out of the archive
+            files = expand_uploads(history)
+            store.sync(files)
+        except HistoryFileError as e:
+            st.error(
+                f"There was an error reading the file {e.name}. Please remove the file and try again."
+            )
+            st.stop()
+        if not files:
+            st.error(
+                "There are no `StreamingHistory#.json` or `endsong_#.json` files in the upload"
+            )
+            st.stop()
+        return store
     else:
         st.info("Upload your Spotify listening history to see your matches")
         st.stop()
@@ -114,67 +124,31 @@ def get_all_data():
 #         Upload your Spotify listening history to see your matches!** ⚠️"""
 #     )
 # else:
-all_data = get_all_data()
-
-
-all_data = all_data.rename(
-    columns={i: change_cols[i] for i in change_cols if i in all_data.columns}
-)
-
-
-# Add features
-all_data["endTime"] = pd.to_datetime(all_data["endTime"])
-all_data["endTime"] = pd.Series([(i + timedelta(hours=16)) for i in all_data.endTime])
-all_data["date"] = [i.date() for i in all_data["endTime"]]
-all_data["dow"] = [i.weekday() for i in all_data["endTime"]]
-all_data["day_of_week_str"] = all_data["dow"].apply(lambda x: calendar.day_name[x])
-all_data["time"] = [i.hour for i in all_data["endTime"]]
-all_data["week"] = all_data["endTime"].dt.isocalendar().week
-all_data["year"] = all_data["endTime"].dt.isocalendar().year.astype(int)
-all_data["minutesPlayed"] = all_data["msPlayed"] / 60000
-
-all_data = all_data[all_data["msPlayed"] > 10000]
-all_data_full_songs = all_data
-
-full_data_copy = all_data
-
-
-# Filter for the minimum minutes played grouped by artist
-all_data = all_data.groupby("artistName").filter(lambda x: x["minutesPlayed"].sum() > 5)
-
-# Get the top artist
-grouped_artist_total = all_data.groupby(["artistName"])["minutesPlayed"].sum(numeric_only=True)
-top_artist = grouped_artist_total.sort_values(ascending=False).index[0]
-
-# Make a chart of the total minutes played by artist and put it in a streamlit column
-top_artists_total_hours = (
-    all_data.groupby(["artistName"])["minutesPlayed"]
-    .sum(numeric_only=True)
-    .sort_values(ascending=False)
-    / 60
-)
-top_artists_total_hours = top_artists_total_hours.rename("Hours", inplace=True)
+with span("load") as s:
+    store = get_history()
+    s.rows = len(store.fragments)
 
-# Get the order of the artists
-all_data = all_data.merge(top_artists_total_hours.reset_index(), on="artistName", how="left")
-all_data["rank"] = all_data["Hours"].rank(ascending=False)
-top_artists_order = all_data.sort_values("rank")["artistName"].unique().tolist()
-
-# Get the min and max year
-min_year, max_year = all_data["year"].min(), all_data["year"].max()
+with span("summary"):
+    summary = store.summary()
+top_artists_total_hours = summary.artist_hours
+top_artists_order = top_artists_total_hours.index.tolist()
+min_year, max_year = summary.timespan
 
 
 # Make three streamlit columns with st.metric for each of the following
 col1, col2, col3, col4 = st.columns([4, 2, 3, 2])
 col1.metric("Timespan", f"{min_year} - {max_year}")
-col2.metric("Artists", all_data["artistName"].nunique())
-col3.metric("Tracks", all_data.groupby(["artistName", "trackName"]).size().reset_index().shape[0])
-col4.metric("Hours", int(all_data["minutesPlayed"].sum() / 60))
+col2.metric("Artists", summary.artists)
+col3.metric("Tracks", summary.tracks)
+col4.metric("Hours", summary.hours)
 
 
 # Artist top hours chart
+top_artists_data = chart_frame(
+    top_artists_total_hours.reset_index().head(40), ["artistName", "Hours"], "top_artists"
+)
 minutes_played_chart = (
-    alt.Chart(top_artists_total_hours.reset_index().head(40))
+    alt.Chart(top_artists_data)
     .mark_bar(width=40, cornerRadius=corner_radius)
     .encode(
         y=alt.Y(
@@ -211,7 +185,9 @@ minutes_played_chart = minutes_played_chart + minutes_played_chart.mark_text(
 
 st.markdown("---")
 st.subheader("Top Artists")
-st.altair_chart(minutes_played_chart, use_container_width=True)
+with span("chart_top_artists"):
+    top_artists_spec = chart_spec("top_artists", minutes_played_chart)
+    st.vega_lite_chart(spec=top_artists_spec, use_container_width=True)
 with st.expander("Top Artists Raw Data"):
     st.write(top_artists_total_hours)
 
@@ -222,18 +198,14 @@ with st.expander("Top Artists Raw Data"):
 
 TOP_SONG_N = 50
 
-top_songs = (
-    all_data_full_songs.groupby(["artistName", "trackName"])["msPlayed"]
-    .count()
-    .sort_values(ascending=False)
-)
-top_songs = top_songs.rename("Listens")
-top_songs = top_songs.reset_index()
-top_songs["rank"] = top_songs["Listens"].rank(ascending=False)
+top_songs = summary.top_songs
 top_songs_order = top_songs.sort_values("rank")["trackName"].unique().tolist()[0:TOP_SONG_N]
 
+top_songs_data = chart_frame(
+    top_songs.head(TOP_SONG_N), ["Listens", "trackName", "artistName", "rank"], "top_songs"
+)
 day_chart = (
-    alt.Chart(top_songs.head(TOP_SONG_N))
+    alt.Chart(top_songs_data)
     .mark_bar(cornerRadius=corner_radius)
     .encode(
         x=alt.X(
@@ -247,7 +219,7 @@ day_chart = (
             "artistName:N",
             title="Artist",
             scale=alt.Scale(scheme="viridis"),
-            sort=top_artists_order,
+            sort=present(top_artists_order, top_songs_data["artistName"]),
             legend=None,
         ),
         order=alt.Order("rank", sort="ascending"),
@@ -272,7 +244,8 @@ day_chart = day_chart + (
 
 st.markdown("---")
 st.subheader("Top 40 Songs")
-st.altair_chart(day_chart, use_container_width=True)
+with span("chart_top_songs"):
+    st.vega_lite_chart(spec=chart_spec("top_songs", day_chart), use_container_width=True)
 with st.expander("Top Song Raw Data"):
     st.write(top_songs)
 
@@ -283,59 +256,108 @@ st.markdown("---")
 # Artist heatmap
 col2, col3 = st.columns(2)
 
-top_artist_order = (
-    all_data.groupby("artistName")["minutesPlayed"]
-    .sum(numeric_only=True)
-    .sort_values(ascending=False)
-    .index.to_list()
+
+# Listening sessions: plays separated by less than SESSION_GAP_MINUTES of silence
+session_filter = st.selectbox("Listening Sessions", list(SESSION_FILTERS))
+session_overview = store.sessions().overview(session_filter)
+col1, col2, col3 = st.columns(3)
+col1.metric("Sessions", f"{session_overview['sessions']:,}")
+col2.metric("Median Session Length", f"{session_overview['median_minutes']:.0f} min")
+col3.metric("Artists per Session", f"{session_overview['artists_per_session']:.1f}")
+st.caption(f"A session ends after {SESSION_GAP_MINUTES} minutes without a play")
+
+# Rebuilt only when the upload or session filter changes so the drill-down below only reads
+# slices of the cube, or queries it with the engine set by SPOTIFY_QUERY_ENGINE
+with span("build_cube"):
+    artist_cube = store.queries(session_filter)
+if len(artist_cube.artists) == 0:
+    st.info(f"No artists with enough listening in {session_filter.lower()}")
+    st.stop()
+
+# Drill-down views of all artists and the top artists, each in their most listened year, are
+# computed in the background while the charts above render
+if "drilldown" not in st.session_state:
+    st.session_state["drilldown"] = DrillDownCache()
+drilldown = st.session_state["drilldown"]
+drilldown.bind(artist_cube)
+drilldown.prefetch([None] + list(range(min(PREFETCH_ARTISTS, len(artist_cube.artists)))))
+
+# How the top 10 changed month by month, one line per artist or track
+st.subheader(f"How Your Top {LEADERBOARD_SIZE} Evolved")
+col1, col2 = st.columns(2)
+leaderboard_kind = col1.radio("Leaderboard", ["Artists", "Tracks"], horizontal=True)
+leaderboard_window = col2.radio("Window", list(LEADERBOARD_WINDOWS), horizontal=True)
+window_months = LEADERBOARD_WINDOWS[leaderboard_window]
+with span("leaderboard"):
+    leaderboard = store.leaderboard(leaderboard_kind.lower(), window_months, session_filter)
+leaderboard_label, leaderboard_title = "artistName", "Artist"
+if leaderboard_kind == "Tracks":
+    leaderboard_label, leaderboard_title = "trackName", "Track"
+leaderboard_data = chart_frame(
+    leaderboard, ["month", "rank", leaderboard_label, "artistName", "minutes"], "leaderboard"
 )
+leaderboard_base = alt.Chart(leaderboard_data).encode(
+    x=alt.X("month:T", title="Month"),
+    y=alt.Y(
+        "rank:O",
+        title="Rank",
+        scale=alt.Scale(domain=list(range(1, LEADERBOARD_SIZE + 1))),
+    ),
+    color=alt.Color(f"{leaderboard_label}:N", scale=alt.Scale(scheme="viridis"), legend=None),
+    tooltip=[
+        alt.Tooltip("month:T", title="Month", format="%B %Y"),
+        alt.Tooltip("rank:O", title="Rank"),
+        alt.Tooltip(f"{leaderboard_label}:N", title=leaderboard_title),
+        alt.Tooltip("minutes:Q", title="Minutes", format=".0f"),
+    ],
+)
+leaderboard_chart = leaderboard_base.mark_line(strokeWidth=2) + leaderboard_base.mark_circle(
+    size=80, opacity=1
+)
+with span("chart_leaderboard"):
+    st.vega_lite_chart(
+        spec=chart_spec("leaderboard", leaderboard_chart.properties(height=400)),
+        use_container_width=True,
+    )
+with st.expander("Leaderboard Raw Data"):
+    st.write(leaderboard)
+top_artist_order = artist_cube.artists.to_list()
 
 # Select artist
 heatmap_artist = st.selectbox("Select Artist", ["All Artists"] + top_artist_order)
 st.title(f"Analysis for {heatmap_artist}")
 st.write("Dig a bit deeper into your favorite artists")
 
-
-if heatmap_artist == "All Artists":
-    heatmap_data = all_data
-else:
-    heatmap_data = all_data[all_data["artistName"] == heatmap_artist]
+artist_code = None if heatmap_artist == "All Artists" else artist_cube.code(heatmap_artist)
+with span("drilldown_artist"):
+    artist_view = drilldown.artist(artist_code)
+artist_songs = artist_view.songs
 
 # Give the main stats for the artist
 # Total lifetime minutes, total unique tracks, top year for artist
 
 # Total lifetime minutes for the artist
-total_lifetime_hours = heatmap_data["minutesPlayed"].sum() / 60
+total_lifetime_hours = artist_songs["minutes"].sum() / 60
 
 # Total unique tracks for the artist
-total_unique_tracks = heatmap_data["trackName"].nunique()
+total_unique_tracks = artist_songs["trackName"].nunique()
 
 # Top song all time for the aritst
 top_song = (
-    heatmap_data.groupby("trackName")["minutesPlayed"]
-    .sum(numeric_only=True)
+    artist_songs.groupby("trackName", observed=True)["minutes"]
+    .sum()
     .sort_values(ascending=False)
     .index[0]
 )
 
-most_listened_year = (
-    heatmap_data.groupby("year")["minutesPlayed"]
-    .sum(numeric_only=True)
-    .sort_values(ascending=False)
-    .index[0]
-)
+artist_years = artist_view.years
+most_listened_year = artist_view.top_year
 
 # Artist bar chart over time
-if heatmap_artist == "All Artists":
-    all_artist_raw = all_data
-else:
-    all_artist_raw = all_data.query(f"artistName == '{heatmap_artist}'")
-all_artist = all_artist_raw.copy()
-all_artist["year_month"] = pd.to_datetime(all_artist["date"]).dt.strftime("%Y-%m")
-all_artist = all_artist.groupby(["year_month"], as_index=False).sum(numeric_only=True)
+all_artist = artist_view.monthly
 
 bar_chart = (
-    alt.Chart(all_artist)
+    alt.Chart(chart_frame(all_artist, ["year_month", "minutesPlayed"], "monthly"))
     .mark_bar()
     .encode(
         x=alt.X("year_month:T", title="Date", axis=alt.Axis(labelAngle=0), timeUnit="yearmonth"),
@@ -359,24 +381,57 @@ col0, col1, col2, col3 = st.columns(4)
 if heatmap_artist == "All Artists":
     col0.metric(f"Rank", "-")
 else:
-    col0.metric(f"Rank", f"{top_artist_order.index(heatmap_artist) + 1}")
+    # Artists in the cube are ordered by lifetime minutes so the code is the rank
+    col0.metric(f"Rank", f"{artist_code + 1}")
 
 col1.metric("Total Hours", f"{total_lifetime_hours:.2f}")
 col2.metric("Total Unique Tracks", total_unique_tracks)
 col3.metric("Most Listened Year", most_listened_year)
 
-st.altair_chart(bar_chart, use_container_width=True)
+with span("chart_monthly"):
+    st.vega_lite_chart(spec=chart_spec("monthly", bar_chart), use_container_width=True)
+
+# Rank among the artists played in each year, read from the rank table built with the cube.
+# All Artists compares the trajectories of the top artists
+if heatmap_artist == "All Artists":
+    trajectory_codes = range(min(LEADERBOARD_SIZE, len(artist_cube.artists)))
+else:
+    trajectory_codes = [artist_code]
+trajectories = artist_cube.ranks.trajectories(trajectory_codes)
+trajectories.insert(0, "artistName", artist_cube.artists[trajectories.pop("artist")].astype(object))
+rank_chart = (
+    alt.Chart(chart_frame(trajectories, ["year", "rank", "artistName", "minutes"], "ranks"))
+    .mark_line(point=True, strokeWidth=2)
+    .encode(
+        x=alt.X("year:O", title="Year", axis=alt.Axis(labelAngle=0)),
+        y=alt.Y("rank:Q", title="Rank", scale=alt.Scale(reverse=True, zero=False)),
+        color=alt.Color(
+            "artistName:N",
+            title="Artist",
+            sort=top_artist_order[:LEADERBOARD_SIZE],
+            scale=alt.Scale(scheme="viridis"),
+            legend=alt.Legend(orient="bottom"),
+        ),
+        tooltip=[
+            alt.Tooltip("year:O", title="Year"),
+            alt.Tooltip("artistName:N", title="Artist"),
+            alt.Tooltip("rank:Q", title="Rank", format=".0f"),
+            alt.Tooltip("minutes:Q", title="Minutes", format=".0f"),
+        ],
+    )
+    .properties(height=300, title=f"Rank by Year for {heatmap_artist}")
+)
+with span("chart_ranks"):
+    st.vega_lite_chart(spec=chart_spec("ranks", rank_chart), use_container_width=True)
 
 # Get the dataframe for the top songs which contains
 # how many minutes were played for each song and the play count for each song
 top_songs = (
-    all_artist_raw.groupby(["trackName", "artistName"], as_index=False)
-    .agg({"minutesPlayed": "sum", "date": "count"})
-    .rename(
+    artist_songs.rename(
         columns={
-            "date": "Listens",
-            "minutesPlayed": "Total Minutes",
-            "artistName": "Artist",
+            "plays": "Listens",
+            "minutes": "Total Minutes",
+            "artist": "Artist",
             "trackName": "Track",
         }
     )
@@ -393,7 +448,7 @@ st.dataframe(top_songs, use_container_width=True)
 
 # Dataframe of top tracks
 st.markdown("---")
-sorted_years_reversed = sorted(all_artist_raw["year"].unique(), reverse=True)
+sorted_years_reversed = sorted(artist_years.index, reverse=True)
 # Get the index of the top year
 top_year_index = sorted_years_reversed.index(most_listened_year)
 
@@ -401,7 +456,10 @@ top_year_index = sorted_years_reversed.index(most_listened_year)
 year_select = st.selectbox(
     f"Select year for deeper analysis", sorted_years_reversed, top_year_index
 )
-heatmap_data = all_artist_raw[all_artist_raw["year"] == year_select]
+with span("drilldown_year"):
+    year_view = drilldown.year(artist_code, year_select)
+heatmap_data = year_view.days
+year_tracks = year_view.tracks
 
 st.title(f"{heatmap_artist} in {year_select}")
 
@@ -413,45 +471,12 @@ st.title(f"{heatmap_artist} in {year_select}")
 
 
 # Get number of listened hours in the selected year
-total_listened_hours = heatmap_data["minutesPlayed"].sum() / 60
+total_listened_hours = heatmap_data["minutes"].sum() / 60
 
 
-def build_heatmap(heatmap_data):
-    # set the heatmap data as categorical variables so we can fill in 0s for the missing dates
-    simple_heatmap_data = heatmap_data[
-        [
-            "artistName",
-            "trackName",
-            "endTime",
-            "minutesPlayed",
-            "date",
-            "year",
-            "week",
-            "dow",
-            "day_of_week_str",
-        ]
-    ]
-    simple_heatmap_data["week"] = pd.Categorical(
-        values=pd.to_datetime(simple_heatmap_data["endTime"]).dt.isocalendar().week,
-        categories=list(range(0, 53)),
-    )
-    simple_heatmap_data["day_of_week_str"] = pd.Categorical(
-        values=simple_heatmap_data["day_of_week_str"],
-        categories=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"],
-        ordered=True,
-    )
-    heatmap_agg = (
-        simple_heatmap_data.groupby(["week", "day_of_week_str", "year"])
-        .sum(numeric_only=True)["minutesPlayed"]
-        .reset_index()
-    )
-
-    # Pandas cut at 0, between 0 and 1, and greater than 1
-    bucket_labels = ["0 min", "1-5 min", "5-15 min", "15-60 min", "60+ min"]
-    heatmap_agg["min_bucket"] = pd.cut(
-        heatmap_agg["minutesPlayed"], bins=[-1, 1, 5, 15, 60, 60 * 60 * 24], labels=bucket_labels
-    )
-
+def build_heatmap(heatmap_agg):
+    # heatmap_agg is the dense week x weekday grid for the year with 0s for the days without
+    # listens
     month_weeks = get_month_weeks(2022)
 
     # reformat the above to be used in the altair transform_calculate
@@ -462,31 +487,15 @@ def build_heatmap(heatmap_data):
         ]
     )
 
-    # Extract the date, year, day_of_week from simple_heatmap_data and left join to the heatmap_agg
-    heatmap_agg = (
-        heatmap_agg.merge(
-            simple_heatmap_data[["date", "week", "year", "day_of_week_str"]].drop_duplicates(),
-            left_on=["week", "day_of_week_str", "year"],
-            right_on=["week", "day_of_week_str", "year"],
-            how="left",
-        )
-        .drop_duplicates()
-        .sort_values(["date", "day_of_week_str"])
-    )
-
-    # Split the dataframe based on if the date is None
-    missing_dates = heatmap_agg[heatmap_agg["date"].isnull()]
-    not_missing_dates = heatmap_agg[heatmap_agg["date"].notnull()]
-
-    # Replace the missing dates
-    missing_dates["date"] = missing_dates.apply(build_date_from_pieces, axis=1)
-
-    # Concat the two dataframes back together
-    heatmap_agg = pd.concat([missing_dates, not_missing_dates])
-
     # Add the month to heatmap data
     artist_heat = (
-        alt.Chart(heatmap_agg)
+        alt.Chart(
+            chart_frame(
+                heatmap_agg,
+                ["week", "day_of_week_str", "min_bucket", "date", "minutesPlayed"],
+                "heatmap",
+            )
+        )
         .mark_rect(cornerRadius=2)
         .encode(
             # Set ticks at 0-52 and the labels as the months
@@ -514,7 +523,7 @@ def build_heatmap(heatmap_data):
                 scale=alt.Scale(
                     # Use grey, light blue, medium blue, medium dark blue, dark blue for the colors
                     range=["#e0e0e0", "#90caf9", "#64b5f6", "#42a5f5", "#1e88e5"],
-                    domain=bucket_labels,
+                    domain=BUCKET_LABELS,
                 ),
                 legend=alt.Legend(
                     # Set the legend to be on the top
@@ -540,42 +549,33 @@ st.subheader("Stats")
 col1, col2, col3 = st.columns(3)
 
 # Rank for the year
-yearly_rank = (
-    all_data[all_data["year"] == year_select]
-    .groupby(["artistName"])
-    .sum(numeric_only=True)
-    .sort_values("minutesPlayed", ascending=False)
-    .reset_index()
-)
-yearly_rank["rank"] = yearly_rank["minutesPlayed"].rank(ascending=False)
-
-yearly_rank = yearly_rank[yearly_rank["artistName"] == heatmap_artist]
-
 if heatmap_artist == "All Artists":
     col1.metric(f"Artist Rank in {year_select}", "-")
 else:
-    col1.metric(f"Artist Rank in {year_select}", f"{yearly_rank['rank'].values[0]:.0f}")
+    yearly_rank = year_view.rank
+    col1.metric(f"Artist Rank in {year_select}", f"{yearly_rank:.0f}")
 
 # Total hours played for the year
 col2.metric(f"Hours Played in {year_select}", f"{total_listened_hours:.0f}")
 
 # Total unique tracks
 col3.metric(
-    f"Unique Tracks Played in {year_select}", f"{len(heatmap_data['trackName'].unique()):.0f}"
+    f"Unique Tracks Played in {year_select}", f"{len(year_tracks):.0f}"
 )
 
 # Create a second chart of just the months on the x axis to be added to the first chart
-artist_heat = build_heatmap(heatmap_data)
-st.altair_chart(artist_heat, use_container_width=True)
+with span("build_heatmap", rows=len(heatmap_data)):
+    artist_heat = build_heatmap(year_view.grid)
+with span("chart_heatmap"):
+    st.vega_lite_chart(spec=chart_spec("heatmap", artist_heat), use_container_width=True)
 
 st.subheader(f"Track Leaderboard for {year_select}")
 
 # Dataframe with tracknames, total minutes, and total plays
 track_leaderboard = (
-    heatmap_data.groupby(["trackName"])
-    .agg({"minutesPlayed": "sum", "endTime": "count"})
-    .reset_index()
-    .rename(columns={"endTime": "Listens", "minutesPlayed": "Total Minutes", "trackName": "Track"})
+    year_tracks.rename(
+        columns={"plays": "Listens", "minutes": "Total Minutes", "trackName": "Track"}
+    )
     .sort_values("Total Minutes", ascending=False)
     .set_index("Track")
     .sort_values("Listens", ascending=False)
@@ -583,3 +583,25 @@ track_leaderboard = (
     .style.format({"Total Minutes": "{:.1f}"})
 )
 st.dataframe(track_leaderboard, use_container_width=True)
+
+# Raw plays for the artist and year are a contiguous slice of the artist-sorted history
+if heatmap_artist != "All Artists":
+    with st.expander(f"{heatmap_artist} Plays in {year_select}"):
+        st.write(
+            artist_cube.artist_plays(artist_code, year_select)
+            .assign(Minutes=lambda plays: plays["msPlayed"] / 60000)[
+                ["endTime", "trackName", "Minutes"]
+            ]
+            .rename(columns={"endTime": "Time", "trackName": "Track"})
+        )
+
+if recorder is not None:
+    record_counters("drilldown", drilldown.stats())
+    with st.expander("Debug: stage timings"):
+        st.dataframe(pd.DataFrame(recorder.records()), use_container_width=True)
+        st.dataframe(pd.DataFrame(recorder.payloads), use_container_width=True)
+        st.dataframe(pd.DataFrame(recorder.counters).T, use_container_width=True)
+        st.download_button(
+            "Download timings as JSON", recorder.to_json(), "timings.json", "application/json"
+        )
+    recorder.log()